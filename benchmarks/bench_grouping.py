@@ -0,0 +1,134 @@
+"""
+Benchmarks the duplicate grouping query with and without the tuned SQLite
+profile (connection pragmas plus the MIGRATIONS indexes).
+
+Usage: python benchmarks/bench_grouping.py [--rows 1000000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import database
+from strategies import find_duplicates_strategy
+
+# The size + MD5 key query driven from the covering index, and the join order
+# find_duplicates_strategy.run used before the index existed.
+GROUPING_QUERY = """
+    SELECT GROUP_CONCAT(f.id)
+    FROM file_metadata fm
+    CROSS JOIN files f ON f.id = fm.file_id
+    WHERE fm.size IS NOT NULL AND fm.md5 IS NOT NULL AND f.folder_index IN (1, 2)
+    GROUP BY fm.size, fm.md5
+    HAVING COUNT(f.id) > 1
+"""
+LEGACY_GROUPING_QUERY = GROUPING_QUERY.replace(
+    "FROM file_metadata fm\n    CROSS JOIN files f ON f.id = fm.file_id",
+    "FROM files f\n    JOIN file_metadata fm ON f.id = fm.file_id"
+)
+STALE_QUERY = "SELECT COUNT(*) FROM files WHERE folder_index = 1 AND (last_seen < ? OR last_seen IS NULL)"
+EXT_QUERY = "SELECT COUNT(*) FROM files WHERE folder_index = 2 AND ext IN ('.jpg', '.png')"
+
+EXTENSIONS = ['.jpg', '.png', '.txt', '.pdf', '.mp4', '.docx', '.zip', '.mp3']
+
+
+def populate(path, rows):
+    rng = random.Random(42)
+    conn = sqlite3.connect(path)
+    database.create_tables(conn)
+    # Start from a pre-migration file: drop the indexes the migrations create
+    for statements in database.MIGRATIONS:
+        for statement in statements:
+            if statement.startswith("CREATE INDEX IF NOT EXISTS "):
+                conn.execute(f"DROP INDEX IF EXISTS {statement.split()[5]}")
+    conn.execute("PRAGMA user_version = 0")
+
+    def files():
+        for i in range(1, rows + 1):
+            yield (i, 1 + i % 2, f"dir{i % 1000}", f"file{i}{EXTENSIONS[i % len(EXTENSIONS)]}",
+                   EXTENSIONS[i % len(EXTENSIONS)], 1000.0 + (i % 3))
+
+    def metadata():
+        for i in range(1, rows + 1):
+            # Roughly a fifth of the files share their size and content with another one
+            group = rng.randrange(rows // 10) if i % 5 == 0 else rows + i
+            yield (i, group * 7, 1.0, f"{group:032x}")
+
+    with conn:
+        conn.executemany("INSERT INTO files (id, folder_index, path, name, ext, last_seen) VALUES (?, ?, ?, ?, ?, ?)", files())
+        conn.executemany("INSERT INTO file_metadata (file_id, size, modified_date, md5) VALUES (?, ?, ?, ?)", metadata())
+    conn.close()
+
+
+def timed(conn, query, params=(), repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = conn.execute(query, params).fetchall()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(result)
+
+
+def timed_groups(conn):
+    """Times materializing every size + MD5 group the way find_duplicates_strategy.run does."""
+    parts = ['fm.size', 'fm.md5']
+    where = [f"{part} IS NOT NULL" for part in parts] + ["f.folder_index IN (?, ?)"]
+    start = time.perf_counter()
+    groups = sum(1 for _ in find_duplicates_strategy._query_groups(conn, parts, where, [1, 2]))
+    return time.perf_counter() - start, groups
+
+
+def timed_legacy_groups(conn):
+    """Times the former GROUP_CONCAT query followed by one get_files_by_ids call per group."""
+    start = time.perf_counter()
+    id_groups = [row[0].split(',') for row in conn.execute(LEGACY_GROUPING_QUERY)]
+    for id_group in id_groups:
+        database.get_files_by_ids(conn, id_group)
+    return time.perf_counter() - start, len(id_groups)
+
+
+def report(label, conn):
+    print(f"\n== {label}")
+    for name, func in [("legacy groups", timed_legacy_groups), ("streamed groups", timed_groups)]:
+        elapsed, count = func(conn)
+        print(f"{name:>16}: {elapsed * 1000:9.1f} ms  ({count} groups materialized)")
+    for name, query, params in [("legacy grouping", LEGACY_GROUPING_QUERY, ()),
+                                ("grouping", GROUPING_QUERY, ()),
+                                ("stale cleanup", STALE_QUERY, (1001.5,)),
+                                ("extension filter", EXT_QUERY, ())]:
+        plan = "; ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params))
+        elapsed, count = timed(conn, query, params)
+        print(f"{name:>16}: {elapsed * 1000:9.1f} ms  ({count} rows)  plan: {plan}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "bench.cfp-db")
+        start = time.perf_counter()
+        populate(path, args.rows)
+        print(f"Populated {args.rows} files in {time.perf_counter() - start:.1f} s")
+
+        conn = sqlite3.connect(path)
+        report("default connection, no indexes", conn)
+        conn.close()
+
+        conn = database.get_db_connection(path)
+        start = time.perf_counter()
+        with conn:
+            database.apply_migrations(conn)
+        print(f"\nApplied migrations in {time.perf_counter() - start:.1f} s")
+        report("tuned connection, migrated indexes", conn)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmarks content hashing throughput (MB/s) for each reading mode of
+hashing.reader and several block sizes.
+
+The file is written fresh, so the runs measure hashing from the page cache
+unless --drop-caches is given (Linux, needs root), which drops the cache
+before every run to measure cold reads from the device.
+
+Usage: python benchmarks/bench_hashing.py [--size-mib 1024] [--algorithm md5] [--dir /path/on/disk]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from hashing import algorithms, reader
+
+BLOCK_KIB = (64, 256, 1024, 4096)
+
+
+def write_file(path, size_mib):
+    block = os.urandom(1024 * 1024)
+    with open(path, 'wb') as f:
+        for _ in range(size_mib):
+            f.write(block)
+
+
+def drop_caches():
+    subprocess.run(["sync"], check=True)
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+
+
+def run(path, algorithm, mode, block_kib, cold):
+    if cold:
+        drop_caches()
+    hasher = algorithms.new(algorithm)
+    start = time.perf_counter()
+    total = reader.update_from_file(hasher, path, block_size=block_kib * 1024, mode=mode)
+    elapsed = time.perf_counter() - start
+    return total / (1024 * 1024) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mib", type=int, default=1024)
+    parser.add_argument("--algorithm", default="md5", choices=algorithms.available())
+    parser.add_argument("--dir", default=None, help="Directory for the test file (default: system temp dir)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--drop-caches", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmpdir:
+        path = os.path.join(tmpdir, "bench.bin")
+        write_file(path, args.size_mib)
+        print(f"{args.size_mib} MiB, {args.algorithm}, {'cold' if args.drop_caches else 'warm'} cache, best of {args.repeat}")
+        print(f"{'mode':<10}{'block':>10}{'MB/s':>10}")
+        for mode in reader.MODES:
+            for block_kib in BLOCK_KIB:
+                best = max(run(path, args.algorithm, mode, block_kib, args.drop_caches) for _ in range(args.repeat))
+                print(f"{mode:<10}{block_kib:>8}KiB{best:>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
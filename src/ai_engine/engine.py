@@ -55,14 +55,27 @@ class LlavaEmbeddingEngine:
         """
         Generates a semantically rich embedding for a single image.
         """
-        self.llm.reset()
         try:
             with open(image_path, "rb") as f:
                 image_bytes = f.read()
         except Exception as e:
             print(f"Error reading image {image_path}: {e}")
             return None
+        return self.get_image_embedding_from_bytes(image_bytes, image_path)
+
+    def get_image_embeddings(self, images):
+        """
+        Generates embeddings for a batch of already-read images (bytes). The
+        model and CLIP context stay loaded across the batch, so callers can read
+        the next batch from disk while this one is evaluated.
+        """
+        return [self.get_image_embedding_from_bytes(image_bytes) for image_bytes in images]
 
+    def get_image_embedding_from_bytes(self, image_bytes: bytes, label: str = "<bytes>") -> np.ndarray:
+        """
+        Generates an embedding for an image given as encoded file bytes.
+        """
+        self.llm.reset()
         data_array = array.array("B", image_bytes)
         c_ubyte_ptr = (ctypes.c_ubyte * len(data_array)).from_buffer(data_array)
 
@@ -74,7 +87,7 @@ class LlavaEmbeddingEngine:
         )
 
         if not embed_ptr:
-            print(f"Warning: Could not process image {image_path}. Unsupported format.")
+            print(f"Warning: Could not process image {label}. Unsupported format.")
             return None
         
         try:
@@ -0,0 +1,226 @@
+"""
+Command-line interface for batch duplicate scans, e.g. from cron on a
+server without a display.
+
+    python src/cli.py photos.cfp-db --source /srv/photos --strategy size --strategy md5
+
+The project file is created if it does not exist, and `--source` folders are
+added to it. The scan, metadata and duplicate pipeline then runs over all of
+the project's sources, as in the app. Duplicate groups are streamed to
+stdout (or `--output`) as JSON Lines, one group per line, or as CSV, one
+file per row. By default they are also stored as the project's results, so
+the app shows them when the project is opened.
+
+Only the modules the chosen strategies need are imported: tkinter never,
+OpenCV only for histograms and llama_cpp only for LLM comparison. Ctrl-C
+stops the run cooperatively; finished work is kept, and the next run
+resumes from it.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import signal
+import sys
+
+import database
+import jobs
+import pipeline
+import progress
+from config import config
+from domain.comparison_options import ComparisonOptions
+from hashing import algorithms
+from strategies.histogram import engine as histogram_engine
+from strategies.strategy_registry import get_all_strategies
+
+logger = logging.getLogger(__name__)
+
+EXIT_CANCELLED = 130
+
+
+def strategy_names():
+    """Maps the names accepted by --strategy (option key without 'compare_', or db_key) to option keys."""
+    names = {}
+    for strategy in get_all_strategies():
+        option_key = strategy.metadata.option_key
+        names[option_key[len('compare_'):]] = option_key
+        names.setdefault(strategy.db_key, option_key)
+    return names
+
+
+def build_options(args):
+    """Turns the parsed arguments into ComparisonOptions."""
+    names = strategy_names()
+    selected = {key: False for key in ComparisonOptions.DEFAULT_OPTIONS if key.startswith('compare_') and not key.endswith('_threshold')}
+    for name in args.strategy:
+        selected[names[name]] = True
+
+    options = dict(selected)
+    for item in args.threshold:
+        name, _, value = item.partition('=')
+        if name not in names or not value:
+            raise ValueError(f"Invalid threshold '{item}'; expected STRATEGY=VALUE.")
+        options[ComparisonOptions.threshold_key(names[name])] = float(value)
+    options['histogram_method'] = args.histogram_method
+    options['hash_algorithm'] = args.hash_algorithm
+    options['verify_content'] = args.verify
+    return ComparisonOptions(file_type_filter=args.file_type, include_subfolders=not args.no_subfolders, options=options)
+
+
+class GroupWriter:
+    """Writes duplicate groups to a stream as JSON Lines or CSV."""
+
+    CSV_COLUMNS = ['group', 'folder_index', 'full_path', 'name', 'size', 'modified_date', 'md5']
+
+    def __init__(self, stream, output_format, folders):
+        self.stream = stream
+        self.format = output_format
+        self.folders = folders
+        self.csv = None
+        if output_format == 'csv':
+            self.csv = csv.writer(stream)
+            self.csv.writerow(self.CSV_COLUMNS)
+
+    def _file(self, info):
+        return {
+            'id': info['id'],
+            'folder_index': info['folder_index'],
+            'full_path': os.path.normpath(os.path.join(self.folders[info['folder_index']], str(info.get('path') or ''), info['name'])),
+            'name': info['name'],
+            'size': info.get('size'),
+            'modified_date': info.get('modified_date'),
+            'md5': info.get('md5'),
+        }
+
+    def write(self, group_id, group):
+        files = [self._file(info) for info in group]
+        if self.csv is not None:
+            for file in files:
+                self.csv.writerow([group_id] + [file[column] for column in self.CSV_COLUMNS[1:]])
+        else:
+            self.stream.write(json.dumps({'group': group_id, 'files': files}) + "\n")
+        self.stream.flush()
+
+
+def open_project(path, sources):
+    """Opens or creates the project at `path`, adds new `sources`, and returns (conn, folders)."""
+    conn = database.get_db_connection(path)
+    database.create_tables(conn)
+    known = {folder for _, folder in database.get_sources(conn)}
+    for source in sources:
+        source = os.path.abspath(source)
+        if not os.path.isdir(source):
+            conn.close()
+            raise ValueError(f"Not a directory: {source}")
+        if source not in known:
+            database.add_source(conn, source)
+            known.add(source)
+    # The app numbers folders by their position in the project's source list
+    folders = dict(enumerate((folder for _, folder in database.get_sources(conn)), 1))
+    return conn, folders
+
+
+def load_llm_engine(options):
+    """Loads the LLM engine if LLM comparison is selected; llama_cpp is not imported otherwise."""
+    if not options.compare_llm:
+        return None
+    from ai_engine.engine import LlavaEmbeddingEngine
+    return LlavaEmbeddingEngine()
+
+
+def run(args, stdout=None):
+    """Runs a scan as described by the parsed arguments. Returns the exit code."""
+    stdout = stdout or sys.stdout
+    options = build_options(args)
+    project_path = os.path.abspath(args.project)
+    conn, folders = open_project(project_path, args.source)
+    output = open(args.output, 'w', newline='') if args.output else stdout
+    progress_stream = None
+    try:
+        if not folders:
+            logger.error("The project has no source folders; add one with --source.")
+            return 2
+        if args.progress:
+            progress_stream = sys.stderr if args.progress == '-' else open(args.progress, 'a')
+        job = jobs.Job('compare', {'folders': list(folders.values()), 'options': options.to_save_dict()}, project_path,
+                       on_progress=progress.jsonl_listener(progress_stream) if progress_stream else None)
+
+        def stop(signum, frame):
+            logger.warning("Stopping after the current batch...")
+            # A second Ctrl-C interrupts immediately
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            job.cancel()
+        previous_handler = signal.signal(signal.SIGINT, stop)
+
+        writer = GroupWriter(output, args.format, folders)
+        try:
+            with jobs.running(job):
+                groups = pipeline.iter_duplicate_groups(conn, folders, options, llm_engine=load_llm_engine(options),
+                                                        on_stage=jobs.set_stage)
+
+                def emit(groups):
+                    for group_id, group in enumerate(groups, 1):
+                        writer.write(group_id, group)
+                        yield group
+
+                stream = emit(groups)
+                if not args.no_store:
+                    stream = database.store_result_groups(conn, stream, folders)
+                for _ in stream:
+                    pass
+        except jobs.JobCancelled:
+            logger.warning("Scan stopped; finished work was saved and will be reused by the next run.")
+            return EXIT_CANCELLED
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
+        return 0
+    finally:
+        if output is not stdout:
+            output.close()
+        if progress_stream is not None and progress_stream is not sys.stderr:
+            progress_stream.close()
+        conn.close()
+
+
+def parse_args(argv=None):
+    names = sorted(strategy_names())
+    parser = argparse.ArgumentParser(description="Find duplicate files without the graphical interface.")
+    parser.add_argument('project', help="Project file (.cfp-db); created if it does not exist.")
+    parser.add_argument('--source', action='append', default=[], metavar='DIR',
+                        help="Add a source folder to the project (repeatable).")
+    parser.add_argument('--strategy', action='append', choices=names, metavar='NAME',
+                        help=f"Strategy to group by (repeatable; default: size). One of: {', '.join(names)}.")
+    parser.add_argument('--threshold', action='append', default=[], metavar='STRATEGY=VALUE',
+                        help="Threshold of a similarity strategy, e.g. histogram=0.85 or phash=6.")
+    parser.add_argument('--histogram-method', default=ComparisonOptions.DEFAULT_OPTIONS['histogram_method'],
+                        choices=histogram_engine.METHODS)
+    parser.add_argument('--hash-algorithm', default=ComparisonOptions.DEFAULT_OPTIONS['hash_algorithm'],
+                        choices=algorithms.available())
+    parser.add_argument('--verify', action='store_true', help="Verify content duplicates byte for byte.")
+    parser.add_argument('--file-type', default='all', choices=['all', *config.get("file_extensions", {})])
+    parser.add_argument('--no-subfolders', action='store_true', help="Only scan the top level of each source.")
+    parser.add_argument('--format', default='jsonl', choices=['jsonl', 'csv'])
+    parser.add_argument('--output', metavar='FILE', help="Write groups to FILE instead of stdout.")
+    parser.add_argument('--no-store', action='store_true', help="Do not replace the project's stored results.")
+    parser.add_argument('--progress', metavar='FILE',
+                        help="Write progress events as JSON Lines to FILE ('-' for stderr).")
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args(argv)
+    args.strategy = args.strategy or ['size']
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING), stream=sys.stderr,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        return run(args)
+    except ValueError as e:
+        logger.error(str(e))
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,8 +8,9 @@ from project_manager import ProjectManager
 from config import config
 import logic
 import database
-from strategies import utils, find_duplicates_strategy
+import pipeline
 from threading_utils import TaskRunner
+import jobs
 import threading
 from interfaces.view_interface import IView
 from domain.comparison_options import ComparisonOptions
@@ -42,15 +43,12 @@ class AppController:
             
             # Threshold variable if needed
             if meta.has_threshold:
-                threshold_key = f"{meta.option_key}_threshold"
-                if meta.option_key == 'compare_histogram':
-                    threshold_key = 'histogram_threshold'
-                elif meta.option_key == 'compare_llm':
-                    threshold_key = 'llm_similarity_threshold'
-                
+                threshold_key = ComparisonOptions.threshold_key(meta.option_key)
                 setattr(self, threshold_key, tk.StringVar(value=str(meta.default_threshold or 0.8)))
 
         self.histogram_method = tk.StringVar(value='Correlation')
+        self.hash_algorithm = tk.StringVar(value=ComparisonOptions.DEFAULT_OPTIONS['hash_algorithm'])
+        self.verify_content = tk.BooleanVar(value=ComparisonOptions.DEFAULT_OPTIONS['verify_content'])
 
         # --- Folder Structures ---
         self.folder_structures = {}
@@ -59,6 +57,9 @@ class AppController:
         self.llm_engine = None
         self.llm_engine_loading = False
 
+        # --- Filesystem watcher (optional) ---
+        self.watcher = None
+
         self._bind_variables_to_view()
         self.view.setup_ui()
 
@@ -104,16 +105,16 @@ class AppController:
                 setattr(self.view, meta.option_key, getattr(self, meta.option_key))
             
             if meta.has_threshold:
-                threshold_key = f"{meta.option_key}_threshold"
-                if meta.option_key == 'compare_histogram':
-                    threshold_key = 'histogram_threshold'
-                elif meta.option_key == 'compare_llm':
-                    threshold_key = 'llm_similarity_threshold'
+                threshold_key = ComparisonOptions.threshold_key(meta.option_key)
                 if hasattr(self, threshold_key):
                     setattr(self.view, threshold_key, getattr(self, threshold_key))
         
         if hasattr(self, 'histogram_method'):
             self.view.histogram_method = self.histogram_method
+        if hasattr(self, 'hash_algorithm'):
+            self.view.hash_algorithm = self.hash_algorithm
+        if hasattr(self, 'verify_content'):
+            self.view.verify_content = self.verify_content
 
         # Pass the controller instance to the view
         self.view.controller = self
@@ -131,20 +132,23 @@ class AppController:
                 getattr(self, meta.option_key).set(meta.option_key == 'compare_size')
             
             if meta.has_threshold:
-                threshold_key = f"{meta.option_key}_threshold"
-                if meta.option_key == 'compare_histogram': threshold_key = 'histogram_threshold'
-                elif meta.option_key == 'compare_llm': threshold_key = 'llm_similarity_threshold'
-                
+                threshold_key = ComparisonOptions.threshold_key(meta.option_key)
                 if hasattr(self, threshold_key):
                     getattr(self, threshold_key).set(str(meta.default_threshold or 0.8))
 
         if hasattr(self, 'histogram_method'):
             self.histogram_method.set('Correlation')
+        if hasattr(self, 'hash_algorithm'):
+            self.hash_algorithm.set(ComparisonOptions.DEFAULT_OPTIONS['hash_algorithm'])
+        if hasattr(self, 'verify_content'):
+            self.verify_content.set(ComparisonOptions.DEFAULT_OPTIONS['verify_content'])
         
         self.folder_structures = {}
         if hasattr(self.view, 'results_tree'):
             for i in self.view.results_tree.get_children():
                 self.view.results_tree.delete(i)
+        if getattr(self.view, 'results_view', None) is not None:
+            self.view.results_view.clear()
         if hasattr(self.view, 'folder_list_box') and self.view.folder_list_box:
             self.view.folder_list_box.delete(0, tk.END)
 
@@ -264,7 +268,7 @@ class AppController:
         def build_task():
             conn = database.get_db_connection(self.project_manager.current_project_path)
             inaccessible_paths = logic.build_folder_structure_db(
-                conn, folder_index, path, self.include_subfolders.get()
+                conn, folder_index, path, self.include_subfolders.get(), full_rescan=True
             )
             conn.close()
             return inaccessible_paths
@@ -283,22 +287,31 @@ class AppController:
             logger.info(f"Metadata build and save successful for folder {folder_index}.")
 
         def on_error(e):
+            if isinstance(e, jobs.JobCancelled):
+                logger.info(f"Metadata build for folder {folder_index} stopped by the user.")
+                return
             logger.error(f"Failed to build metadata for folder {folder_index} into DB.", exc_info=e)
             if not self.is_test:
                 messagebox.showerror("Build Error", f"An error occurred during metadata build:\n{e}")
 
         final_callback = on_finally_callback if on_finally_callback else lambda: None
-        self.task_runner.run_task(build_task, on_success, on_error, final_callback)
+        job = jobs.Job('build', {'folder_index': folder_index, 'path': path}, self.project_manager.current_project_path,
+                       on_progress=self._show_progress)
+        self.task_runner.run_task(build_task, on_success, on_error, final_callback, job=job)
 
-    def run_action(self, event=None, file_infos=None):
-        options = self.project_manager.get_options()
+    def run_action(self, event=None, file_infos=None, options=None, folders=None):
+        """
+        Runs the comparison as a cancellable job. `options` and `folders`
+        default to the current settings; they are given when resuming a job.
+        """
+        options = options or self.project_manager.get_options()
         opts_dict = options.to_legacy_dict()
         logger.info(f"Running action with options: {options}")
 
         if options.compare_llm and not self._ensure_llm_engine_loaded():
             return
 
-        folders_in_list = self.view.folder_list_box.get(0, tk.END)
+        folders_in_list = list(folders) if folders is not None else self.view.folder_list_box.get(0, tk.END)
         num_folders = len(folders_in_list)
 
         if num_folders == 0:
@@ -307,48 +320,42 @@ class AppController:
 
         self.view.action_button.config(state='disabled')
         for btn in self.view.build_buttons: btn.config(state='disabled')
-        for i in self.view.results_tree.get_children(): self.view.results_tree.delete(i)
+        self.view.results_view.load(self.project_manager.current_project_path)
         self.view.progress_bar['value'] = 0
         logger.info(f"Queueing action with options: {options}")
 
         def action_task():
             logger.info("Background task starting: metadata calculation and strategy execution.")
-            return self._run_action_db(options, folders_in_list, file_infos=file_infos)
+            return self._iter_action_db(options, folders_in_list, file_infos=file_infos, store_results=True)
 
-        def on_success(all_results):
-            logger.info(f"Action finished successfully.")
-            try:
-                total_matches = 0
-                if not all_results:
-                    message = "No duplicate files found."
-                    self.view.results_tree.insert('', tk.END, values=(message, "", ""), tags=('info_row',))
-                else:
-                    total_matches = sum(len(group) for group in all_results)
-                    for i, group in enumerate(all_results, 1):
-                        header_text = f"Duplicate Set {i} ({len(group)} files)"
-                        parent = self.view.results_tree.insert('', tk.END, values=(header_text, "", "", ""), open=True, tags=('header_row',))
-                        for file_info in group:
-                            size = file_info.get('size', 'N/A')
-                            path_dir = file_info.get('path', '')
-                            file_name = file_info.get('name', '') # Get the actual file name
-                            folder_index = file_info.get('folder_index')
-                            base_path = folders_in_list[folder_index - 1]
-                            display_path = str(Path(path_dir) / file_name) if path_dir else file_name
-                            full_path = str(Path(base_path) / display_path)
-                            self.view.results_tree.insert(parent, tk.END, values=(f"  {file_name}", size, full_path, display_path), tags=('file_row',))
-                
-                if total_matches == 0 and all_results:
-                    message = "No matching files found."
-                    self.view.results_tree.insert('', tk.END, values=(message, "", ""), tags=('info_row',))
+        shown = {'sets': 0, 'matches': 0}
 
-                if not self.is_test:
-                    messagebox.showinfo("Success", f"Operation completed successfully. Found {total_matches} total matches.")
+        def on_batch(stored_groups):
+            try:
+                shown['sets'] += len(stored_groups)
+                shown['matches'] += sum(file_count for _, file_count in stored_groups)
+                self.view.results_view.refresh_later()
+                self.view.update_status(f"Found {shown['sets']} duplicate sets so far...")
             except Exception as e:
                 logger.error("Error displaying results:", exc_info=True)
                 if not self.is_test:
                     messagebox.showerror("Error", f"An error occurred while displaying the results:\n{e}")
 
+        def on_success(group_count):
+            logger.info(f"Action finished successfully with {group_count} duplicate sets.")
+            if group_count:
+                self.view.results_view.refresh()
+            else:
+                self.view.results_view.show_message("No duplicate files found.")
+            if not self.is_test:
+                messagebox.showinfo("Success", f"Operation completed successfully. Found {shown['matches']} total matches.")
+
         def on_error(e):
+            if isinstance(e, jobs.JobCancelled):
+                logger.info("Action stopped by the user.")
+                if not self.is_test:
+                    messagebox.showinfo("Stopped", "The comparison was stopped. Work finished so far was saved and will be reused.")
+                return
             logger.critical("An unexpected error occurred during the main action.", exc_info=True)
             if not self.is_test:
                 messagebox.showerror("Error", f"An unexpected error occurred:\n{e}")
@@ -360,26 +367,93 @@ class AppController:
             for btn in self.view.build_buttons: btn.config(state='normal')
             logger.info("Action finished.")
 
-        self.task_runner.run_task(action_task, on_success, on_error, on_finally)
+        job = jobs.Job('compare', {'folders': list(folders_in_list), 'options': options.to_save_dict()},
+                       self.project_manager.current_project_path, on_progress=self._show_progress)
+        self.task_runner.run_streaming_task(action_task, on_batch, on_success, on_error, on_finally, job=job)
 
-    def _run_action_db(self, options: ComparisonOptions, folders_in_list, file_infos=None):
-        logger.info(f"Running DB action with options: {options}")
+    def cancel_jobs(self):
+        """Asks the running build or comparison to stop; finished work is kept."""
+        if self.task_runner.cancel_jobs():
+            self.view.update_status("Stopping...")
+
+    def resume_unfinished_job(self):
+        """
+        Offers to resume the project's last job if it was cancelled or the app
+        was closed while it ran. Returns True if the job was restarted.
+        """
         conn = database.get_db_connection(self.project_manager.current_project_path)
-        file_filter = options.file_type_filter
-        opts_dict = options.to_legacy_dict()
+        try:
+            job = database.get_unfinished_job(conn)
+            if job is None:
+                return False
+            label = 'folder build' if job['kind'] == 'build' else 'comparison'
+            reached = f" It had reached: {job['stage']}" if job['stage'] else ""
+            if not messagebox.askyesno("Resume", f"The last {label} did not finish.{reached}\n\nResume it now?"):
+                database.update_job(conn, job['id'], status='dismissed')
+                return False
+        finally:
+            conn.close()
 
-        all_file_infos = []
-        for folder_index, path in enumerate(folders_in_list, 1):
-            folder_name = Path(path).name
-            self.task_runner.post_to_main_thread(self.view.update_status, f"Syncing folder: {folder_name}...")
-            logic.build_folder_structure_db(conn, folder_index, path, options.include_subfolders)
-            
-            self.task_runner.post_to_main_thread(self.view.update_status, f"Calculating metadata for {folder_name}...")
-            infos, _ = utils.calculate_metadata_db(conn, folder_index, path, opts_dict, file_type_filter=file_filter, llm_engine=self.llm_engine)
-            all_file_infos.extend(infos)
+        params = job['params']
+        if job['kind'] == 'build':
+            self._build_metadata_db(params['path'], params['folder_index'])
+        else:
+            self.run_action(options=ComparisonOptions.from_dict(params['options']), folders=params['folders'])
+        return True
+
+    def on_closing(self):
+        """Stops running jobs, giving them time to commit their last batch, and closes the app."""
+        if self.task_runner.cancel_jobs():
+            self.view.update_status("Saving finished work...")
+            self.view.root.update_idletasks()
+            # Pumping the queue lets streaming workers deliver their last batch and stop
+            self.task_runner.wait(timeout=float(config.get("jobs.shutdown_timeout", 10)), pump=True)
+        if self.watcher:
+            self.watcher.stop()
+        self.view.root.destroy()
+
+    def _show_progress(self, event):
+        """Shows a throttled `progress.ProgressEvent` of the running job in the status bar."""
+        self.task_runner.post_to_main_thread(self.view.update_status, event.describe(), event.percent)
+
+    def _report_stage(self, message):
+        """Shows a pipeline stage in the status bar and records it on the running job."""
+        jobs.set_stage(message)
+        self.task_runner.post_to_main_thread(self.view.update_status, message, 0)
+
+    def _ensure_watcher(self, folders, include_subfolders):
+        """
+        Starts or updates the filesystem watcher for the current project if it
+        is enabled in the settings. Returns the watcher, or None.
+        """
+        if not config.get("watcher.enabled", False):
+            return None
+
+        project_path = self.project_manager.current_project_path
+        if self.watcher and self.watcher.project_path != project_path:
+            self.watcher.stop()
+            self.watcher = None
+        if self.watcher is None:
+            from watcher import WatcherService
+            self.watcher = WatcherService(project_path)
+        self.watcher.watch(folders, include_subfolders)
+        return self.watcher
 
-        self.task_runner.post_to_main_thread(self.view.update_status, "Finding duplicates...")
-        all_results = find_duplicates_strategy.run(conn, opts_dict, file_infos=all_file_infos, folder_index=[i+1 for i in range(len(folders_in_list))])
+    def _run_action_db(self, options: ComparisonOptions, folders_in_list, file_infos=None):
+        return list(self._iter_action_db(options, folders_in_list, file_infos=file_infos))
 
-        conn.close()
-        return all_results
+    def _iter_action_db(self, options: ComparisonOptions, folders_in_list, file_infos=None, store_results=False):
+        """
+        Syncs and analyzes the folders, then yields duplicate groups as they are
+        found. With `store_results`, the groups are written to the project's
+        results table instead, and (group_id, file_count) pairs are yielded.
+        """
+        logger.info(f"Running DB action with options: {options}")
+        conn = database.get_db_connection(self.project_manager.current_project_path)
+        try:
+            folders = dict(enumerate(folders_in_list, 1))
+            watcher = self._ensure_watcher(folders, options.include_subfolders)
+            yield from pipeline.iter_duplicate_groups(conn, folders, options, llm_engine=self.llm_engine, watcher=watcher,
+                                                      on_stage=self._report_stage, store_results=store_results)
+        finally:
+            conn.close()
@@ -1,10 +1,105 @@
 import sqlite3
 import json
+import itertools
+import os
+import time
 from models import FileNode, FolderNode
 from config import config
+import jobs
+
+DEFAULT_WRITE_BATCH = 500
+
+# Tables holding per-file metadata that is invalidated when a file changes.
+METADATA_TABLES = (
+    'file_metadata',
+    'histograms',
+)
+
+DEFAULT_JOURNAL_MODE = 'WAL'
+DEFAULT_CACHE_SIZE_MIB = 64
+DEFAULT_MMAP_SIZE_MIB = 256
+
+# Schema changes applied once per project file, tracked in PRAGMA user_version.
+# Append new steps; never edit or reorder existing ones.
+MIGRATIONS = [
+    # 1: indexes for duplicate grouping, stale-file cleanup and file type filters.
+    # (size, md5, file_id) covers the GROUP BY so file_metadata rows are never read.
+    (
+        "CREATE INDEX IF NOT EXISTS idx_file_metadata_size_md5 ON file_metadata (size, md5, file_id)",
+        "CREATE INDEX IF NOT EXISTS idx_files_folder_last_seen ON files (folder_index, last_seen)",
+        "CREATE INDEX IF NOT EXISTS idx_files_ext ON files (ext, folder_index)",
+    ),
+    # 2: paging through the members of a result group.
+    (
+        "CREATE INDEX IF NOT EXISTS idx_results_group ON results (group_id, id)",
+    ),
+    # 3: images with a perceptual hash, and exact hash matches.
+    (
+        "CREATE INDEX IF NOT EXISTS idx_file_metadata_phash ON file_metadata (phash, file_id)",
+    ),
+    # 4: the per-method histogram tables are replaced by the `histograms` store.
+    # They only held cached values, which are recomputed on the next run.
+    (
+        "DROP TABLE IF EXISTS histogram_intersection",
+        "DROP TABLE IF EXISTS histogram_correlation",
+        "DROP TABLE IF EXISTS histogram_chisqr",
+        "DROP TABLE IF EXISTS histogram_bhattacharyya",
+    ),
+    # 5: count the writes that change an LLM embedding, which key the persisted ANN index.
+    (
+        """CREATE TRIGGER IF NOT EXISTS trg_llm_embedding_insert AFTER INSERT ON file_metadata
+           WHEN NEW.llm_embedding IS NOT NULL
+           BEGIN
+               INSERT INTO project_settings (key, value) VALUES ('llm_embedding_generation', 1)
+               ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_llm_embedding_update AFTER UPDATE OF llm_embedding ON file_metadata
+           WHEN NEW.llm_embedding IS NOT OLD.llm_embedding
+           BEGIN
+               INSERT INTO project_settings (key, value) VALUES ('llm_embedding_generation', 1)
+               ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_llm_embedding_delete AFTER DELETE ON file_metadata
+           WHEN OLD.llm_embedding IS NOT NULL
+           BEGIN
+               INSERT INTO project_settings (key, value) VALUES ('llm_embedding_generation', 1)
+               ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1;
+           END""",
+    ),
+]
+
+# ORDER BY clauses for the sort keys of the results view.
+RESULT_SORT_ORDERS = {
+    'group': "group_id",
+    'size': "size DESC, group_id",
+    'count': "file_count DESC, group_id",
+    'name': "name COLLATE NOCASE, group_id",
+}
+DEFAULT_RESULT_FLUSH_INTERVAL = 0.5
 
 def get_db_connection(project_file):
-    return sqlite3.connect(project_file)
+    """Opens a project database with the connection profile from the `database.*` settings."""
+    conn = sqlite3.connect(project_file)
+    configure_connection(conn)
+    return conn
+
+def configure_connection(conn):
+    """
+    Applies the performance pragmas to a connection: WAL journaling (readers
+    don't block the writer), synchronous=NORMAL (safe with WAL, no fsync per
+    commit), a larger page cache, memory-mapped reads and in-memory temp tables.
+
+    WAL needs shared memory and does not work on network filesystems; set
+    `database.journal_mode` to "DELETE" for projects stored on one.
+    """
+    journal_mode = config.get("database.journal_mode", DEFAULT_JOURNAL_MODE)
+    cache_kib = int(config.get("database.cache_size_mib", DEFAULT_CACHE_SIZE_MIB)) * 1024
+    mmap_bytes = int(config.get("database.mmap_size_mib", DEFAULT_MMAP_SIZE_MIB)) * 1024 * 1024
+    conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{cache_kib}")
+    conn.execute(f"PRAGMA mmap_size={mmap_bytes}")
+    conn.execute("PRAGMA temp_store=MEMORY")
 
 def create_tables(conn):
     with conn:
@@ -41,48 +136,130 @@ def create_tables(conn):
                 size INTEGER,
                 modified_date REAL,
                 md5 TEXT,
+                partial_md5 TEXT,
+                hash_algorithm TEXT,
+                phash INTEGER,
                 llm_embedding BLOB,
                 FOREIGN KEY (file_id) REFERENCES files(id)
             )
         """
         )
         conn.execute("""
-            CREATE TABLE IF NOT EXISTS histogram_intersection (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                file_id INTEGER UNIQUE,
-                histogram_values BLOB,
+            CREATE TABLE IF NOT EXISTS histograms (
+                file_id INTEGER PRIMARY KEY,
+                bins BLOB,
                 FOREIGN KEY (file_id) REFERENCES files(id)
             )
         """
         )
         conn.execute("""
-            CREATE TABLE IF NOT EXISTS histogram_correlation (
+            CREATE TABLE IF NOT EXISTS fs_journal (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                file_id INTEGER UNIQUE,
-                histogram_values BLOB,
-                FOREIGN KEY (file_id) REFERENCES files(id)
+                folder_index INTEGER,
+                event TEXT,
+                path TEXT,
+                name TEXT,
+                is_dir INTEGER,
+                recorded REAL
+            )
+        """
+        )
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS directories (
+                folder_index INTEGER,
+                path TEXT,
+                mtime REAL,
+                entry_count INTEGER,
+                PRIMARY KEY (folder_index, path)
             )
         """
         )
         conn.execute("""
-            CREATE TABLE IF NOT EXISTS histogram_chisqr (
+            CREATE TABLE IF NOT EXISTS results (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                file_id INTEGER UNIQUE,
-                histogram_values BLOB,
-                FOREIGN KEY (file_id) REFERENCES files(id)
+                group_id INTEGER,
+                file_id INTEGER,
+                folder_index INTEGER,
+                path TEXT,
+                name TEXT,
+                size INTEGER,
+                full_path TEXT
+            )
+        """
+        )
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS result_groups (
+                group_id INTEGER PRIMARY KEY,
+                file_count INTEGER,
+                size INTEGER,
+                name TEXT
             )
         """
         )
         conn.execute("""
-            CREATE TABLE IF NOT EXISTS histogram_bhattacharyya (
+            CREATE TABLE IF NOT EXISTS jobs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                file_id INTEGER UNIQUE,
-                histogram_values BLOB,
-                FOREIGN KEY (file_id) REFERENCES files(id)
+                kind TEXT NOT NULL,
+                params TEXT,
+                status TEXT NOT NULL,
+                stage TEXT,
+                started REAL,
+                updated REAL
             )
         """
         )
         conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_files_path_folder ON files (folder_index, path, name)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fs_journal_folder ON fs_journal (folder_index, id)")
+        _add_missing_columns(conn, 'file_metadata', {'partial_md5': 'TEXT', 'phash': 'INTEGER', 'hash_algorithm': 'TEXT'})
+        apply_migrations(conn)
+
+def apply_migrations(conn):
+    """Runs the MIGRATIONS a project file has not seen yet, inside the caller's transaction."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, statements in enumerate(MIGRATIONS[version:], version + 1):
+        for statement in statements:
+            conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {number}")
+    return len(MIGRATIONS)
+
+def _add_missing_columns(conn, table, columns):
+    """Adds columns introduced after a project file was created."""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, decl in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+def executemany_batched(conn, query, rows, batch_size=None):
+    """
+    Runs `query` for every row of an iterable, committing one transaction per
+    batch. Returns the number of rows written.
+    """
+    batch_size = batch_size or int(config.get("database.write_batch", DEFAULT_WRITE_BATCH))
+    rows = iter(rows)
+    written = 0
+    while True:
+        # Everything before this point is committed, so a cancelled job can stop here
+        jobs.checkpoint()
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return written
+        with conn:
+            conn.executemany(query, batch)
+        written += len(batch)
+
+def invalidate_content_hashes(conn, algorithm):
+    """
+    Clears the content and partial digests that were not computed with
+    `algorithm`, so they are recomputed. Rows without a recorded algorithm
+    predate the column and hold MD5 digests. Returns the number of rows cleared.
+    """
+    with conn:
+        cleared = conn.execute("""
+            UPDATE file_metadata SET md5 = NULL, partial_md5 = NULL, hash_algorithm = NULL
+            WHERE (md5 IS NOT NULL OR partial_md5 IS NOT NULL)
+              AND COALESCE(hash_algorithm, 'md5') IS NOT ?
+        """, (algorithm,)).rowcount
+    return cleared
 
 def save_setting(conn, key, value):
     with conn:
@@ -94,9 +271,14 @@ def load_setting(conn, key):
     row = cursor.fetchone()
     return json.loads(row[0]) if row else None
 
+def get_embedding_generation(conn):
+    """Returns the number of writes that changed an LLM embedding, as counted by the migration 5 triggers."""
+    return int(load_setting(conn, 'llm_embedding_generation') or 0)
+
 def clear_folder_data(conn, folder_index):
     with conn:
         conn.execute("DELETE FROM files WHERE folder_index = ?", (folder_index,))
+        conn.execute("DELETE FROM directories WHERE folder_index = ?", (folder_index,))
 
 def delete_file_by_path(conn, path, name):
     with conn:
@@ -111,11 +293,16 @@ def delete_file_by_path(conn, path, name):
 def clear_file_metadata(conn, file_id):
     """Resets all cached metadata for a specific file."""
     with conn:
-        conn.execute("DELETE FROM file_metadata WHERE file_id = ?", (file_id,))
-        conn.execute("DELETE FROM histogram_intersection WHERE file_id = ?", (file_id,))
-        conn.execute("DELETE FROM histogram_correlation WHERE file_id = ?", (file_id,))
-        conn.execute("DELETE FROM histogram_chisqr WHERE file_id = ?", (file_id,))
-        conn.execute("DELETE FROM histogram_bhattacharyya WHERE file_id = ?", (file_id,))
+        delete_metadata_for(conn, "?", (file_id,))
+
+def delete_metadata_for(conn, file_ids_query, params=()):
+    """
+    Deletes cached metadata for the files selected by `file_ids_query`, which is
+    either a placeholder or a subquery returning file ids. Runs inside the
+    caller's transaction.
+    """
+    for table in METADATA_TABLES:
+        conn.execute(f"DELETE FROM {table} WHERE file_id IN ({file_ids_query})", params)
 
 def insert_file_node(conn, node, folder_index, current_folder_path=''):
     if isinstance(node, FileNode):
@@ -135,15 +322,30 @@ def insert_file_node(conn, node, folder_index, current_folder_path=''):
             insert_file_node(conn, child, folder_index, new_folder_path)
 
 def get_all_files(conn, folder_index, file_type_filter="all"):
+    return _select_folder_files(conn, "", "", folder_index, file_type_filter)
+
+def get_files_with_metadata(conn, folder_index, file_type_filter="all", histograms=False):
+    """
+    Returns the rows of `get_all_files` with the perceptual hash and the stored
+    histogram blob (None unless `histograms` is set) appended, read in one
+    joined query.
+    """
+    if histograms:
+        return _select_folder_files(conn, ", fm.phash, h.bins", "LEFT JOIN histograms h ON h.file_id = f.id",
+                                    folder_index, file_type_filter)
+    return _select_folder_files(conn, ", fm.phash, NULL", "", folder_index, file_type_filter)
+
+def _select_folder_files(conn, extra_columns, extra_joins, folder_index, file_type_filter):
     cursor = conn.cursor()
-    query = """
+    query = f"""
         SELECT
             f.id, f.folder_index, f.path, f.name, f.ext, f.last_seen,
-            fm.size, fm.modified_date, fm.md5, fm.llm_embedding
+            fm.size, fm.modified_date, fm.md5, fm.llm_embedding{extra_columns}
         FROM
             files f
         LEFT JOIN
             file_metadata fm ON f.id = fm.file_id
+        {extra_joins}
         WHERE
             f.folder_index = ?
     """
@@ -176,12 +378,208 @@ def get_files_by_ids(conn, ids):
     cursor.execute(query, tuple(ids))
     return cursor.fetchall()
 
+def get_directories(conn, folder_index):
+    """Returns {relative_path: (mtime, entry_count)} for a folder's directories as of its last full scan."""
+    cursor = conn.execute("SELECT path, mtime, entry_count FROM directories WHERE folder_index = ?", (folder_index,))
+    return {path: (mtime, entry_count) for path, mtime, entry_count in cursor}
+
+def replace_directories(conn, folder_index, directories):
+    """Replaces a folder's directory rows with (path, mtime, entry_count) tuples."""
+    with conn:
+        conn.execute("DELETE FROM directories WHERE folder_index = ?", (folder_index,))
+        conn.executemany(
+            "INSERT INTO directories (folder_index, path, mtime, entry_count) VALUES (?, ?, ?, ?)",
+            ((folder_index, path, mtime, entry_count) for path, mtime, entry_count in directories)
+        )
+
+def clear_results(conn):
+    with conn:
+        conn.execute("DELETE FROM results")
+        conn.execute("DELETE FROM result_groups")
+
+def count_result_groups(conn):
+    """Returns the number of duplicate groups stored by the last comparison."""
+    return conn.execute("SELECT COUNT(*) FROM result_groups").fetchone()[0]
+
+def store_result_groups(conn, groups, roots, batch_size=None, flush_interval=DEFAULT_RESULT_FLUSH_INTERVAL):
+    """
+    Replaces the stored results with duplicate groups (lists of file info
+    dicts) as they are produced. `roots` maps folder_index to the folder's root
+    path. Groups are committed in batches, or after `flush_interval` seconds,
+    and (group_id, file_count) is yielded for each one once it is readable
+    from other connections.
+    """
+    batch_size = batch_size or int(config.get("database.write_batch", DEFAULT_WRITE_BATCH))
+    clear_results(conn)
+    pending = []
+    last_flush = time.monotonic()
+    for group_id, group in enumerate(groups, 1):
+        jobs.checkpoint()
+        pending.append((group_id, group))
+        if len(pending) >= batch_size or time.monotonic() - last_flush >= flush_interval:
+            yield from _write_result_batch(conn, pending, roots)
+            pending = []
+            last_flush = time.monotonic()
+    if pending:
+        yield from _write_result_batch(conn, pending, roots)
+
+def _write_result_batch(conn, pending, roots):
+    rows = [
+        (group_id, info['id'], info['folder_index'], str(info['path'] or ''), info['name'], info.get('size'),
+         os.path.normpath(os.path.join(roots[info['folder_index']], str(info['path'] or ''), info['name'])))
+        for group_id, group in pending
+        for info in group
+    ]
+    summaries = [
+        (group_id, len(group), max((info.get('size') or 0) for info in group), min(info['name'] for info in group))
+        for group_id, group in pending
+    ]
+    with conn:
+        conn.executemany("""
+            INSERT INTO results (group_id, file_id, folder_index, path, name, size, full_path)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        conn.executemany("INSERT INTO result_groups (group_id, file_count, size, name) VALUES (?, ?, ?, ?)", summaries)
+    return [(group_id, file_count) for group_id, file_count, _, _ in summaries]
+
+def build_result_order(conn, sort_key='group', name_filter=''):
+    """
+    Materializes the display order of the stored results in a temporary table
+    on this connection: one header row per group followed by its files. Groups
+    can be sorted by a RESULT_SORT_ORDERS key and restricted to those with a
+    file name containing `name_filter`. Returns the total number of rows.
+    """
+    order = RESULT_SORT_ORDERS.get(sort_key, RESULT_SORT_ORDERS['group'])
+    where, params = "", []
+    if name_filter:
+        escaped = name_filter.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        where = "WHERE group_id IN (SELECT group_id FROM results WHERE name LIKE ? ESCAPE '\\')"
+        params.append(f"%{escaped}%")
+    with conn:
+        conn.execute("DROP TABLE IF EXISTS temp.result_order")
+        conn.execute(f"""
+            CREATE TEMP TABLE result_order AS
+            SELECT group_id, file_count,
+                   SUM(file_count + 1) OVER (ORDER BY {order} ROWS UNBOUNDED PRECEDING) - file_count - 1 AS start_row
+            FROM result_groups
+            {where}
+        """, params)
+        conn.execute("CREATE INDEX temp.idx_result_order_start ON result_order (start_row)")
+    return conn.execute("SELECT COALESCE(SUM(file_count + 1), 0) FROM result_order").fetchone()[0]
+
+def get_result_window(conn, start, count):
+    """
+    Returns up to `count` display rows from position `start` of the order built
+    by build_result_order. Rows are ('group', group_id, file_count) or
+    ('file', result_id, name, path, size, full_path).
+    """
+    end = start + count
+    groups = conn.execute("""
+        SELECT group_id, file_count, start_row
+        FROM result_order
+        WHERE start_row >= COALESCE((SELECT MAX(start_row) FROM result_order WHERE start_row <= ?), 0)
+          AND start_row < ?
+        ORDER BY start_row
+    """, (start, end)).fetchall()
+
+    rows = []
+    for group_id, file_count, start_row in groups:
+        if start_row >= start:
+            rows.append(('group', group_id, file_count))
+        skip = max(0, start - start_row - 1)
+        limit = min(file_count - skip, end - (start_row + 1 + skip))
+        if limit <= 0:
+            continue
+        files = conn.execute("""
+            SELECT id, name, path, size, full_path FROM results
+            WHERE group_id = ? ORDER BY id LIMIT ? OFFSET ?
+        """, (group_id, limit, skip))
+        rows.extend(('file',) + tuple(row) for row in files)
+    return rows[:count]
+
+def delete_result(conn, result_id):
+    """Removes a file from the stored results, dropping its group once no duplicate is left."""
+    with conn:
+        row = conn.execute("SELECT group_id FROM results WHERE id = ?", (result_id,)).fetchone()
+        if not row:
+            return
+        conn.execute("DELETE FROM results WHERE id = ?", (result_id,))
+        conn.execute("UPDATE result_groups SET file_count = file_count - 1 WHERE group_id = ?", row)
+        conn.execute("DELETE FROM results WHERE group_id = ? AND (SELECT file_count FROM result_groups WHERE group_id = ?) < 2", row * 2)
+        conn.execute("DELETE FROM result_groups WHERE group_id = ? AND file_count < 2", row)
+
+def append_journal(conn, events):
+    """Records filesystem events as (folder_index, event, path, name, is_dir, recorded) rows."""
+    with conn:
+        conn.executemany("""
+            INSERT INTO fs_journal (folder_index, event, path, name, is_dir, recorded)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, events)
+
+def get_journal(conn, folder_index):
+    """Returns the pending (id, event, path, name, is_dir) journal entries of a folder, oldest first."""
+    cursor = conn.execute(
+        "SELECT id, event, path, name, is_dir FROM fs_journal WHERE folder_index = ? ORDER BY id",
+        (folder_index,)
+    )
+    return cursor.fetchall()
+
+def trim_journal(conn, folder_index, up_to_id=None, recorded_before=None):
+    """Deletes journal entries of a folder that have been applied or superseded by a full scan."""
+    query = "DELETE FROM fs_journal WHERE folder_index = ?"
+    params = [folder_index]
+    if up_to_id is not None:
+        query += " AND id <= ?"
+        params.append(up_to_id)
+    if recorded_before is not None:
+        query += " AND recorded < ?"
+        params.append(recorded_before)
+    with conn:
+        conn.execute(query, params)
+
 def add_source(conn, path):
     with conn:
         cursor = conn.cursor()
         cursor.execute("INSERT INTO sources (path) VALUES (?)", (path,))
         return cursor.lastrowid
 
+# Job states; a job left 'running' was interrupted (e.g. the app was closed)
+UNFINISHED_JOB_STATES = ('running', 'cancelled')
+
+def start_job(conn, kind, params):
+    """
+    Records a new job of `kind` with its JSON-serializable parameters and
+    returns its id. Unfinished jobs of the same kind are superseded by it.
+    """
+    now = time.time()
+    with conn:
+        conn.execute(f"UPDATE jobs SET status = 'superseded', updated = ? WHERE kind = ? AND status IN {UNFINISHED_JOB_STATES}",
+                     (now, kind))
+        cursor = conn.execute("INSERT INTO jobs (kind, params, status, started, updated) VALUES (?, ?, 'running', ?, ?)",
+                              (kind, json.dumps(params), now, now))
+    return cursor.lastrowid
+
+def update_job(conn, job_id, status=None, stage=None):
+    """Updates a job's status and/or the stage it last reached."""
+    with conn:
+        conn.execute("UPDATE jobs SET status = COALESCE(?, status), stage = COALESCE(?, stage), updated = ? WHERE id = ?",
+                     (status, stage, time.time(), job_id))
+
+def get_unfinished_job(conn):
+    """
+    Returns the most recent job that was cancelled or interrupted, as a dict
+    with id, kind, params, status and stage, or None.
+    """
+    row = conn.execute(f"""
+        SELECT id, kind, params, status, stage FROM jobs
+        WHERE status IN {UNFINISHED_JOB_STATES}
+        ORDER BY id DESC LIMIT 1
+    """).fetchone()
+    if row is None:
+        return None
+    job_id, kind, params, status, stage = row
+    return {'id': job_id, 'kind': kind, 'params': json.loads(params or '{}'), 'status': status, 'stage': stage}
+
 def get_sources(conn):
     cursor = conn.cursor()
     cursor.execute("SELECT id, path FROM sources ORDER BY id")
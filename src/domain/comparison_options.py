@@ -17,9 +17,13 @@ class ComparisonOptions:
         "compare_content_md5": False,
         "compare_histogram": False,
         "compare_llm": False,
+        "compare_phash": False,
         "histogram_method": "Correlation",
+        "hash_algorithm": "md5",
+        "verify_content": False,
         "histogram_threshold": 0.9,
-        "llm_similarity_threshold": 0.8
+        "llm_similarity_threshold": 0.8,
+        "compare_phash_threshold": 8
     }
 
     def __init__(self, file_type_filter="all", include_subfolders=True, move_to_path="", options=None, **kwargs):
@@ -38,6 +42,15 @@ class ComparisonOptions:
         if kwargs:
             self.options.update(kwargs)
 
+    @staticmethod
+    def threshold_key(option_key: str) -> str:
+        """Returns the options key holding the threshold of the strategy with `option_key`."""
+        if option_key == 'compare_histogram':
+            return 'histogram_threshold'
+        if option_key == 'compare_llm':
+            return 'llm_similarity_threshold'
+        return f"{option_key}_threshold"
+
     def __getattr__(self, name: str) -> Any:
         # Fallback to options dictionary for backward compatibility
         if name in self.options:
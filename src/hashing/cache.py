@@ -0,0 +1,242 @@
+"""
+User-level cache of expensive per-file values, shared by all projects.
+
+Every project stores its own digests, so the same archive added to several
+projects would be read once per project. When `hash_cache.enabled` is set,
+digests, histograms and embeddings are also recorded in one SQLite file
+(`hash_cache.path`, by default `~/.duplicatefinder/hash_cache.db`). Entries
+are keyed by the file's identity and version, (st_dev, st_ino, st_size,
+st_mtime_ns), so a value is found again under any path or project and is
+never served after the file changes.
+
+The cache is bounded by `hash_cache.max_entries` and `hash_cache.max_mib`.
+The least recently used entries are dropped first.
+"""
+import logging
+import os
+import sqlite3
+import time
+from config import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1_000_000
+DEFAULT_MAX_MIB = 1024
+FLUSH_EVERY = 500
+# SQLite limits a statement to 999 parameters; each key takes 4
+LOOKUP_CHUNK = 200
+
+
+def default_path():
+    return os.path.join(os.path.expanduser("~"), ".duplicatefinder", "hash_cache.db")
+
+
+def is_enabled():
+    return bool(config.get("hash_cache.enabled", False))
+
+
+def file_key(fullpath):
+    """
+    Returns the (device, inode, size, mtime_ns) key of a file, or None if it
+    cannot be stat'ed or the filesystem does not report inode numbers.
+    """
+    try:
+        stat = os.stat(fullpath)
+    except OSError:
+        return None
+    if not stat.st_ino:
+        return None
+    return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _size_of(value):
+    return len(value) if isinstance(value, (bytes, str)) else 8
+
+
+class HashCache:
+    """
+    An LRU store of `kind -> value` per file key. `kind` names what a value
+    is, e.g. 'md5' or 'histogram', and should change whenever the way the
+    value is computed changes.
+    """
+
+    def __init__(self, path=None, max_entries=None, max_mib=None):
+        self.path = path or config.get("hash_cache.path") or default_path()
+        self.max_entries = int(max_entries or config.get("hash_cache.max_entries", DEFAULT_MAX_ENTRIES))
+        self.max_bytes = int(float(max_mib or config.get("hash_cache.max_mib", DEFAULT_MAX_MIB)) * 1024 * 1024)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Several projects (and app instances) may share the file
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    dev INTEGER,
+                    ino INTEGER,
+                    size INTEGER,
+                    mtime_ns INTEGER,
+                    kind TEXT,
+                    value,
+                    bytes INTEGER,
+                    last_used REAL,
+                    PRIMARY KEY (dev, ino, size, mtime_ns, kind)
+                )
+            """
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used)")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_many(self, kind, keys):
+        """Returns {key: value} for the keys that have a `kind` entry, and marks them as used."""
+        keys = list(dict.fromkeys(key for key in keys if key is not None))
+        found = {}
+        for start in range(0, len(keys), LOOKUP_CHUNK):
+            chunk = keys[start:start + LOOKUP_CHUNK]
+            tuples = ','.join('(?, ?, ?, ?)' for _ in chunk)
+            params = [part for key in chunk for part in key]
+            cursor = self.conn.execute(
+                f"SELECT dev, ino, size, mtime_ns, value FROM entries "
+                f"WHERE kind = ? AND (dev, ino, size, mtime_ns) IN (VALUES {tuples})",
+                [kind] + params
+            )
+            found.update((tuple(row[:4]), row[4]) for row in cursor)
+        if found:
+            now = time.time()
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE entries SET last_used = ? WHERE dev = ? AND ino = ? AND size = ? AND mtime_ns = ? AND kind = ?",
+                    ((now, *key, kind) for key in found)
+                )
+        return found
+
+    def put_many(self, kind, items):
+        """Stores `(key, value)` pairs. Pairs without a key are skipped."""
+        now = time.time()
+        rows = [(*key, kind, value, _size_of(value), now) for key, value in items if key is not None]
+        if rows:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO entries (dev, ino, size, mtime_ns, kind, value, bytes, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+        return len(rows)
+
+    def prune(self):
+        """Drops the least recently used entries beyond the entry and size caps. Returns the number dropped."""
+        count, total = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM entries").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return 0
+        with self.conn:
+            cursor = self.conn.execute("""
+                DELETE FROM entries WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid,
+                               ROW_NUMBER() OVER (ORDER BY last_used DESC) AS position,
+                               SUM(bytes) OVER (ORDER BY last_used DESC ROWS UNBOUNDED PRECEDING) AS running
+                        FROM entries
+                    )
+                    WHERE position > ? OR running > ?
+                )
+            """, (self.max_entries, self.max_bytes))
+        logger.info(f"Hash cache: dropped {cursor.rowcount} least recently used entries.")
+        return cursor.rowcount
+
+
+def open_cache():
+    """Returns a HashCache if the cache is enabled and can be opened, otherwise None."""
+    if not is_enabled():
+        return None
+    try:
+        return HashCache()
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Hash cache unavailable: {e}")
+        return None
+
+
+def lookup(kind, items):
+    """
+    Looks up `(file_id, fullpath)` items. Returns ({file_id: value} for the
+    hits, {file_id: key} for the misses); the keys are taken now, so values
+    computed afterwards can be stored under them with `store`. Both are empty
+    without a cache.
+    """
+    cache = open_cache()
+    if cache is None:
+        return {}, {}
+    with cache:
+        keys = {file_id: file_key(fullpath) for file_id, fullpath in items}
+        hits = cache.get_many(kind, keys.values())
+    found = {file_id: hits[key] for file_id, key in keys.items() if key in hits}
+    missing = {file_id: key for file_id, key in keys.items() if key is not None and key not in hits}
+    return found, missing
+
+
+def store(kind, items):
+    """Adds `(key, value)` pairs to the cache, if it is enabled."""
+    items = [(key, value) for key, value in items if _storable(value)]
+    if not items:
+        return
+    cache = open_cache()
+    if cache is None:
+        return
+    with cache:
+        cache.put_many(kind, items)
+        cache.prune()
+
+
+def _storable(value):
+    # Failures (None, or an empty embedding) are retried per project, not shared
+    return value is not None and value != b''
+
+
+def cached(kind, compute, items):
+    """
+    Yields `(file_id, value)` for `(file_id, fullpath, *args)` items like
+    `compute(items)` does, but serves values from the cache where possible.
+    Only the remaining items are passed to `compute`, and their results are
+    added to the cache. Without a cache this is `compute(items)`.
+    """
+    cache = open_cache()
+    if cache is None:
+        yield from compute(items)
+        return
+
+    with cache:
+        keys = {item[0]: file_key(item[1]) for item in items}
+        hits = cache.get_many(kind, keys.values())
+        misses = []
+        for item in items:
+            key = keys[item[0]]
+            if key in hits:
+                yield item[0], hits[key]
+            else:
+                misses.append(item)
+        logger.info(f"Hash cache: {len(items) - len(misses)} of {len(items)} '{kind}' values reused.")
+
+        paths = {item[0]: item[1] for item in misses}
+        pending = []
+        try:
+            for file_id, value in compute(misses):
+                key = keys[file_id]
+                # Skip files that changed while they were read
+                if _storable(value) and key is not None and file_key(paths[file_id]) == key:
+                    pending.append((key, value))
+                    if len(pending) >= FLUSH_EVERY:
+                        cache.put_many(kind, pending)
+                        pending = []
+                yield file_id, value
+        finally:
+            cache.put_many(kind, pending)
+            cache.prune()
@@ -0,0 +1,119 @@
+import os
+import logging
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PER_DEVICE_IN_FLIGHT = 4
+DEFAULT_PARALLEL_MIN_FILES = 32
+
+
+def default_workers():
+    return config.get("hashing.workers") or min(32, os.cpu_count() or 1)
+
+
+def should_parallelize(file_count):
+    """Returns True if a batch is large enough to be worth a worker pool."""
+    return file_count >= int(config.get("hashing.parallel_min_files", DEFAULT_PARALLEL_MIN_FILES))
+
+
+class HashingExecutor:
+    """
+    Hashes files on a thread pool while bounding how many files are read
+    concurrently from the same device.
+
+    hashlib releases the GIL while digesting large buffers, so threads scale
+    across cores without the pickling overhead of a process pool. The
+    per-device bound keeps spinning disks and NAS mounts from thrashing when
+    many workers would otherwise seek between files on the same spindle.
+    """
+
+    def __init__(self, hash_func, max_workers=None, per_device_limit=None):
+        """
+        Args:
+            hash_func (callable): Called as `hash_func(fullpath, *args)`; returns a digest or None.
+            max_workers (int, optional): Total number of files hashed at once.
+            per_device_limit (int, optional): Files hashed at once per storage device.
+        """
+        self.hash_func = hash_func
+        self.max_workers = max(1, max_workers or default_workers())
+        self.per_device_limit = max(1, per_device_limit or int(config.get("hashing.per_device_in_flight", DEFAULT_PER_DEVICE_IN_FLIGHT)))
+        self._device_cache = {}
+
+    def _device_of(self, fullpath):
+        """Returns the st_dev of a file's directory, stat-ing each directory only once."""
+        directory = os.path.dirname(fullpath)
+        device = self._device_cache.get(directory)
+        if device is None:
+            try:
+                device = os.stat(directory).st_dev
+            except OSError:
+                device = -1
+            self._device_cache[directory] = device
+        return device
+
+    def _run(self, fullpath, args):
+        try:
+            return self.hash_func(fullpath, *args)
+        except Exception:
+            logger.error(f"Hashing failed for {fullpath}", exc_info=True)
+            return None
+
+    def imap(self, items):
+        """
+        Hashes `(file_id, fullpath, *args)` items and yields `(file_id, digest)`
+        pairs in completion order. Items are pulled lazily from `items`, so the
+        input can be a generator over a database cursor.
+        """
+        source = iter(items)
+        lookahead = self.max_workers * 4
+        queues = defaultdict(deque)
+        in_flight = defaultdict(int)
+        pending = {}
+        queued = 0
+        exhausted = False
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hash") as pool:
+            while True:
+                while not exhausted and queued < lookahead:
+                    try:
+                        item = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    queues[self._device_of(item[1])].append(item)
+                    queued += 1
+
+                for device, queue in queues.items():
+                    while queue and in_flight[device] < self.per_device_limit and len(pending) < self.max_workers:
+                        file_id, fullpath, *args = queue.popleft()
+                        queued -= 1
+                        in_flight[device] += 1
+                        pending[pool.submit(self._run, fullpath, args)] = (file_id, device)
+
+                if not pending:
+                    if exhausted and not queued:
+                        return
+                    continue
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_id, device = pending.pop(future)
+                    in_flight[device] -= 1
+                    yield file_id, future.result()
+
+
+def hash_files(hash_func, items, item_count=None):
+    """
+    Hashes `(file_id, fullpath, *args)` items and yields `(file_id, digest)`,
+    using a HashingExecutor when the batch is large enough to benefit from it.
+    """
+    items = list(items) if item_count is None else items
+    count = len(items) if item_count is None else item_count
+    if not should_parallelize(count):
+        for file_id, fullpath, *args in items:
+            yield file_id, hash_func(fullpath, *args)
+        return
+    yield from HashingExecutor(hash_func).imap(items)
@@ -0,0 +1,119 @@
+"""
+File reading for content hashing.
+
+Reading with `f.read(block_size)` allocates a new bytes object per block and
+copies it once more out of Python's buffered reader. For multi-GB videos this
+keeps the allocator busy and caps throughput. `update_from_file` instead
+fills a reusable per-thread `bytearray` with `readinto` on an unbuffered file
+and passes a `memoryview` slice to the hasher, so no block is copied in
+Python.
+
+- `hashing.block_kib` (1024): bytes read per call. Larger blocks mean fewer
+  system calls, and hashlib releases the GIL on each of them.
+- `hashing.fadvise` (true): tells the kernel the file is read sequentially
+  (`posix_fadvise`), which doubles readahead on Linux.
+- `hashing.mmap_min_mib` (0, off): files at least this large are mapped
+  with `mmap` and hashed straight from the page cache. This saves the copy
+  into user space, but it only pays off when the file is already cached, and
+  a file truncated while mapped raises SIGBUS. Use
+  `benchmarks/bench_hashing.py` to compare the modes on your storage.
+"""
+import mmap
+import os
+import threading
+from config import config
+
+DEFAULT_BLOCK_KIB = 1024
+DEFAULT_MMAP_MIN_MIB = 0
+
+MODES = ('read', 'readinto', 'mmap')
+
+_local = threading.local()
+
+
+def _buffer(block_size):
+    """Returns this thread's reusable read buffer of `block_size` bytes."""
+    view = getattr(_local, 'view', None)
+    if view is None or len(view) != block_size:
+        view = memoryview(bytearray(block_size))
+        _local.view = view
+    return view
+
+
+def _advise_sequential(fd):
+    if hasattr(os, 'posix_fadvise') and config.get("hashing.fadvise", True):
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+
+def default_mode(size):
+    """Returns the reading mode for a file of `size` bytes under the current settings."""
+    mmap_min = float(config.get("hashing.mmap_min_mib", DEFAULT_MMAP_MIN_MIB)) * 1024 * 1024
+    return 'mmap' if mmap_min and size >= mmap_min else 'readinto'
+
+
+def update_from_file(hasher, path, ranges=None, block_size=None, mode=None):
+    """
+    Feeds a file into `hasher.update`. With `ranges`, only those
+    `(offset, length)` spans are read; a negative offset counts from the end
+    of the file and a length of None reads to the end. Returns the number
+    of bytes hashed. Raises OSError if the file cannot be read.
+
+    Args:
+        mode (str, optional): 'readinto' (reused buffer), 'mmap', or 'read'
+            (a new bytes object per block, as before). Chosen from the
+            settings if omitted.
+    """
+    block_size = int(block_size or int(config.get("hashing.block_kib", DEFAULT_BLOCK_KIB)) * 1024)
+    with open(path, 'rb', buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        mode = mode or default_mode(size)
+        ranges = [(max(0, offset + size) if offset < 0 else offset, length) for offset, length in ranges or [(0, None)]]
+
+        if mode == 'mmap' and size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                view = memoryview(mapped)
+                try:
+                    total = 0
+                    for offset, length in ranges:
+                        end = size if length is None else min(offset + length, size)
+                        for start in range(offset, end, block_size):
+                            chunk = view[start:min(start + block_size, end)]
+                            hasher.update(chunk)
+                            total += len(chunk)
+                            chunk.release()
+                    return total
+                finally:
+                    view.release()
+
+        _advise_sequential(f.fileno())
+        total = 0
+        if mode == 'read':
+            for offset, length in ranges:
+                f.seek(offset)
+                remaining = float('inf') if length is None else length
+                while remaining > 0:
+                    block = f.read(int(min(block_size, remaining)))
+                    if not block:
+                        break
+                    hasher.update(block)
+                    total += len(block)
+                    remaining -= len(block)
+            return total
+
+        buffer = _buffer(block_size)
+        for offset, length in ranges:
+            f.seek(offset)
+            remaining = float('inf') if length is None else length
+            while remaining > 0:
+                count = f.readinto(buffer[:int(min(block_size, remaining))])
+                if not count:
+                    break
+                hasher.update(buffer[:count])
+                total += count
+                remaining -= count
+        return total
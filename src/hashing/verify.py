@@ -0,0 +1,140 @@
+"""
+Byte-for-byte verification of content duplicate groups.
+
+Equal digests make identical content overwhelmingly likely, but a weak or
+partial hash, a collision or a file changed since it was hashed would still
+put different files in one group. Before files are deleted based on a group,
+`verify_groups` reads all members of the group in lockstep: chunk k of every
+file is read (in parallel) before any chunk k+1. Members are split into
+classes by the bytes they have returned so far. A member left alone in its
+class is dropped and not read any further. Every byte is read once rather
+than once per pair, and a group whose files differ early is rejected after
+its first chunk.
+
+- `verify.chunk_kib` (1024): bytes compared per file and step.
+- `verify.max_open` (64): files of one group held open at once. Larger
+  groups are verified in windows, and the resulting classes are merged by
+  comparing their first files.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import jobs
+from config import config
+from .executor import default_workers
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_KIB = 1024
+DEFAULT_MAX_OPEN = 64
+
+
+def _full_path(roots, info):
+    return os.path.join(roots[info['folder_index']], str(info.get('path') or ''), info['name'])
+
+
+class GroupVerifier:
+    """Splits lists of paths into classes of byte-identical files."""
+
+    def __init__(self, chunk_size=None, max_open=None, workers=None):
+        self.chunk_size = int(chunk_size or int(config.get("verify.chunk_kib", DEFAULT_CHUNK_KIB)) * 1024)
+        self.max_open = max(2, int(max_open or config.get("verify.max_open", DEFAULT_MAX_OPEN)))
+        self.workers = max(1, workers or default_workers())
+        self.bytes_read = 0
+
+    def identical_classes(self, paths, pool):
+        """
+        Returns lists of indices into `paths` whose files are byte-identical,
+        for every class with at least two files. Unreadable files are left out.
+        """
+        classes = []
+        for start in range(0, len(paths), self.max_open):
+            window = list(range(start, min(start + self.max_open, len(paths))))
+            # Classes of earlier windows; those of this window are already distinct
+            earlier = list(classes)
+            for members in self._lockstep([paths[i] for i in window], pool):
+                members = [window[i] for i in members]
+                match = next((existing for existing in earlier if self._same(paths[existing[0]], paths[members[0]], pool)), None)
+                if match is None:
+                    classes.append(members)
+                else:
+                    match.extend(members)
+        return [members for members in classes if len(members) > 1]
+
+    def _same(self, path, other, pool):
+        return len(self._lockstep([path, other], pool, keep_singles=False)) == 1
+
+    def _lockstep(self, paths, pool, keep_singles=True):
+        files = {}
+        for i, path in enumerate(paths):
+            try:
+                files[i] = open(path, 'rb', buffering=0)
+            except OSError as e:
+                logger.error(f"Could not open {path} for verification: {e}")
+        try:
+            # Files of different sizes cannot match; sizes are taken from the open files
+            by_size = {}
+            for i, f in files.items():
+                by_size.setdefault(os.fstat(f.fileno()).st_size, []).append(i)
+            active = [members for members in by_size.values() if len(members) > 1]
+            finished = [members for members in by_size.values() if len(members) == 1] if keep_singles else []
+
+            while active:
+                readers = [i for members in active for i in members]
+                chunks = dict(zip(readers, pool.map(lambda i: self._read(files[i], paths[i]), readers)))
+                still_active = []
+                for members in active:
+                    by_chunk = {}
+                    for i in members:
+                        if chunks[i] is not None:
+                            by_chunk.setdefault(chunks[i], []).append(i)
+                    for chunk, same in by_chunk.items():
+                        self.bytes_read += len(chunk) * len(same)
+                        if len(same) < 2:
+                            if keep_singles:
+                                finished.append(same)
+                        elif chunk:
+                            still_active.append(same)
+                        else:
+                            finished.append(same)
+                active = still_active
+            return finished
+        finally:
+            for f in files.values():
+                f.close()
+
+    def _read(self, f, path):
+        try:
+            chunk = f.read(self.chunk_size)
+            # Unbuffered reads may come back short (e.g. on network shares); members must stay aligned
+            while chunk and len(chunk) < self.chunk_size:
+                more = f.read(self.chunk_size - len(chunk))
+                if not more:
+                    break
+                chunk += more
+            return chunk
+        except OSError as e:
+            logger.error(f"Could not read {path} for verification: {e}")
+            return None
+
+
+def verify_groups(groups, roots, chunk_size=None, max_open=None, workers=None):
+    """
+    Yields the byte-identical subgroups (two files or more) of duplicate
+    groups of file info dicts, in their original order. `roots` maps
+    folder_index to the folder's root path.
+    """
+    verifier = GroupVerifier(chunk_size, max_open, workers)
+    checked = rejected = 0
+    with ThreadPoolExecutor(max_workers=verifier.workers, thread_name_prefix="verify") as pool:
+        for group in groups:
+            jobs.checkpoint()
+            checked += 1
+            paths = [_full_path(roots, info) for info in group]
+            classes = verifier.identical_classes(paths, pool)
+            if len(classes) != 1 or len(classes[0]) != len(group):
+                rejected += 1
+            for members in classes:
+                yield [group[i] for i in sorted(members)]
+    logger.info(f"Verified {checked} groups byte for byte ({verifier.bytes_read / (1024 * 1024):.1f} MiB read); "
+                f"{rejected} did not match in full.")
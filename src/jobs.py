@@ -0,0 +1,122 @@
+"""
+Cancellable, resumable background jobs.
+
+Folder builds and comparisons run as a `Job` on a worker thread. The job is
+made current for that thread while it runs, and the long loops (bulk writes,
+the metadata loop, the folder walk, result storage) call `checkpoint()`
+between units of work. When the job has been cancelled, `checkpoint()` raises
+`JobCancelled`, which unwinds the task like any other error. Cancellation is
+cooperative: a file being hashed is finished first.
+
+Computed metadata is committed in batches as it is produced, so a cancelled
+or interrupted job keeps everything it finished. Each job is recorded in the
+project's `jobs` table with its parameters, status and the last stage it
+reached. A job still marked 'running' when the project is opened was
+interrupted. Running it again resumes it: files that already have their
+values are skipped by every stage.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class JobCancelled(Exception):
+    """Raised by `checkpoint()` once the current job has been asked to stop."""
+
+
+class Job:
+    """
+    A unit of background work that can be cancelled from another thread and
+    is recorded in the project database at `project_path`, if given.
+    `on_progress` receives the `progress.ProgressEvent`s of its stages.
+    """
+
+    def __init__(self, kind, params=None, project_path=None, on_progress=None):
+        self.kind = kind
+        self.params = params or {}
+        self.project_path = project_path
+        self.on_progress = on_progress
+        self.id = None
+        self.stage = None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def checkpoint(self):
+        if self._cancelled.is_set():
+            raise JobCancelled(f"The {self.kind} job was cancelled.")
+
+    def _record(self, record):
+        """Runs `record(conn)` on a short-lived connection; job bookkeeping never fails the job."""
+        if not self.project_path:
+            return
+        import database
+        try:
+            conn = database.get_db_connection(self.project_path)
+            try:
+                return record(conn)
+            finally:
+                conn.close()
+        except Exception:
+            logger.warning(f"Could not record the state of the {self.kind} job.", exc_info=True)
+
+    def start(self):
+        import database
+        self.id = self._record(lambda conn: database.start_job(conn, self.kind, self.params))
+
+    def set_stage(self, stage):
+        import database
+        self.stage = stage
+        if self.id is not None:
+            self._record(lambda conn: database.update_job(conn, self.id, stage=stage))
+
+    def finish(self, status):
+        import database
+        if self.id is not None:
+            self._record(lambda conn: database.update_job(conn, self.id, status=status))
+
+
+def current():
+    """Returns the job running on this thread, or None."""
+    return getattr(_local, 'job', None)
+
+
+def checkpoint():
+    """Raises JobCancelled if the job running on this thread was cancelled."""
+    job = getattr(_local, 'job', None)
+    if job is not None:
+        job.checkpoint()
+
+
+def set_stage(stage):
+    """Records the stage the job running on this thread has reached."""
+    job = getattr(_local, 'job', None)
+    if job is not None:
+        job.set_stage(stage)
+
+
+@contextmanager
+def running(job):
+    """Makes `job` current for this thread and records how it ends: done, cancelled or failed."""
+    previous = current()
+    _local.job = job
+    job.start()
+    status = 'failed'
+    try:
+        yield job
+        status = 'done'
+    except JobCancelled:
+        status = 'cancelled'
+        raise
+    finally:
+        job.finish(status)
+        _local.job = previous
@@ -1,7 +1,13 @@
 import logging
+import os
+import stat
 from pathlib import Path
 from models import FileNode, FolderNode
 import database
+import jobs
+import progress
+from config import config
+from scanner import DirectoryWalker, ScanRecord, file_suffix, is_project_file
 from strategies.strategy_registry import get_strategy
 import itertools
 
@@ -9,11 +15,21 @@ logger = logging.getLogger(__name__)
 
 import time
 
-def build_folder_structure_db(conn, folder_index, root_path, include_subfolders=True):
+def build_folder_structure_db(conn, folder_index, root_path, include_subfolders=True, watcher=None, full_rescan=False):
     """
     Scans a directory and syncs file information into the database using an UPSERT strategy.
     Removes files from the database that are no longer present in the filesystem.
     Returns a list of inaccessible paths.
+
+    If a WatcherService has been tracking the folder since its last full scan,
+    it is caught up and only the changes recorded in its journal are applied.
+
+    Otherwise every file is stat'ed. With the `scan.directory_mtime_shortcut`
+    setting (off by default), directories whose mtime and entry count match
+    the previous scan are not re-stat'ed and their files are assumed
+    unchanged. As an in-place edit of a file does not touch its directory's
+    mtime, `full_rescan` turns the shortcut off for callers that must see
+    every change.
     """
     path_obj = Path(root_path)
     logger.debug(f"Syncing structure for directory: {path_obj} into DB. Subfolders: {include_subfolders}")
@@ -21,110 +37,206 @@ def build_folder_structure_db(conn, folder_index, root_path, include_subfolders=
         logger.warning(f"Path is not a directory, cannot build structure: {path_obj}")
         return [str(path_obj)]
 
-    inaccessible_paths = []
+    if (watcher is not None and watcher.is_live(folder_index, root_path, include_subfolders)
+            and watcher.catch_up(folder_index)):
+        return sync_from_journal(conn, folder_index, root_path, include_subfolders)
+
+    try:
+        os.scandir(path_obj).close()
+    except OSError as e:
+        # Syncing an unreadable root would mark every known file as stale.
+        logger.error(f"Cannot iterate directory {path_obj}: {e}")
+        return [str(path_obj)]
+
     scan_start_time = time.time()
+    known_directories = None
+    if not full_rescan and config.get("scan.directory_mtime_shortcut", False):
+        known_directories = database.get_directories(conn, folder_index)
+    walker = DirectoryWalker(root_path, include_subfolders, known_directories=known_directories,
+                             trusted_before=scan_start_time)
+    with progress.track(f"Scanning {path_obj.name}") as tracker:
+        records = _until_cancelled((r for r in walker.walk() if not is_project_file(r.name)), tracker)
+        # The walk is consumed while loading `records`, so the walker's directory
+        # lists are complete by the time sync_scan_results reads them.
+        sync_scan_results(conn, folder_index, records, scan_start_time, unchanged_dirs=walker.unchanged_directories)
+    database.replace_directories(conn, folder_index, walker.directories)
+    if walker.unchanged_directories:
+        logger.info(f"Skipped {len(walker.unchanged_directories)} unchanged directories in folder_index {folder_index}.")
+    if watcher is not None:
+        watcher.mark_synced(conn, folder_index, root_path, include_subfolders, scan_start_time)
+
+    return walker.inaccessible_paths
+
+def _until_cancelled(records, tracker):
+    """Passes scan records through, counting them and stopping the walk if the running job is cancelled."""
+    for record in records:
+        jobs.checkpoint()
+        tracker.advance(1, record.size)
+        yield record
+
+def _is_within(path, directories):
+    return any(path == d or path.startswith(d + '/') for d in directories)
+
+def sync_from_journal(conn, folder_index, root_path, include_subfolders=True):
+    """
+    Applies the filesystem events journaled for a folder instead of walking it.
+    Touched files are re-stat'ed, and touched directories are rescanned.
+    Returns a list of inaccessible paths.
+    """
+    entries = database.get_journal(conn, folder_index)
+    if not entries:
+        logger.debug(f"No journaled changes for folder_index {folder_index}; nothing to sync.")
+        return []
 
-    nodes_to_sync = []
-    iterator = path_obj.rglob('*') if include_subfolders else path_obj.glob('*')
+    sync_time = time.time()
+    touched_files = set()
+    touched_dirs = set()
+    for _, event, path, name, is_dir in entries:
+        if is_dir:
+            touched_dirs.add(f"{path}/{name}" if path else name)
+        elif not is_project_file(name):
+            touched_files.add((path, name))
 
-    for item in iterator:
+    # Keep only the outermost directories; a rescan covers everything below them.
+    touched_dirs = {d for d in touched_dirs if not any(d.startswith(o + '/') for o in touched_dirs)}
+    touched_files = {(p, n) for p, n in touched_files if not _is_within(p, touched_dirs)}
+
+    walker = DirectoryWalker(root_path, include_subfolders)
+    records = []
+    for path, name in touched_files:
+        full_path = os.path.join(root_path, path, name)
         try:
-            if item.is_file() and not item.name.endswith('.cfp-db'):
-                relative_dir = item.parent.relative_to(root_path).as_posix()
-                # Ensure relative_dir is empty string if it's the root itself
-                if relative_dir == '.':
-                    relative_dir = ''
-                nodes_to_sync.append({
-                    'folder_index': folder_index,
-                    'path': relative_dir,
-                    'name': item.name,
-                    'ext': item.suffix.lower(),
-                    'size': item.stat().st_size,
-                    'modified_date': item.stat().st_mtime,
-                    'last_seen': scan_start_time,
-                    'md5': None,
-                    'llm_embedding': None
-                })
+            st = os.stat(full_path)
+        except FileNotFoundError:
+            continue
         except OSError as e:
-            logger.error(f"Cannot access item {item}: {e}")
-            inaccessible_paths.append(str(item))
+            logger.error(f"Cannot access item {full_path}: {e}")
+            walker.inaccessible_paths.append(full_path)
+            continue
+        if stat.S_ISREG(st.st_mode):
+            records.append(ScanRecord(path, name, file_suffix(name), st.st_size, st.st_mtime))
+    for directory in touched_dirs:
+        if os.path.isdir(os.path.join(root_path, directory)):
+            records.extend(r for r in walker.walk(directory) if not is_project_file(r.name))
+
+    scope = list(touched_files) + [(d, None) for d in touched_dirs]
+    sync_scan_results(conn, folder_index, records, sync_time, scope=scope)
+    database.trim_journal(conn, folder_index, up_to_id=entries[-1][0])
+    logger.info(f"Applied {len(entries)} journaled changes to folder_index {folder_index}.")
+    return walker.inaccessible_paths
+
+def sync_scan_results(conn, folder_index, records, scan_start_time, scope=None, unchanged_dirs=None):
+    """
+    Reconciles a folder's scan results (an iterable of ScanRecord) with the
+    database in one transaction.
+
+    The scan is bulk-loaded into a temporary table, and inserts, metadata resets
+    for changed files and removal of stale files are each done with a single
+    set-based statement instead of per-file round trips.
 
+    By default the scan covers the whole folder and every file it did not see is
+    removed. For partial scans, `scope` lists the (path, name) pairs that were
+    checked; a name of None stands for the whole directory subtree at `path`.
+    Only files inside the scope can then be removed.
+
+    `unchanged_dirs` lists directories the scan skipped because they did not
+    change; the files directly inside them are marked as seen without records.
+    """
     with conn:
-        for node_data in nodes_to_sync:
-            # Check if file already exists
-            cursor = conn.execute(
-                "SELECT id FROM files WHERE folder_index = ? AND path = ? AND name = ?",
-                (node_data['folder_index'], node_data['path'], node_data['name'])
+        conn.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS scan_results (
+                path TEXT,
+                name TEXT,
+                ext TEXT,
+                size INTEGER,
+                modified_date REAL,
+                PRIMARY KEY (path, name)
             )
-            existing_file = cursor.fetchone()
-
-            if existing_file:
-                file_id = existing_file[0]
-                # Get current metadata to check if it changed
-                meta_cursor = conn.execute(
-                    "SELECT size, modified_date FROM file_metadata WHERE file_id = ?",
-                    (file_id,)
-                )
-                meta = meta_cursor.fetchone()
-                
-                # Update existing file's last_seen
-                conn.execute(
-                    "UPDATE files SET last_seen = ? WHERE id = ?",
-                    (node_data['last_seen'], file_id)
-                )
-                
-                if not meta or meta[0] != node_data['size'] or meta[1] != node_data['modified_date']:
-                    # File has changed, reset expensive metadata
-                    database.clear_file_metadata(conn, file_id)
-                    conn.execute(
-                        """
-                        INSERT INTO file_metadata (file_id, size, modified_date, md5, llm_embedding)
-                        VALUES (?, ?, ?, ?, ?)
-                        """,
-                        (file_id, node_data['size'], node_data['modified_date'], None, None)
-                    )
-                    logger.debug(f"File changed: {node_data['name']}. Metadata reset.")
-                else:
-                    # File hasn't changed, just update last_seen (already done)
-                    pass
-            else:
-                # Insert new file
-                cursor = conn.execute(
-                    """
-                    INSERT INTO files (folder_index, path, name, ext, last_seen)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    (node_data['folder_index'], node_data['path'], node_data['name'],
-                     node_data['ext'], node_data['last_seen'])
-                )
-                file_id = cursor.lastrowid
-                conn.execute(
-                    """
-                    INSERT INTO file_metadata (file_id, size, modified_date, md5, llm_embedding)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    (file_id, node_data['size'], node_data['modified_date'],
-                     node_data.get('md5'), node_data.get('llm_embedding'))
-                )
-
-        # Remove files that were not seen in this scan
-        # First, clean up all metadata for these files
-        stale_files_query = "SELECT id FROM files WHERE folder_index = ? AND (last_seen < ? OR last_seen IS NULL)"
-        stale_params = (folder_index, scan_start_time)
-        
-        conn.execute(f"DELETE FROM file_metadata WHERE file_id IN ({stale_files_query})", stale_params)
-        conn.execute(f"DELETE FROM histogram_intersection WHERE file_id IN ({stale_files_query})", stale_params)
-        conn.execute(f"DELETE FROM histogram_correlation WHERE file_id IN ({stale_files_query})", stale_params)
-        conn.execute(f"DELETE FROM histogram_chisqr WHERE file_id IN ({stale_files_query})", stale_params)
-        conn.execute(f"DELETE FROM histogram_bhattacharyya WHERE file_id IN ({stale_files_query})", stale_params)
-
-        delete_cursor = conn.execute(
-            "DELETE FROM files WHERE folder_index = ? AND (last_seen < ? OR last_seen IS NULL)",
-            stale_params
+        """)
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS changed_files (id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM scan_results")
+        conn.execute("DELETE FROM changed_files")
+        conn.executemany(
+            "INSERT OR REPLACE INTO scan_results (path, name, ext, size, modified_date) VALUES (?, ?, ?, ?, ?)",
+            records
         )
+
+        # New files
+        inserted = conn.execute("""
+            INSERT INTO files (folder_index, path, name, ext, last_seen)
+            SELECT ?, s.path, s.name, s.ext, ?
+            FROM scan_results s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM files f
+                WHERE f.folder_index = ? AND f.path = s.path AND f.name = s.name
+            )
+        """, (folder_index, scan_start_time, folder_index)).rowcount
+
+        # Every file found by the scan has been seen now
+        conn.execute("""
+            UPDATE files SET last_seen = ?
+            WHERE folder_index = ? AND EXISTS (
+                SELECT 1 FROM scan_results s
+                WHERE s.path = files.path AND s.name = files.name
+            )
+        """, (scan_start_time, folder_index))
+
+        if unchanged_dirs:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS unchanged_dirs (path TEXT PRIMARY KEY)")
+            conn.execute("DELETE FROM unchanged_dirs")
+            conn.executemany("INSERT OR IGNORE INTO unchanged_dirs (path) VALUES (?)", ((d,) for d in unchanged_dirs))
+            conn.execute("""
+                UPDATE files SET last_seen = ?
+                WHERE folder_index = ? AND path IN (SELECT path FROM unchanged_dirs)
+            """, (scan_start_time, folder_index))
+            conn.execute("DELETE FROM unchanged_dirs")
+
+        # New files and files whose size or modification date changed need
+        # fresh metadata; anything cached for them is reset.
+        conn.execute("""
+            INSERT INTO changed_files (id)
+            SELECT f.id
+            FROM files f
+            JOIN scan_results s ON s.path = f.path AND s.name = f.name
+            LEFT JOIN file_metadata fm ON fm.file_id = f.id
+            WHERE f.folder_index = ?
+              AND (fm.file_id IS NULL
+                   OR fm.size IS NOT s.size
+                   OR fm.modified_date IS NOT s.modified_date)
+        """, (folder_index,))
+        database.delete_metadata_for(conn, "SELECT id FROM changed_files")
+        changed = conn.execute("""
+            INSERT INTO file_metadata (file_id, size, modified_date, md5, llm_embedding)
+            SELECT f.id, s.size, s.modified_date, NULL, NULL
+            FROM changed_files c
+            JOIN files f ON f.id = c.id
+            JOIN scan_results s ON s.path = f.path AND s.name = f.name
+        """).rowcount
+        logger.debug(f"Sync of folder_index {folder_index}: {inserted} new files, {changed - inserted} changed files.")
+
+        # Remove files that were not seen in this scan, together with their metadata
+        stale_condition = "folder_index = ? AND (last_seen < ? OR last_seen IS NULL)"
+        if scope is not None:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS sync_scope (path TEXT, name TEXT)")
+            conn.execute("DELETE FROM sync_scope")
+            conn.executemany("INSERT INTO sync_scope (path, name) VALUES (?, ?)", scope)
+            stale_condition += """ AND EXISTS (
+                SELECT 1 FROM sync_scope sc
+                WHERE (sc.name IS NOT NULL AND files.path = sc.path AND files.name = sc.name)
+                   OR (sc.name IS NULL AND (sc.path = ''
+                                            OR files.path = sc.path
+                                            OR substr(files.path, 1, length(sc.path) + 1) = sc.path || '/'))
+            )"""
+        stale_params = (folder_index, scan_start_time)
+        database.delete_metadata_for(conn, f"SELECT id FROM files WHERE {stale_condition}", stale_params)
+
+        delete_cursor = conn.execute(f"DELETE FROM files WHERE {stale_condition}", stale_params)
         logger.info(f"Removed {delete_cursor.rowcount} obsolete file entries and their metadata for folder_index {folder_index}.")
 
-    return inaccessible_paths
+        conn.execute("DELETE FROM scan_results")
+        conn.execute("DELETE FROM changed_files")
+        if scope is not None:
+            conn.execute("DELETE FROM sync_scope")
 
 def run_comparison(info1, info2, opts):
     """
@@ -0,0 +1,57 @@
+"""
+The duplicate-finding pipeline, independent of any user interface.
+
+`iter_duplicate_groups` syncs the folders, computes the metadata the
+selected strategies need and streams the duplicate groups. The app
+controller runs it on a worker thread; `cli.py` runs it directly.
+"""
+import logging
+from pathlib import Path
+import logic
+import database
+from strategies import find_duplicates_strategy, planner
+from hashing import verify
+
+logger = logging.getLogger(__name__)
+
+
+def iter_duplicate_groups(conn, folders, options, llm_engine=None, watcher=None, on_stage=None, store_results=False):
+    """
+    Syncs and analyzes the folders, then yields duplicate groups (lists of
+    file info dicts) as they are found.
+
+    Args:
+        conn: The project database connection; it must stay open until the
+            generator is exhausted or closed.
+        folders (dict): Maps folder_index to the folder's root path.
+        options (ComparisonOptions): The selected strategies and settings.
+        llm_engine: The loaded LLM engine, if LLM comparison is selected.
+        watcher (WatcherService, optional): Records which folders were synced.
+        on_stage (callable, optional): Called with a status message before each stage.
+        store_results (bool): Write the groups to the project's results table
+            instead, and yield (group_id, file_count) pairs.
+    """
+    report = on_stage or (lambda message: None)
+    file_filter = options.file_type_filter
+    opts_dict = options.to_legacy_dict()
+
+    # A file edited in place keeps its directory's mtime, so content comparison
+    # must not trust the directory shortcut with a stale size and digest.
+    full_rescan = bool(options.compare_content_md5)
+    for folder_index, path in folders.items():
+        report(f"Syncing folder: {Path(path).name}...")
+        logic.build_folder_structure_db(conn, folder_index, path, options.include_subfolders, watcher=watcher,
+                                        full_rescan=full_rescan)
+
+    # Expensive metadata is only computed for files that can still be duplicates
+    all_file_infos = planner.calculate_metadata(conn, folders, opts_dict, file_type_filter=file_filter,
+                                                llm_engine=llm_engine, on_stage=report)
+
+    report("Finding duplicates...")
+    groups = find_duplicates_strategy.iter_groups(conn, opts_dict, file_infos=all_file_infos, folder_index=list(folders))
+    if options.compare_content_md5 and opts_dict.get('verify_content'):
+        report("Finding and verifying duplicates byte for byte...")
+        groups = verify.verify_groups(groups, folders)
+    if store_results:
+        groups = database.store_result_groups(conn, groups, folders)
+    yield from groups
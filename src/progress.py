@@ -0,0 +1,137 @@
+"""
+Structured progress reporting for pipeline stages.
+
+Stages (scanning, hashing, per-file calculators, embedding) open a `Tracker`
+with `track(stage, files_total, bytes_total)` and call `advance` as files are
+done. The tracker turns this into `ProgressEvent`s with throughput (files/s,
+MB/s) and an ETA, and delivers them to the `on_progress` listener of the job
+running on this thread (see `jobs.Job`). Outside a job, or without a
+listener, `advance` only adds to two counters.
+
+Events are throttled to one per `progress.interval` seconds (0.25) per
+stage, plus a final event when the stage ends, so a fast stage does not
+flood the UI queue. `ProgressEvent.to_dict` and `jsonl_listener` provide a
+machine-readable form for headless runs.
+"""
+import json
+import time
+from dataclasses import dataclass, asdict
+from typing import Optional
+from config import config
+import jobs
+
+DEFAULT_INTERVAL = 0.25
+
+
+@dataclass
+class ProgressEvent:
+    """A snapshot of one stage's progress. Totals are None when unknown."""
+    stage: str
+    files_done: int
+    files_total: Optional[int]
+    bytes_done: int
+    bytes_total: Optional[int]
+    elapsed: float
+    files_per_s: float
+    mb_per_s: float
+    eta: Optional[float]
+    finished: bool = False
+
+    @property
+    def percent(self):
+        """Percentage done (0-100) by bytes if their total is known, else by files; None if unknown."""
+        if self.bytes_total:
+            return min(100.0, 100.0 * self.bytes_done / self.bytes_total)
+        if self.files_total:
+            return min(100.0, 100.0 * self.files_done / self.files_total)
+        return 100.0 if self.finished else None
+
+    def describe(self):
+        """A one-line status text, e.g. 'Hashing: 120/800 files, 45.2 MB/s, 0:31 left'."""
+        files = f"{self.files_done}/{self.files_total}" if self.files_total is not None else str(self.files_done)
+        parts = [f"{files} files"]
+        if self.bytes_done:
+            parts.append(f"{self.mb_per_s:.1f} MB/s")
+        else:
+            parts.append(f"{self.files_per_s:.0f} files/s")
+        if self.eta is not None and not self.finished:
+            minutes, seconds = divmod(int(round(self.eta)), 60)
+            parts.append(f"{minutes}:{seconds:02d} left")
+        return f"{self.stage}: " + ", ".join(parts)
+
+    def to_dict(self):
+        event = asdict(self)
+        event['percent'] = self.percent
+        return event
+
+
+class Tracker:
+    """Counts the files and bytes done in one stage and emits throttled events."""
+
+    def __init__(self, stage, files_total=None, bytes_total=None, listener=None, interval=None):
+        self.stage = stage
+        self.files_total = files_total
+        self.bytes_total = bytes_total
+        self.listener = listener
+        self.interval = float(interval if interval is not None else config.get("progress.interval", DEFAULT_INTERVAL))
+        self.files_done = 0
+        self.bytes_done = 0
+        self.started = time.monotonic()
+        self._last_emit = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.finish()
+
+    def advance(self, files=1, nbytes=0):
+        self.files_done += files
+        self.bytes_done += nbytes or 0
+        if self.listener is None:
+            return
+        now = time.monotonic()
+        if self._last_emit is None or now - self._last_emit >= self.interval:
+            self._last_emit = now
+            self.listener(self.event(now))
+
+    def follow(self, results, sizes=None):
+        """
+        Passes `(file_id, value)` pairs through, advancing by one file and
+        `sizes[file_id]` bytes for each.
+        """
+        for file_id, value in results:
+            self.advance(1, sizes.get(file_id, 0) if sizes else 0)
+            yield file_id, value
+
+    def finish(self):
+        """Emits the final event of the stage."""
+        if self.listener is not None:
+            self.listener(self.event(finished=True))
+
+    def event(self, now=None, finished=False):
+        elapsed = max((now or time.monotonic()) - self.started, 1e-9)
+        files_per_s = self.files_done / elapsed
+        bytes_per_s = self.bytes_done / elapsed
+        eta = None
+        if self.bytes_total and bytes_per_s > 0:
+            eta = max(self.bytes_total - self.bytes_done, 0) / bytes_per_s
+        elif self.files_total and files_per_s > 0:
+            eta = max(self.files_total - self.files_done, 0) / files_per_s
+        return ProgressEvent(self.stage, self.files_done, self.files_total, self.bytes_done, self.bytes_total,
+                             elapsed, files_per_s, bytes_per_s / (1024 * 1024), eta, finished)
+
+
+def track(stage, files_total=None, bytes_total=None):
+    """Returns a Tracker reporting to the current job's progress listener, if any."""
+    job = jobs.current()
+    return Tracker(stage, files_total, bytes_total, listener=getattr(job, 'on_progress', None))
+
+
+def jsonl_listener(stream):
+    """Returns a listener that writes each event to `stream` as one JSON line."""
+    def write(event):
+        stream.write(json.dumps(event.to_dict()) + "\n")
+        stream.flush()
+    return write
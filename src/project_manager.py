@@ -48,10 +48,8 @@ class ProjectManager:
                 strategy_opts[key] = getattr(self.controller, key).get()
             
             if meta.has_threshold:
-                threshold_key = f"{key}_threshold"
-                if key == 'compare_histogram': threshold_key = 'histogram_threshold'
-                elif key == 'compare_llm': threshold_key = 'llm_similarity_threshold'
-                
+                threshold_key = ComparisonOptions.threshold_key(key)
+
                 if hasattr(self.controller, threshold_key):
                     val = getattr(self.controller, threshold_key).get()
                     try:
@@ -63,6 +61,10 @@ class ProjectManager:
         # We also need to add 'histogram_method' if it's still hardcoded or handled elsewhere
         if hasattr(self.controller, 'histogram_method'):
             strategy_opts['histogram_method'] = self.controller.histogram_method.get()
+        if hasattr(self.controller, 'hash_algorithm'):
+            strategy_opts['hash_algorithm'] = self.controller.hash_algorithm.get()
+        if hasattr(self.controller, 'verify_content'):
+            strategy_opts['verify_content'] = self.controller.verify_content.get()
 
         return ComparisonOptions(
             file_type_filter=self.controller.file_type_filter.get(),
@@ -136,6 +138,7 @@ class ProjectManager:
             database.create_tables(conn)
             settings = database.load_setting(conn, 'project_settings')
             sources = database.get_sources(conn)
+            stored_groups = database.count_result_groups(conn)
             conn.close()
 
             self.controller.clear_all_settings()
@@ -157,10 +160,20 @@ class ProjectManager:
             self.current_project_path = path
             self.controller.view.root.title(f"{Path(path).name} - Folder Comparison Tool")
             self.controller.view._set_main_ui_state('normal')
+
+            # Results of the last comparison, whether run in the app or with cli.py
+            self.controller.view.results_view.load(path)
+            if stored_groups:
+                self.controller.view.results_view.refresh()
+                self.controller.view.update_status(f"Showing {stored_groups} duplicate sets from the last comparison.")
             logger.info(f"Successfully loaded project: {path}")
         except Exception as e:
             logger.error(f"Failed to load project file: {path}", exc_info=True)
             messagebox.showerror("Error", f"Could not load project file:\n{e}")
+            return
+
+        # A build or comparison that was cancelled or cut off by closing the app
+        self.controller.resume_unfinished_job()
 
     def _apply_settings(self, settings):
         self.controller.file_type_filter.set(settings.get("file_type_filter", "all"))
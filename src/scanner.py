@@ -0,0 +1,123 @@
+import os
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCAN_WORKERS = 8
+# Directory mtimes this close to the start of a scan are not trusted (FAT has a 2 s resolution).
+DIRECTORY_MTIME_SLACK = 2.0
+
+# One scanned file. `path` is the directory relative to the scan root in POSIX
+# form ('' for the root itself); field order matches the scan_results table.
+ScanRecord = namedtuple('ScanRecord', ['path', 'name', 'ext', 'size', 'modified_date'])
+
+
+def is_project_file(name):
+    """True for project databases and their SQLite side files, which are never indexed."""
+    return '.cfp-db' in name
+
+
+def file_suffix(name):
+    """Returns the lower-cased suffix of a file name, like `Path(name).suffix.lower()`."""
+    i = name.rfind('.')
+    if 0 < i < len(name) - 1:
+        return name[i:].lower()
+    return ''
+
+
+class DirectoryWalker:
+    """
+    Walks a directory tree with os.scandir, listing subdirectories concurrently.
+
+    Each file costs a single stat (none at all on Windows, where scandir
+    returns the stat data with the listing), and directories are listed on a
+    thread pool so that per-request latency on network mounts overlaps.
+    Symlinked directories are not followed.
+
+    Given the `known_directories` of a previous walk, a directory whose mtime
+    and entry count are both unchanged is only listed for its subdirectories:
+    its files are not stat'ed or yielded, and its path is collected in
+    `unchanged_directories` instead. Directories modified within
+    DIRECTORY_MTIME_SLACK seconds of `trusted_before` are always rescanned, as
+    a change in the same mtime tick would otherwise go unnoticed.
+    """
+
+    def __init__(self, root_path, include_subfolders=True, max_workers=None,
+                 known_directories=None, trusted_before=None):
+        self.root_path = os.fspath(root_path)
+        self.include_subfolders = include_subfolders
+        self.max_workers = max(1, max_workers or int(config.get("scan.workers", DEFAULT_SCAN_WORKERS)))
+        self.known_directories = known_directories or {}
+        self.trusted_before = (trusted_before if trusted_before is not None else time.time()) - DIRECTORY_MTIME_SLACK
+        self.inaccessible_paths = []
+        # (relative path, mtime, entry count) of every directory listed without errors
+        self.directories = []
+        self.unchanged_directories = []
+
+    def _is_unchanged(self, relative_dir, mtime, entry_count):
+        return mtime < self.trusted_before and self.known_directories.get(relative_dir) == (mtime, entry_count)
+
+    def _scan_directory(self, relative_dir):
+        """Lists one directory. Returns (records, subdirectories, errors, directory_info)."""
+        directory = os.path.join(self.root_path, relative_dir) if relative_dir else self.root_path
+        records, subdirs, errors = [], [], []
+        try:
+            mtime = os.stat(directory).st_mtime
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError as e:
+            logger.error(f"Cannot iterate directory {directory}: {e}")
+            return records, subdirs, [directory], None
+
+        unchanged = self._is_unchanged(relative_dir, mtime, len(entries))
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if self.include_subfolders:
+                        subdirs.append(f"{relative_dir}/{entry.name}" if relative_dir else entry.name)
+                elif not unchanged and entry.is_file():
+                    st = entry.stat()
+                    records.append(ScanRecord(relative_dir, entry.name, file_suffix(entry.name), st.st_size, st.st_mtime))
+            except OSError as e:
+                logger.error(f"Cannot access item {entry.path}: {e}")
+                errors.append(entry.path)
+        # A directory with unreadable entries is not recorded, so it is rescanned next time.
+        directory_info = None if errors else (relative_dir, mtime, len(entries), unchanged)
+        return records, subdirs, errors, directory_info
+
+    def _collect(self, errors, directory_info):
+        self.inaccessible_paths.extend(errors)
+        if directory_info is not None:
+            relative_dir, mtime, entry_count, unchanged = directory_info
+            self.directories.append((relative_dir, mtime, entry_count))
+            if unchanged:
+                self.unchanged_directories.append(relative_dir)
+
+    def walk(self, start=''):
+        """
+        Yields a ScanRecord for every file under the root, or only under the
+        relative directory `start` if given. Paths that could not be read are
+        collected in `inaccessible_paths`.
+        """
+        if self.max_workers == 1:
+            pending_dirs = [start]
+            while pending_dirs:
+                records, subdirs, errors, directory_info = self._scan_directory(pending_dirs.pop())
+                self._collect(errors, directory_info)
+                pending_dirs.extend(subdirs)
+                yield from records
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="scan") as pool:
+            pending = {pool.submit(self._scan_directory, start)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    records, subdirs, errors, directory_info = future.result()
+                    self._collect(errors, directory_info)
+                    pending.update(pool.submit(self._scan_directory, subdir) for subdir in subdirs)
+                    yield from records
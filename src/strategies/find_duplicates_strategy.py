@@ -1,38 +1,120 @@
 from .strategy_registry import get_strategy
 import database
+import itertools
 from pathlib import Path
 from config import config
+from .histogram import engine as histogram_engine
+from .histogram.database import HistogramDatabase
+from .llm import ann_index
+from .phash import hamming_index
+from .phash.comparator import DEFAULT_MAX_DISTANCE
+from .phash.database import PHashDatabase
+
+FILE_INFO_COLUMNS = [
+    'id', 'folder_index', 'path', 'name', 'ext', 'last_seen',
+    'size', 'modified_date', 'md5', 'llm_embedding'
+]
+
+# Strategies that split groups by similarity rather than by an exact key
+SIMILARITY_KEYS = ('phash', 'llm_embedding', 'histogram')
+
+def _query_groups(conn, group_by_parts, where_clauses, params):
+    """
+    Yields every group of files sharing all `group_by_parts` values, as lists of
+    file info dicts.
+
+    The duplicate keys are collected once, then all group members are read in
+    one query ordered by those keys and split into groups in a single pass
+    while the cursor streams. There is no query per group and no GROUP_CONCAT
+    id list to parse. The key scan drives from file_metadata so that SQLite can
+    walk the (size, md5, file_id) covering index instead of sorting the join.
+    """
+    keys = ", ".join(group_by_parts)
+    where = " AND ".join(where_clauses)
+    key_columns = ", ".join(f"{part} AS key{i}" for i, part in enumerate(group_by_parts))
+    key_match = " AND ".join(f"{part} = d.key{i}" for i, part in enumerate(group_by_parts))
+    query = f"""
+        WITH d AS (
+            SELECT {key_columns}
+            FROM file_metadata fm
+            CROSS JOIN files f ON f.id = fm.file_id
+            WHERE {where}
+            GROUP BY {keys}
+            HAVING COUNT(f.id) > 1
+        )
+        SELECT {keys}, f.id, f.folder_index, f.path, f.name, f.ext, f.last_seen,
+               fm.size, fm.modified_date, fm.md5, fm.llm_embedding
+        FROM d
+        JOIN file_metadata fm
+        JOIN files f ON f.id = fm.file_id
+        WHERE {where} AND {key_match}
+        ORDER BY {keys}, f.id
+    """
+    key_count = len(group_by_parts)
+    cursor = conn.execute(query, params + params)
+    for _, rows in itertools.groupby(cursor, key=lambda row: row[:key_count]):
+        yield [dict(zip(FILE_INFO_COLUMNS, row[key_count:])) for row in rows]
 
 def run(conn, opts, folder_index=None, file_infos=None):
     """
     Finds duplicate files using a single SQL query based on selected strategies,
     and then optionally refines the results with histogram comparison.
+    Returns the list of all groups; see `iter_groups` to stream them instead.
     """
-    selected_strategies = []
-    if 'options' in opts:
-        for option, value in opts['options'].items():
-            if value and option.startswith('compare_'):
-                strategy = get_strategy(option)
-                if strategy:
-                    selected_strategies.append(strategy)
-
-    if not selected_strategies:
-        return []
+    return list(iter_groups(conn, opts, folder_index=folder_index, file_infos=file_infos))
 
+def selected_strategies(opts):
+    """
+    Returns the strategies selected in `opts` as the GROUP BY parts of the
+    exact-match strategies and a dict of the similarity strategies by db_key.
+    """
     group_by_parts = []
-    histogram_strategy = None
-    for strategy in selected_strategies:
-        if hasattr(strategy, 'get_duplicates_query_part'):
-            if strategy.db_key == 'histogram':
-                histogram_strategy = strategy
-            else:
-                group_by_parts.append(strategy.get_duplicates_query_part())
+    similarity = {}
+    for option, value in opts.get('options', {}).items():
+        if value and option.startswith('compare_'):
+            strategy = get_strategy(option)
+            if strategy and hasattr(strategy, 'get_duplicates_query_part'):
+                if strategy.db_key in SIMILARITY_KEYS:
+                    similarity[strategy.db_key] = strategy
+                else:
+                    group_by_parts.append(strategy.get_duplicates_query_part())
+    return group_by_parts, similarity
+
+def refinements(conn, opts, similarity):
+    """
+    Returns (db_key, refine) pairs for the selected similarity strategies, in
+    the order they are applied. `refine(group)` yields the subgroups of a group.
+    """
+    steps = []
+    # Cluster images whose perceptual hashes are within the Hamming distance
+    if 'phash' in similarity:
+        max_distance = int(float(opts.get('compare_phash_threshold', DEFAULT_MAX_DISTANCE)))
+        steps.append(('phash', lambda group: _refine_by_phash(conn, group, max_distance)))
+    # Cluster by semantic similarity; large groups are searched with the ANN index
+    if 'llm_embedding' in similarity:
+        threshold = float(opts.get('llm_similarity_threshold', 0.8))
+        steps.append(('llm_embedding', lambda group: ann_index.similar_groups(conn, group, threshold)))
+    # Further refine the groups based on histogram similarity
+    if 'histogram' in similarity:
+        steps.append(('histogram', lambda group: _refine_by_histogram(conn, group, opts)))
+    return steps
+
+def iter_groups(conn, opts, folder_index=None, file_infos=None):
+    """
+    Yields duplicate groups one at a time, as lists of file info dicts, while
+    the underlying query streams. The connection must stay open until the
+    generator is exhausted or closed.
+    """
+    group_by_parts, similarity = selected_strategies(opts)
+    if not group_by_parts and not similarity:
+        return
 
     duplicate_groups = []
     if group_by_parts:
-        group_by_clause = ", ".join(group_by_parts)
         params = []
-        where_clauses = []
+        # Files missing a grouping value (e.g. an MD5 that was never computed
+        # because the file's size is unique) cannot be duplicates.
+        where_clauses = [f"{part} IS NOT NULL" for part in group_by_parts]
 
         # Handle folder_index filter
         if folder_index is not None:
@@ -51,84 +133,45 @@ def run(conn, opts, folder_index=None, file_infos=None):
                 where_clauses.append(f"f.ext IN ({ext_placeholders})")
                 params.extend(extensions)
 
-        # Construct the final query
-        query = f"""
-            SELECT GROUP_CONCAT(f.id)
-            FROM files f
-            JOIN file_metadata fm ON f.id = fm.file_id
-        """
-        if where_clauses:
-            query += " WHERE " + " AND ".join(where_clauses)
-
-        query += f"""
-            GROUP BY {group_by_clause}
-            HAVING COUNT(f.id) > 1
-        """
-
-        # Execute the query to get groups of duplicate file IDs
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        duplicate_id_groups = [row[0].split(',') for row in cursor.fetchall()]
-
-        # Fetch file info for each group
-        for id_group in duplicate_id_groups:
-            group_infos = []
-            rows = database.get_files_by_ids(conn, id_group)
-            if rows:
-                columns = [
-                    'id', 'folder_index', 'path', 'name', 'ext', 'last_seen',
-                    'size', 'modified_date', 'md5', 'llm_embedding'
-                ]
-                for row in rows:
-                    file_info = dict(zip(columns, row))
-                    if isinstance(file_info.get('path'), str):
-                        file_info['path'] = Path(file_info['path'])
-                    group_infos.append(file_info)
-
-            if group_infos:
-                duplicate_groups.append(group_infos)
+        duplicate_groups = _query_groups(conn, group_by_parts, where_clauses, params)
     elif file_infos:
         duplicate_groups = [file_infos]
 
+    if not similarity:
+        yield from duplicate_groups
+        return
+
+    if not group_by_parts and file_infos is None:
+        # If only similarity strategies are selected, get all files as a single group
+        rows = database.get_all_files(conn, folder_index, file_type_filter=opts.get("file_type_filter", "all"))
+        file_infos = [dict(zip(FILE_INFO_COLUMNS, row)) for row in rows]
+        for info in file_infos:
+            if isinstance(info.get('path'), str):
+                info['path'] = Path(info['path'])
+        duplicate_groups = [file_infos]
+
+    for _, refine in refinements(conn, opts, similarity):
+        duplicate_groups = (subgroup for group in duplicate_groups for subgroup in refine(group))
+    yield from duplicate_groups
+
+def _refine_by_phash(conn, group, max_distance):
+    """Splits a group into clusters of files whose perceptual hashes are near each other."""
+    missing = [info['id'] for info in group if 'phash' not in info and info.get('id') is not None]
+    loaded = PHashDatabase().load_many(conn, missing) if missing else {}
+    hashes = [info['phash'] if 'phash' in info else loaded.get(info.get('id')) for info in group]
+    for positions in hamming_index.similar_groups(hashes, max_distance):
+        yield [group[i] for i in positions]
 
-    if histogram_strategy:
-        if not group_by_parts and not file_infos:
-            # If only histogram is selected, get all files as a single group
-            rows = database.get_all_files(conn, folder_index, file_type_filter=opts.get("file_type_filter", "all"))
-            columns = [
-                'id', 'folder_index', 'path', 'name', 'ext', 'last_seen',
-                'size', 'modified_date', 'md5', 'llm_embedding'
-            ]
-            file_infos = [dict(zip(columns, row)) for row in rows]
-            for info in file_infos:
-                if isinstance(info.get('path'), str):
-                    info['path'] = Path(info['path'])
-            duplicate_groups = [file_infos]
-
-        # Further refine the groups based on histogram similarity
-        print("Performing histogram comparison")
-        final_groups = []
-        for group in duplicate_groups:
-            print(f"Processing group: {group}")
-            while len(group) > 1:
-                file1 = group.pop(0)
-                new_group = [file1]
-                remaining_files = []
-                for file2 in group:
-                    hist1 = file1.get('histogram')
-                    hist2 = file2.get('histogram')
-                    if hist1 and hist2:
-                        similarity = histogram_strategy.compare(hist1, hist2, opts.get('histogram_method'))
-                        print(f"Similarity between {file1['name']} and {file2['name']}: {similarity}")
-                        if similarity >= float(opts.get('histogram_threshold')):
-                            new_group.append(file2)
-                        else:
-                            remaining_files.append(file2)
-                    else:
-                        remaining_files.append(file2)
-                group = remaining_files
-                if len(new_group) > 1:
-                    final_groups.append(new_group)
-        return final_groups
-
-    return duplicate_groups
\ No newline at end of file
+def _refine_by_histogram(conn, group, opts):
+    """
+    Splits a group greedily into subgroups of files with similar histograms.
+
+    Histograms not already attached to the file infos are loaded from the
+    project database, and all pairs are scored by the batched engine.
+    """
+    method = opts.get('histogram_method') or 'Correlation'
+    missing = [info['id'] for info in group if 'histogram' not in info and info.get('id') is not None]
+    loaded = HistogramDatabase().load_many(conn, missing) if missing else {}
+    histograms = [info['histogram'] if 'histogram' in info else loaded.get(info.get('id')) for info in group]
+    for indices in histogram_engine.group_similar(histograms, method, float(opts.get('histogram_threshold'))):
+        yield [group[i] for i in indices]
@@ -1,8 +1,7 @@
-import cv2
 import numpy as np
-from PIL import Image
 import logging
 from ..base_calculator import BaseCalculator
+from .. import image_loader
 
 logger = logging.getLogger(__name__)
 
@@ -28,31 +27,29 @@ class HistogramCalculator(BaseCalculator):
         logger.info(f"Calculator called for {file_node.fullpath} with opts {opts}")
         if not opts.get('compare_histogram'):
             return None
+        # Imported on use so that discovering calculators does not load OpenCV
+        import cv2
 
         try:
-            with Image.open(file_node.fullpath) as img:
-                # Ensure image is in a consistent format
-                img = img.convert('RGB')
-                # Resize for consistency
-                img = img.resize((256, 256))
+            # Decoded at reduced resolution and shared with the other image calculators
+            img = image_loader.load_resized(file_node.fullpath, (256, 256))
+            # Using numpy to create the histogram
+            np_img = np.array(img)
 
-                # Using numpy to create the histogram
-                np_img = np.array(img)
+            # Calculate histogram for each channel and concatenate
+            hist_r = cv2.calcHist([np_img], [0], None, [256], [0, 256])
+            hist_g = cv2.calcHist([np_img], [1], None, [256], [0, 256])
+            hist_b = cv2.calcHist([np_img], [2], None, [256], [0, 256])
 
-                # Calculate histogram for each channel and concatenate
-                hist_r = cv2.calcHist([np_img], [0], None, [256], [0, 256])
-                hist_g = cv2.calcHist([np_img], [1], None, [256], [0, 256])
-                hist_b = cv2.calcHist([np_img], [2], None, [256], [0, 256])
+            # Normalize and concatenate
+            cv2.normalize(hist_r, hist_r)
+            cv2.normalize(hist_g, hist_g)
+            cv2.normalize(hist_b, hist_b)
 
-                # Normalize and concatenate
-                cv2.normalize(hist_r, hist_r)
-                cv2.normalize(hist_g, hist_g)
-                cv2.normalize(hist_b, hist_b)
+            # Concatenate histograms
+            hist = np.concatenate((hist_r, hist_g, hist_b))
 
-                # Concatenate histograms
-                hist = np.concatenate((hist_r, hist_g, hist_b))
-
-                return hist.tobytes()
+            return hist.tobytes()
 
         except Exception as e:
             logger.error(f"Could not calculate histogram for {file_node.fullpath}: {e}")
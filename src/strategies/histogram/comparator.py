@@ -1,4 +1,3 @@
-import cv2
 import numpy as np
 from ..base_comparison_strategy import BaseComparisonStrategy, StrategyMetadata
 
@@ -44,6 +43,8 @@ class HistogramComparator(BaseComparisonStrategy):
         """
         if not hist1 or not hist2:
             return 0.0
+        # Imported on use so that discovering strategies does not load OpenCV
+        import cv2
 
         # Convert bytes back to numpy arrays
         hist1 = np.frombuffer(hist1, dtype=np.float32)
@@ -0,0 +1,164 @@
+"""
+Batched histogram similarity engine.
+
+All histograms of a candidate group are stacked into one float32 matrix and
+converted once to the float64 operands of the chosen method. The scores
+between a block of pivot rows and the remaining rows are then computed tile
+by tile with NumPy matrix operations that reproduce `cv2.compareHist`:
+
+- Correlation:   centered, L2-normalized rows multiplied together.
+- Chi-Square:    sum((a - b)^2 / a) expanded into three matrix products.
+- Intersection:  sum(min(a, b)), broadcast over a tile of rows and columns.
+- Bhattacharyya: sqrt(1 - sqrt(a) . sqrt(b) / sqrt(sum(a) * sum(b))).
+
+Grouping is the same greedy walk as the pairwise loop it replaces: the first
+unassigned file becomes a pivot, and every later unassigned file whose score
+against the pivot is >= threshold joins its group. `histogram.block_mib`
+caps the score block and each tile's temporaries; the operands themselves
+take 8 bytes per bin and file for each matrix the method needs.
+"""
+import logging
+import numpy as np
+from config import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_MIB = 64
+METHODS = ('Correlation', 'Chi-Square', 'Intersection', 'Bhattacharyya')
+
+# Tolerances used by cv2.compareHist
+DBL_EPSILON = np.finfo(np.float64).eps
+FLT_EPSILON = np.finfo(np.float32).eps
+
+
+def stack_histograms(histograms):
+    """
+    Stacks histogram blobs (float32 bytes) into a matrix. Returns the matrix and
+    a boolean mask of which entries had a histogram; missing or empty entries,
+    and entries whose length differs from the first one, get a zero row.
+    """
+    length = next((len(h) for h in histograms if h), 0) // 4
+    matrix = np.zeros((len(histograms), length), dtype=np.float32)
+    present = np.zeros(len(histograms), dtype=bool)
+    for i, hist in enumerate(histograms):
+        if hist and len(hist) == length * 4:
+            matrix[i] = np.frombuffer(hist, dtype=np.float32)
+            present[i] = True
+    return matrix, present
+
+
+class _Scorer:
+    """Per-method float64 operands over the histogram matrix, scored tile by tile."""
+
+    def __init__(self, matrix, method):
+        if method not in METHODS:
+            raise ValueError(f"Unknown histogram comparison method: {method}")
+        self.method = method
+        self.bins = matrix.shape[1]
+        data = matrix.astype(np.float64)
+        if method == 'Correlation':
+            self.features = data - data.mean(axis=1, keepdims=True)
+            self.norms = np.sqrt((self.features * self.features).sum(axis=1))
+        elif method == 'Chi-Square':
+            mask = np.abs(data) > DBL_EPSILON
+            self.data = data
+            self.pivot_sum = np.where(mask, data, 0.0).sum(axis=1)
+            self.pivot_mask = mask.astype(np.float64)
+            with np.errstate(divide='ignore'):
+                self.pivot_inverse = np.where(mask, 1.0 / np.where(mask, data, 1.0), 0.0)
+            self.squares = data * data
+        elif method == 'Bhattacharyya':
+            with np.errstate(invalid='ignore'):
+                self.roots = np.sqrt(data)
+            self.sums = data.sum(axis=1)
+        else:
+            self.data = data
+
+    def tile_shape(self, columns, budget):
+        """
+        Returns (tile_rows, tile_columns) such that the rows and columns
+        gathered for one tile, and the broadcast used by Intersection, each
+        take at most `budget` bytes.
+        """
+        row_bytes = 8 * self.bins
+        tile_columns = max(1, min(columns, budget // row_bytes))
+        if self.method == 'Intersection':
+            return max(1, budget // (row_bytes * tile_columns)), tile_columns
+        return max(1, budget // row_bytes), tile_columns
+
+    def scores(self, rows, columns, tile_rows, tile_columns):
+        """Returns the rows x columns score matrix of pivots `rows` against files `columns`."""
+        result = np.empty((len(rows), len(columns)), dtype=np.float64)
+        for row_start in range(0, len(rows), tile_rows):
+            tile_row_ids = rows[row_start:row_start + tile_rows]
+            for column_start in range(0, len(columns), tile_columns):
+                tile_column_ids = columns[column_start:column_start + tile_columns]
+                result[row_start:row_start + len(tile_row_ids),
+                       column_start:column_start + len(tile_column_ids)] = self._tile(tile_row_ids, tile_column_ids)
+        return result
+
+    def _tile(self, rows, columns):
+        if self.method == 'Correlation':
+            num = self.features[rows] @ self.features[columns].T
+            denom = np.outer(self.norms[rows], self.norms[columns])
+            return np.where(denom > DBL_EPSILON, num / np.where(denom > DBL_EPSILON, denom, 1.0), 1.0)
+        if self.method == 'Chi-Square':
+            return (self.pivot_sum[rows][:, None]
+                    - 2.0 * (self.pivot_mask[rows] @ self.data[columns].T)
+                    + self.pivot_inverse[rows] @ self.squares[columns].T)
+        if self.method == 'Bhattacharyya':
+            overlap = self.roots[rows] @ self.roots[columns].T
+            scale = np.outer(self.sums[rows], self.sums[columns])
+            usable = np.abs(scale) > FLT_EPSILON
+            scale = np.where(usable, 1.0 / np.sqrt(np.where(usable, np.abs(scale), 1.0)), 1.0)
+            return np.sqrt(np.maximum(1.0 - overlap * scale, 0.0))
+        # Intersection has no matrix-product form; the tile is broadcast instead.
+        return np.minimum(self.data[rows][:, None, :], self.data[columns][None, :, :]).sum(axis=2)
+
+
+def group_similar(histograms, method='Correlation', threshold=0.9, block_mib=None):
+    """
+    Greedily groups histograms (a list of float32 blobs or None) by similarity.
+
+    Returns lists of indices into `histograms`, each with at least two members,
+    in the order the greedy walk produces them.
+    """
+    count = len(histograms)
+    if count < 2:
+        return []
+    matrix, present = stack_histograms(histograms)
+    if not matrix.shape[1]:
+        return []
+    scorer = _Scorer(matrix, method)
+    threshold = float(threshold)
+
+    # Size blocks so one block of float64 scores stays within the memory
+    # budget, and tiles so each temporary used to score it does too.
+    budget = int(float(block_mib or config.get("histogram.block_mib", DEFAULT_BLOCK_MIB)) * 1024 * 1024)
+    block_rows = max(1, budget // (8 * count))
+    tile_rows, tile_columns = scorer.tile_shape(count, budget)
+
+    assigned = ~present
+    positions = np.arange(count)
+    groups = []
+    for block_start in range(0, count, block_rows):
+        candidates = positions[block_start:block_start + block_rows]
+        pivots = candidates[~assigned[candidates]]
+        if not len(pivots):
+            continue
+        columns = positions[block_start + 1:]
+        if not len(columns):
+            break
+        scores = scorer.scores(pivots, columns, tile_rows, tile_columns) >= threshold
+        for row, pivot in enumerate(pivots):
+            if assigned[pivot]:
+                continue
+            assigned[pivot] = True
+            offset = pivot - block_start
+            matches = scores[row, offset:] & ~assigned[pivot + 1:]
+            if matches.any():
+                members = np.flatnonzero(matches) + pivot + 1
+                assigned[members] = True
+                groups.append([int(pivot)] + members.tolist())
+    logger.debug(f"Histogram engine grouped {count} files into {len(groups)} groups ({method}, threshold {threshold}).")
+    return groups
@@ -0,0 +1,94 @@
+"""
+Shared, reduced-resolution image decoding for the image calculators.
+
+Feature extraction never needs full resolution: histograms are taken at
+256x256, perceptual hashes at 32x32 and the LLM's vision encoder works at
+336x336. `load_thumbnail` decodes straight to about `image.thumbnail_side`
+pixels. For JPEGs it uses draft mode, so libjpeg scales by 1/2, 1/4 or 1/8
+in the DCT and never builds the full-size bitmap. Other formats are shrunk
+with `Image.reduce` before resampling. Each calculator then resizes the
+thumbnail to its own size.
+
+Decoded thumbnails are kept in a small LRU cache keyed by path, size and
+mtime. The calculators run one after another for each file, so several
+image strategies in one run decode each image once.
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+from config import config
+
+DEFAULT_THUMBNAIL_SIDE = 672
+DEFAULT_CACHE_ENTRIES = 8
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def is_image(ext):
+    """Whether a file extension is one of the `file_extensions.image` types."""
+    return (ext or '').lower() in {e.lower() for e in config.get("file_extensions.image", [])}
+
+
+def _decode(path, side):
+    with Image.open(path) as img:
+        # JPEG: pick the largest DCT scale that keeps both sides >= `side`
+        img.draft('RGB', (side, side))
+        # Other formats: integer-factor reduce() before the final resample
+        img.thumbnail((side, side), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        return img.convert('RGB')
+
+
+def load_thumbnail(path, side=None):
+    """
+    Returns an RGB image no larger than `side` x `side` (keeping the aspect
+    ratio), decoded at reduced resolution. The returned image is shared
+    through the cache, so callers must not modify it in place.
+    Raises OSError if the file cannot be read or decoded.
+    """
+    side = int(side or config.get("image.thumbnail_side", DEFAULT_THUMBNAIL_SIDE))
+    stat = os.stat(path)
+    key = (os.path.abspath(path), side, stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        image = _cache.get(key)
+        if image is not None:
+            _cache.move_to_end(key)
+            return image
+    image = _decode(path, side)
+    with _lock:
+        _cache[key] = image
+        while len(_cache) > int(config.get("image.cache_entries", DEFAULT_CACHE_ENTRIES)):
+            _cache.popitem(last=False)
+    return image
+
+
+def load_resized(path, size, mode='RGB'):
+    """Returns the image resized to exactly `size` (width, height) in `mode`, via the cached thumbnail."""
+    return load_thumbnail(path).convert(mode).resize(size, Image.Resampling.LANCZOS)
+
+
+def encoded_thumbnail(path, side=None):
+    """
+    Returns the file's bytes if the image is at most `side` pixels on its
+    longest side or cannot be identified by Pillow, otherwise the cached
+    thumbnail encoded as PNG.
+    """
+    side = int(side or config.get("image.thumbnail_side", DEFAULT_THUMBNAIL_SIDE))
+    try:
+        with Image.open(path) as img:
+            small_enough = max(img.size) <= side
+    except Image.UnidentifiedImageError:
+        small_enough = True
+    if small_enough:
+        with open(path, 'rb') as f:
+            return f.read()
+    buffer = io.BytesIO()
+    load_thumbnail(path, side).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
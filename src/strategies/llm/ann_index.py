@@ -0,0 +1,338 @@
+"""
+Approximate nearest-neighbour index over the LLM image embeddings.
+
+The index is an inverted file (IVF): embeddings are L2-normalized, a spherical
+k-means splits them into `nlist` clusters, and each cluster's vectors are
+stored contiguously as float16. An all-pairs threshold search only compares a
+vector against the clusters of its `nprobe` nearest centroids, so the work
+grows with n * nprobe * (n / nlist) instead of n^2.
+
+Small candidate sets skip the index and are compared exactly in blocks.
+
+The index is persisted in a `<project>.llm_index` directory next to the
+project database, with the vectors in a memory-mapped .npy file. It is
+rebuilt when any embedding has been written, added or removed since, which
+is counted exactly by triggers on `file_metadata` (see `database.MIGRATIONS`).
+"""
+import json
+import logging
+import os
+import shutil
+import numpy as np
+import database
+from config import config
+from ..union_find import UnionFind
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+DEFAULT_EXACT_LIMIT = 4096
+DEFAULT_NPROBE = 8
+DEFAULT_BLOCK_MIB = 64
+KMEANS_ITERATIONS = 10
+KMEANS_MAX_SAMPLE = 25000
+READ_BATCH = 2048
+
+
+def normalize(vectors):
+    """Returns float32 copies of the rows scaled to unit length; zero rows stay zero."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def _block_rows(columns, block_mib=None):
+    budget = float(block_mib or config.get("llm.block_mib", DEFAULT_BLOCK_MIB)) * 1024 * 1024
+    return max(1, int(budget // (4 * max(columns, 1))))
+
+
+def exact_pairs(vectors, threshold, block_mib=None):
+    """
+    Yields (i, j) arrays of all pairs i < j whose cosine similarity is >= threshold.
+    `vectors` must already be normalized.
+    """
+    count = len(vectors)
+    block = _block_rows(count, block_mib)
+    for start in range(0, count, block):
+        scores = vectors[start:start + block] @ vectors.T
+        rows, cols = np.nonzero(scores >= threshold)
+        keep = cols > rows + start
+        yield rows[keep] + start, cols[keep]
+
+
+def cluster(count, pairs):
+    """Joins the (i, j) pair arrays from a search with union-find and returns the groups."""
+    sets = UnionFind(count)
+    for rows, cols in pairs:
+        for a, b in zip(rows.tolist(), cols.tolist()):
+            sets.union(a, b)
+    return sets.groups()
+
+
+def fingerprint(conn):
+    """Identifies the state of the embeddings; the index is stale when this changes."""
+    return {'embedding_generation': database.get_embedding_generation(conn)}
+
+
+def index_path(conn):
+    """Returns the index directory next to the connection's database file, or None for in-memory databases."""
+    row = conn.execute("PRAGMA database_list").fetchone()
+    db_file = row[2] if row else ''
+    if not db_file:
+        return None
+    return os.path.splitext(db_file)[0] + '.llm_index'
+
+
+class EmbeddingIndex:
+    """IVF index: centroids, and per-list contiguous runs of file ids and vectors."""
+
+    def __init__(self, centroids, offsets, ids, vectors, meta=None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+        self.vectors = vectors
+        self.meta = meta or {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    # --- Building ---
+
+    @classmethod
+    def build(cls, conn, path=None, nlist=None, seed=0):
+        """Trains and fills an index from every embedding in `file_metadata`, writing it to `path` if given."""
+        ids, dim = cls._embedded_ids(conn)
+        if not len(ids):
+            return cls(np.zeros((0, 0), np.float32), np.zeros(1, np.int64), ids, np.zeros((0, 0), np.float16))
+        nlist = int(nlist or config.get("llm.index_lists", 0) or max(1, int(4 * np.sqrt(len(ids)))))
+        nlist = min(nlist, len(ids))
+        rng = np.random.default_rng(seed)
+
+        sample_ids = np.sort(rng.choice(ids, size=min(len(ids), max(nlist * 8, 1000), KMEANS_MAX_SAMPLE), replace=False))
+        sample = normalize([v for _, v in cls._read_vectors(conn, dim, sample_ids)])
+        centroids = _spherical_kmeans(sample, nlist, rng)
+        del sample
+
+        # First pass assigns every vector to a list; the second writes each
+        # vector into its list's slot so that lists are contiguous on disk.
+        assignment = np.empty(len(ids), dtype=np.int32)
+        for start, chunk in cls._read_chunks(conn, dim):
+            assignment[start:start + len(chunk)] = _nearest(normalize(chunk), centroids, 1)[:, 0]
+        order = np.argsort(assignment, kind='stable')
+        slots = np.empty_like(order)
+        slots[order] = np.arange(len(order))
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignment, minlength=nlist))
+
+        if path:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.makedirs(path)
+            vectors = np.lib.format.open_memmap(os.path.join(path, 'vectors.npy'), mode='w+',
+                                                dtype=np.float16, shape=(len(ids), dim))
+        else:
+            vectors = np.empty((len(ids), dim), dtype=np.float16)
+        for start, chunk in cls._read_chunks(conn, dim):
+            vectors[slots[start:start + len(chunk)]] = normalize(chunk)
+
+        meta = {'version': INDEX_VERSION, 'dim': dim, 'nlist': nlist, 'fingerprint': fingerprint(conn)}
+        index = cls(centroids, offsets, ids[order], vectors, meta)
+        if path:
+            vectors.flush()
+            index.save(path)
+        logger.info(f"Built LLM embedding index with {len(ids)} vectors in {nlist} lists.")
+        return index
+
+    @staticmethod
+    def _embedded_ids(conn):
+        """Returns the ids of files with an embedding of the most common length, and that length."""
+        lengths = conn.execute("""
+            SELECT length(llm_embedding) AS bytes, COUNT(*) FROM file_metadata
+            WHERE length(llm_embedding) > 0 GROUP BY bytes ORDER BY COUNT(*) DESC LIMIT 1
+        """).fetchone()
+        if not lengths:
+            return np.zeros(0, dtype=np.int64), 0
+        ids = np.fromiter((row[0] for row in conn.execute(
+            "SELECT file_id FROM file_metadata WHERE length(llm_embedding) = ? ORDER BY file_id", (lengths[0],)
+        )), dtype=np.int64)
+        return ids, lengths[0] // 4
+
+    @staticmethod
+    def _read_chunks(conn, dim):
+        """Streams the embeddings in file_id order as (row offset, float32 matrix) chunks."""
+        cursor = conn.execute(
+            "SELECT llm_embedding FROM file_metadata WHERE length(llm_embedding) = ? ORDER BY file_id", (dim * 4,)
+        )
+        start = 0
+        while True:
+            rows = cursor.fetchmany(READ_BATCH)
+            if not rows:
+                break
+            yield start, np.frombuffer(b''.join(row[0] for row in rows), dtype=np.float32).reshape(len(rows), dim)
+            start += len(rows)
+
+    @staticmethod
+    def _read_vectors(conn, dim, file_ids):
+        for start in range(0, len(file_ids), 500):
+            chunk = file_ids[start:start + 500].tolist()
+            placeholders = ','.join('?' for _ in chunk)
+            for file_id, blob in conn.execute(
+                f"SELECT file_id, llm_embedding FROM file_metadata WHERE file_id IN ({placeholders}) ORDER BY file_id", chunk
+            ):
+                yield file_id, np.frombuffer(blob, dtype=np.float32)
+
+    # --- Persistence ---
+
+    def save(self, path):
+        np.save(os.path.join(path, 'centroids.npy'), self.centroids)
+        np.save(os.path.join(path, 'offsets.npy'), self.offsets)
+        np.save(os.path.join(path, 'ids.npy'), self.ids)
+        if not isinstance(self.vectors, np.memmap):
+            np.save(os.path.join(path, 'vectors.npy'), self.vectors)
+        # meta.json is written last; an index without it is treated as missing
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, path):
+        """Opens a saved index with its vectors memory-mapped, or returns None if it is missing or unreadable."""
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            if meta.get('version') != INDEX_VERSION:
+                return None
+            return cls(np.load(os.path.join(path, 'centroids.npy')),
+                       np.load(os.path.join(path, 'offsets.npy')),
+                       np.load(os.path.join(path, 'ids.npy')),
+                       np.load(os.path.join(path, 'vectors.npy'), mmap_mode='r'),
+                       meta)
+        except (OSError, ValueError) as e:
+            logger.info(f"No usable LLM embedding index at {path}: {e}")
+            return None
+
+    # --- Searching ---
+
+    def neighbour_pairs(self, threshold, nprobe=None, file_ids=None, block_mib=None):
+        """
+        Yields (file_ids_a, file_ids_b) arrays of vectors whose cosine similarity
+        is >= threshold. Each vector is compared with the lists of its `nprobe`
+        nearest centroids; pairs may be reported more than once. If `file_ids`
+        is given, only those files take part in the search.
+        """
+        if not len(self.ids):
+            return
+        nprobe = min(int(nprobe or config.get("llm.nprobe", DEFAULT_NPROBE)), self.nlist)
+        allowed = np.isin(self.ids, np.asarray(list(file_ids), dtype=np.int64)) if file_ids is not None else None
+
+        # Probe lists of every vector, computed list by list from the stored vectors
+        probes = np.empty((len(self.ids), nprobe), dtype=np.int32)
+        for start, stop in self._list_ranges():
+            probes[start:stop] = _nearest(self.vectors[start:stop].astype(np.float32), self.centroids, nprobe)
+
+        # Invert the probes: for each list, the vectors that probe it
+        positions = np.repeat(np.arange(len(self.ids)), nprobe)
+        targets = probes.ravel()
+        if allowed is not None:
+            keep = allowed[positions]
+            positions, targets = positions[keep], targets[keep]
+        order = np.argsort(targets, kind='stable')
+        positions, targets = positions[order], targets[order]
+        bounds = np.searchsorted(targets, np.arange(self.nlist + 1))
+
+        for list_no in range(self.nlist):
+            queries = positions[bounds[list_no]:bounds[list_no + 1]]
+            start, stop = self.offsets[list_no], self.offsets[list_no + 1]
+            if not len(queries) or start == stop:
+                continue
+            members = np.arange(start, stop)
+            if allowed is not None:
+                members = members[allowed[start:stop]]
+                if not len(members):
+                    continue
+            base = self.vectors[members].astype(np.float32)
+            block = _block_rows(len(members), block_mib)
+            for q in range(0, len(queries), block):
+                query_positions = queries[q:q + block]
+                scores = self.vectors[query_positions].astype(np.float32) @ base.T
+                rows, cols = np.nonzero(scores >= threshold)
+                a, b = query_positions[rows], members[cols]
+                keep = a != b
+                if keep.any():
+                    yield self.ids[a[keep]], self.ids[b[keep]]
+
+    def _list_ranges(self):
+        for list_no in range(self.nlist):
+            start, stop = int(self.offsets[list_no]), int(self.offsets[list_no + 1])
+            if start != stop:
+                yield start, stop
+
+
+def _nearest(vectors, centroids, count):
+    """Returns the indices of the `count` most similar centroids for each row."""
+    result = np.empty((len(vectors), count), dtype=np.int32)
+    block = _block_rows(len(centroids))
+    for start in range(0, len(vectors), block):
+        scores = vectors[start:start + block] @ centroids.T
+        if count == 1:
+            result[start:start + block, 0] = scores.argmax(axis=1)
+        else:
+            top = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+            ranked = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+            result[start:start + block] = np.take_along_axis(top, ranked, axis=1)
+    return result
+
+
+def _spherical_kmeans(sample, nlist, rng):
+    """Clusters unit vectors by cosine similarity; returns unit-length centroids."""
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        labels = _nearest(sample, centroids, 1)[:, 0]
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=nlist)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty lists with random sample vectors
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+def load_or_build(conn):
+    """Returns an up-to-date index for the project database, rebuilding and saving it if needed."""
+    path = index_path(conn)
+    if path:
+        index = EmbeddingIndex.load(path)
+        if index is not None and index.meta.get('fingerprint') == fingerprint(conn):
+            return index
+    return EmbeddingIndex.build(conn, path)
+
+
+def similar_groups(conn, file_infos, threshold, block_mib=None):
+    """
+    Clusters file infos whose LLM embeddings are at least `threshold` cosine-similar
+    to another member, transitively. Small sets are compared exactly; larger ones
+    use the project's ANN index. Returns lists of file infos.
+    """
+    infos = [info for info in file_infos if info.get('llm_embedding')]
+    if len(infos) < 2:
+        return []
+    exact_limit = int(config.get("llm.exact_limit", DEFAULT_EXACT_LIMIT))
+    if len(infos) <= exact_limit:
+        dim = len(infos[0]['llm_embedding'])
+        infos = [info for info in infos if len(info['llm_embedding']) == dim]
+        vectors = normalize([np.frombuffer(info['llm_embedding'], dtype=np.float32) for info in infos])
+        return [[infos[i] for i in group] for group in cluster(len(infos), exact_pairs(vectors, threshold, block_mib))]
+
+    by_id = {info['id']: info for info in infos}
+    ids = sorted(by_id)
+    position = {file_id: i for i, file_id in enumerate(ids)}
+    index = load_or_build(conn)
+    pairs = ((np.fromiter((position[i] for i in a.tolist()), dtype=np.int64, count=len(a)),
+              np.fromiter((position[i] for i in b.tolist()), dtype=np.int64, count=len(b)))
+             for a, b in index.neighbour_pairs(threshold, file_ids=ids, block_mib=block_mib))
+    return [[by_id[ids[i]] for i in group] for group in cluster(len(ids), pairs)]
@@ -0,0 +1,95 @@
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from config import config
+from ..base_calculator import BaseCalculator
+from .. import image_loader
+from ..image_loader import is_image
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 16
+# Stored for images the engine could not embed, so they are not retried until the file changes
+FAILED_EMBEDDING = b''
+
+
+def cache_kind():
+    """Names embeddings in the hash cache after the model that produced them."""
+    return f"llm_embedding:{os.path.basename(config.get('models.llava_model_path') or '')}"
+
+
+def _read_bytes(fullpath):
+    """
+    Reads an image for the engine. Images larger than the vision encoder needs
+    are sent as a reduced-resolution PNG from the shared image loader.
+    """
+    try:
+        return image_loader.encoded_thumbnail(fullpath)
+    except OSError as e:
+        logger.error(f"Could not read image {fullpath}: {e}")
+        return None
+
+
+def _to_blob(embedding):
+    if embedding is None:
+        return FAILED_EMBEDDING
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+
+class LLMEmbeddingCalculator(BaseCalculator):
+    """
+    Calculates image embeddings with the LLM engine.
+
+    Embeddings are normally filled in batches by `embed_files`, which
+    calculate_metadata_db runs before the per-file calculators; `calculate`
+    only handles single files when an engine is passed in the options.
+    """
+    @property
+    def db_key(self):
+        return 'llm_embedding'
+
+    def calculate(self, file_node, opts):
+        engine = opts.get('llm_engine')
+        if not opts.get('compare_llm') or engine is None or not is_image(file_node.ext):
+            return None
+        return _to_blob(engine.get_image_embedding(file_node.fullpath))
+
+    def embed_files(self, engine, items, batch_size=None):
+        """
+        Embeds `(file_id, fullpath)` items and yields `(file_id, blob)` in order.
+
+        While the engine works on one batch, the image bytes of the next batch
+        are read on a background thread. Engines with a `get_image_embeddings`
+        method get a whole batch of image bytes per call; others are called
+        once per path.
+        """
+        batch_size = batch_size or int(config.get("llm.embedding_batch", DEFAULT_BATCH_SIZE))
+        items = list(items)
+        batched = hasattr(engine, 'get_image_embeddings')
+        started = time.monotonic()
+        batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+        def read_batch(batch):
+            return [_read_bytes(fullpath) for _, fullpath in batch]
+
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            pending = reader.submit(read_batch, batches[0]) if batched and batches else None
+            for number, batch in enumerate(batches):
+                if batched:
+                    images = pending.result()
+                    if number + 1 < len(batches):
+                        pending = reader.submit(read_batch, batches[number + 1])
+                    readable = [image for image in images if image is not None]
+                    embeddings = iter(engine.get_image_embeddings(readable) if readable else [])
+                    for (file_id, _), image in zip(batch, images):
+                        yield file_id, _to_blob(next(embeddings) if image is not None else None)
+                else:
+                    for file_id, fullpath in batch:
+                        yield file_id, _to_blob(engine.get_image_embedding(fullpath))
+
+        elapsed = time.monotonic() - started
+        if items:
+            logger.info(f"Embedded {len(items)} images in {elapsed:.1f}s "
+                        f"({len(items) / elapsed if elapsed else float('inf'):.2f} images/s).")
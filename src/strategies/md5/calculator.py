@@ -1,5 +1,6 @@
 from ..base_calculator import BaseCalculator
 from .. import utils
+from hashing import algorithms
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,15 +12,16 @@ class MD5Calculator(BaseCalculator):
 
     def calculate(self, file_node, opts):
         """
-        Calculates the MD5 hash of a file.
+        Calculates the content digest of a file with the project's hash
+        algorithm (MD5 unless `hash_algorithm` says otherwise).
 
         Args:
             file_node (FileNode): The file node to process.
             opts (dict): The options dictionary.
 
         Returns:
-            str: The MD5 hash of the file, or None if an error occurs.
+            str: The hex digest of the file, or None if an error occurs.
         """
         if opts.get('compare_content_md5'):
-            return utils.calculate_md5(file_node.fullpath)
+            return utils.calculate_digest(file_node.fullpath, algorithms.resolve(opts.get('hash_algorithm')))
         return None
@@ -0,0 +1,145 @@
+"""
+Size-first progressive hashing for content duplicate detection.
+
+Rather than hashing every file, candidates are narrowed down in stages:
+1. Only files whose size collides with another file are considered.
+2. Those files get a cheap partial hash over their first and last chunk.
+3. Only files whose (size, partial hash) still collide are hashed in full.
+
+Files with a unique size are never read, and files that differ early or late
+in their content are only read for a couple of chunks.
+"""
+import itertools
+import logging
+import os
+import database
+import progress
+from config import config
+from hashing import algorithms, cache as hash_cache
+from hashing.executor import hash_files
+from .. import utils
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARTIAL_CHUNK_KIB = 64
+
+
+def _scope(folders, file_type_filter):
+    """Builds the WHERE clause restricting a query to the selected folders and file types."""
+    placeholders = ','.join('?' for _ in folders)
+    clauses = [f"f.folder_index IN ({placeholders})"]
+    params = list(folders)
+
+    if file_type_filter != "all":
+        extensions = config.get(f"file_extensions.{file_type_filter}", [])
+        if extensions:
+            ext_placeholders = ','.join('?' for _ in extensions)
+            clauses.append(f"f.ext IN ({ext_placeholders})")
+            params.extend(extensions)
+
+    return " AND ".join(clauses), params
+
+
+def _colliding_files(conn, folders, file_type_filter, key_columns):
+    """
+    Returns (file_id, folder_index, path, name, size, partial_md5, md5) for every
+    file that shares all of `key_columns` (column expressions such as
+    'fm.size' or 'f.name') with at least one other file.
+    """
+    where, params = _scope(folders, file_type_filter)
+    keys = ", ".join(key_columns)
+    not_null = " AND ".join(f"{column} IS NOT NULL" for column in key_columns)
+    query = f"""
+        SELECT f.id, f.folder_index, f.path, f.name, fm.size, fm.partial_md5, fm.md5
+        FROM files f
+        JOIN file_metadata fm ON f.id = fm.file_id
+        WHERE {where} AND {not_null} AND ({keys}) IN (
+            SELECT {keys}
+            FROM files f
+            JOIN file_metadata fm ON f.id = fm.file_id
+            WHERE {where} AND {not_null}
+            GROUP BY {keys}
+            HAVING COUNT(f.id) > 1
+        )
+    """
+    return conn.execute(query, params + params).fetchall()
+
+
+def _full_path(folders, folder_index, path, name):
+    return os.path.join(folders[folder_index], path or '', name)
+
+
+def run(conn, folders, file_type_filter="all", algorithm=None, group_by=(), invalidate=True):
+    """
+    Fills `file_metadata.md5` for every file that could be a content duplicate.
+    Digests made with a different algorithm than `algorithm` are discarded and
+    recomputed first, unless the caller already did so (`invalidate=False`).
+
+    Args:
+        conn: The database connection.
+        folders (dict): Maps folder_index to the folder's root path.
+        file_type_filter (str): The file type category to restrict hashing to.
+        algorithm (str, optional): The hash algorithm name; MD5 by default.
+        group_by (sequence, optional): Further column expressions (e.g. 'f.name')
+            that files must share besides their size to be hashed at all.
+        invalidate (bool): Discard digests of other algorithms first.
+
+    Returns:
+        dict: Number of files that were partially and fully hashed.
+    """
+    if not folders:
+        return {'partial': 0, 'full': 0}
+
+    algorithm = algorithms.resolve(algorithm)
+    if invalidate:
+        cleared = database.invalidate_content_hashes(conn, algorithm)
+        if cleared:
+            logger.info(f"Progressive hashing: discarded digests of {cleared} files hashed with another algorithm.")
+    chunk_size = int(config.get("hashing.partial_chunk_kib", DEFAULT_PARTIAL_CHUNK_KIB)) * 1024
+    group_by = [column for column in group_by if column != 'fm.size']
+
+    # Stage 1 + 2: partial hash for files whose size (and group_by keys) are not unique.
+    to_hash = []
+    known = []
+    for file_id, folder_index, path, name, size, partial_md5, md5 in _colliding_files(conn, folders, file_type_filter, ['fm.size', *group_by]):
+        if partial_md5 is not None:
+            continue
+        if md5 is not None and size <= 2 * chunk_size:
+            known.append((md5, md5, algorithm, file_id))
+        else:
+            to_hash.append((file_id, _full_path(folders, folder_index, path, name), size, chunk_size, algorithm))
+
+    small = {item[0] for item in to_hash if item[2] <= 2 * chunk_size}
+    read_sizes = {item[0]: min(item[2] or 0, 2 * chunk_size) for item in to_hash}
+    with progress.track("Partial hashing", len(to_hash), sum(read_sizes.values())) as tracker:
+        hashed = (
+            # Small files were hashed in full, so the partial hash is also the content hash.
+            (digest, digest if file_id in small else None, algorithm, file_id)
+            for file_id, digest in tracker.follow(hash_files(utils.calculate_partial_digest, to_hash), read_sizes)
+            if digest is not None
+        )
+        partial_count = database.executemany_batched(
+            conn,
+            "UPDATE file_metadata SET partial_md5 = ?, md5 = COALESCE(md5, ?), hash_algorithm = ? WHERE file_id = ?",
+            itertools.chain(known, hashed)
+        )
+    logger.info(f"Progressive hashing: {partial_count} files partially hashed.")
+
+    # Stage 3: full hash only where size and partial hash both collide.
+    sizes = {}
+    to_hash = []
+    for file_id, folder_index, path, name, size, partial_md5, md5 in _colliding_files(
+            conn, folders, file_type_filter, ['fm.size', *group_by, 'fm.partial_md5']):
+        if md5 is None:
+            sizes[file_id] = size
+            to_hash.append((file_id, _full_path(folders, folder_index, path, name), algorithm))
+    with progress.track("Hashing", len(to_hash), sum(sizes.values())) as tracker:
+        digests = hash_cache.cached(algorithm, lambda items: hash_files(utils.calculate_digest, items), to_hash)
+        full_count = database.executemany_batched(
+            conn,
+            "UPDATE file_metadata SET md5 = ?, hash_algorithm = ? WHERE file_id = ?",
+            ((digest, algorithm, file_id) for file_id, digest in tracker.follow(digests, sizes) if digest is not None)
+        )
+    logger.info(f"Progressive hashing: {full_count} files fully hashed.")
+
+    return {'partial': partial_count, 'full': full_count}
@@ -0,0 +1,67 @@
+import numpy as np
+import logging
+from ..base_calculator import BaseCalculator
+from .. import image_loader
+
+logger = logging.getLogger(__name__)
+
+HASH_SIZE = 8
+# The image is shrunk to HASH_SIZE * 4 pixels per side before the DCT
+IMAGE_SIZE = HASH_SIZE * 4
+
+
+def _dct_matrix(size):
+    """Orthonormal DCT-II basis, so that C @ x @ C.T is the 2-D DCT of x."""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.sqrt(2.0 / size) * np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+DCT_MATRIX = _dct_matrix(IMAGE_SIZE)
+
+
+def to_signed(value):
+    """Maps an unsigned 64-bit hash onto SQLite's signed INTEGER range."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_unsigned(value):
+    return value & 0xFFFFFFFFFFFFFFFF
+
+
+def phash_pixels(pixels):
+    """
+    Computes the 64-bit perceptual hash of a IMAGE_SIZE x IMAGE_SIZE grayscale
+    array: each bit says whether one of the 8x8 lowest DCT frequencies is
+    above their median. Returns an unsigned int.
+    """
+    dct = DCT_MATRIX @ np.asarray(pixels, dtype=np.float64) @ DCT_MATRIX.T
+    low = dct[:HASH_SIZE, :HASH_SIZE].ravel()
+    bits = low > np.median(low)
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+class PHashCalculator(BaseCalculator):
+    """
+    Calculates a 64-bit DCT perceptual hash of an image.
+    """
+    @property
+    def db_key(self):
+        return 'phash'
+
+    def calculate(self, file_node, opts):
+        """
+        Returns the hash as a signed 64-bit int for storage, or None if the file
+        is not an image or cannot be read.
+        """
+        if not opts.get('compare_phash') or not image_loader.is_image(file_node.path_obj.suffix):
+            return None
+
+        try:
+            img = image_loader.load_resized(file_node.fullpath, (IMAGE_SIZE, IMAGE_SIZE), mode='L')
+            return to_signed(phash_pixels(np.asarray(img)))
+        except Exception as e:
+            logger.error(f"Could not calculate perceptual hash for {file_node.fullpath}: {e}")
+            return None
@@ -0,0 +1,48 @@
+from ..base_comparison_strategy import BaseComparisonStrategy, StrategyMetadata
+from .calculator import to_unsigned
+
+DEFAULT_MAX_DISTANCE = 8
+
+
+def hamming_distance(hash1, hash2):
+    return (to_unsigned(hash1) ^ to_unsigned(hash2)).bit_count()
+
+
+class CompareByPHash(BaseComparisonStrategy):
+    @property
+    def metadata(self) -> StrategyMetadata:
+        return StrategyMetadata(
+            option_key='compare_phash',
+            display_name='Perceptual Hash (Image)',
+            description='Compare images by perceptual hash',
+            tooltip='Matches images whose 64-bit perceptual hashes differ in at most the given number of bits. Finds resized, recompressed and lightly edited copies.',
+            requires_calculation=True,
+            has_threshold=True,
+            threshold_label='Max Distance',
+            default_threshold=DEFAULT_MAX_DISTANCE
+        )
+
+    @property
+    def option_key(self):
+        return 'compare_phash'
+
+    def compare(self, file1_info, file2_info, opts=None):
+        """
+        Compares two files by the Hamming distance of their perceptual hashes.
+        """
+        hash1 = file1_info.get('phash')
+        hash2 = file2_info.get('phash')
+        if hash1 is None or hash2 is None:
+            return False
+        max_distance = int(float((opts or {}).get('compare_phash_threshold', DEFAULT_MAX_DISTANCE)))
+        return hamming_distance(hash1, hash2) <= max_distance
+
+    @property
+    def db_key(self):
+        return 'phash'
+
+    def get_duplicates_query_part(self):
+        # Near matches are found with the multi-index Hamming search in
+        # `hamming_index` rather than GROUP BY, so this is a refinement
+        # strategy like the LLM one.
+        return None
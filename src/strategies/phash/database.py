@@ -0,0 +1,36 @@
+from ..base_database import BaseDatabase
+
+class PHashDatabase(BaseDatabase):
+    def save(self, conn, file_id, data):
+        """
+        Saves the perceptual hash of a file to the database.
+        """
+        with conn:
+            conn.execute(
+                "UPDATE file_metadata SET phash = ? WHERE file_id = ?",
+                (data, file_id)
+            )
+
+    def load(self, conn, file_id):
+        """
+        Loads the perceptual hash of a file from the database.
+        """
+        cursor = conn.cursor()
+        cursor.execute("SELECT phash FROM file_metadata WHERE file_id = ?", (file_id,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def load_many(self, conn, file_ids):
+        """
+        Loads the perceptual hashes of several files at once. Returns {file_id: phash}.
+        """
+        hashes = {}
+        file_ids = list(file_ids)
+        for start in range(0, len(file_ids), 500):
+            chunk = file_ids[start:start + 500]
+            placeholders = ','.join('?' for _ in chunk)
+            cursor = conn.execute(
+                f"SELECT file_id, phash FROM file_metadata WHERE phash IS NOT NULL AND file_id IN ({placeholders})", chunk
+            )
+            hashes.update(cursor.fetchall())
+        return hashes
@@ -0,0 +1,111 @@
+"""
+Multi-index Hamming search over 64-bit perceptual hashes.
+
+The hashes are split into m chunks. If two hashes differ in at most k bits,
+then by the pigeonhole principle at least one chunk differs in at most k // m
+bits. So for each chunk, every hash only probes the chunk values within that
+small radius, and only those candidates are checked with a full popcount.
+The number of chunks is picked per search from n and k so that the probes
+per hash and the expected bucket size (n / 2^bits) both stay small. For
+example, 3 chunks of about 21 bits handle k = 8 with 254 probes per chunk
+and about 0.25 candidates per probe at 500k hashes. All steps run as NumPy
+array operations.
+"""
+from itertools import combinations
+from math import comb
+import numpy as np
+from ..union_find import UnionFind
+
+# Largest chunk, bounded by the size of the bucket table (2^bits entries)
+MAX_CHUNK_BITS = 24
+# Upper bound on candidate pairs checked at once
+MAX_CANDIDATES = 1 << 22
+
+
+def chunk_layout(count, max_distance):
+    """Returns the chunk widths in bits with the lowest estimated search cost."""
+    best = None
+    for chunks in range(2, 17):
+        widths = [64 // chunks + (1 if i < 64 % chunks else 0) for i in range(chunks)]
+        if widths[0] > MAX_CHUNK_BITS:
+            continue
+        radius = max_distance // chunks
+        probes = sum(comb(widths[0], i) for i in range(radius + 1))
+        cost = chunks * (probes * (1 + count / 2 ** widths[-1]) + 2 ** widths[0] / max(count, 1))
+        if best is None or cost < best[0]:
+            best = (cost, widths)
+    return best[1]
+
+
+def _masks(bits, radius):
+    """All `bits`-bit masks with at most `radius` bits set."""
+    masks = [0]
+    for count in range(1, min(radius, bits) + 1):
+        masks.extend(sum(1 << bit for bit in chosen) for chosen in combinations(range(bits), count))
+    return np.array(masks, dtype=np.int64)
+
+
+def near_pairs(values, max_distance):
+    """
+    Yields (i, j) index arrays, i < j, of hashes in the uint64 array `values`
+    that differ in at most `max_distance` bits. A pair may be yielded more than once.
+    """
+    count = len(values)
+    if count < 2:
+        return
+    positions = np.arange(count)
+    widths = chunk_layout(count, max_distance)
+    shift = 0
+    for bits in widths:
+        keys = ((values >> np.uint64(shift)) & np.uint64((1 << bits) - 1)).astype(np.int64)
+        shift += bits
+        order = np.argsort(keys, kind='stable')
+        # Bucket table: positions order[starts[key]:starts[key] + sizes[key]] have this chunk value
+        sizes = np.bincount(keys, minlength=1 << bits)
+        starts = np.cumsum(sizes) - sizes
+        for mask in _masks(bits, max_distance // len(widths)):
+            probes = keys ^ mask
+            low = starts[probes]
+            matches = sizes[probes]
+            ends = np.cumsum(matches)
+            # Check the candidates of a slice of queries at a time
+            start = 0
+            while start < count:
+                base = ends[start - 1] if start else 0
+                stop = max(start + 1, int(np.searchsorted(ends, base + MAX_CANDIDATES, 'right')))
+                counts = matches[start:stop]
+                total = int(counts.sum())
+                if total:
+                    queries = np.repeat(positions[start:stop], counts)
+                    firsts = np.repeat(low[start:stop] - (np.cumsum(counts) - counts), counts)
+                    candidates = order[firsts + np.arange(total)]
+                    keep = queries < candidates
+                    queries, candidates = queries[keep], candidates[keep]
+                    keep = np.bitwise_count(values[queries] ^ values[candidates]) <= max_distance
+                    if keep.any():
+                        yield queries[keep], candidates[keep]
+                start = stop
+
+
+def similar_groups(hashes, max_distance):
+    """
+    Groups positions of `hashes` (ints, or None for files without a hash) that
+    are within max_distance bits of each other, transitively. Returns lists of
+    positions with at least two members, ordered by their first position.
+    """
+    present = [i for i, value in enumerate(hashes) if value is not None]
+    sets = UnionFind(len(hashes))
+    if len(present) < 2:
+        return []
+    values = np.array([hashes[i] & 0xFFFFFFFFFFFFFFFF for i in present], dtype=np.uint64)
+
+    # Identical hashes are joined up front and searched once
+    distinct, first, inverse = np.unique(values, return_index=True, return_inverse=True)
+    for position, representative in zip(present, first[inverse].tolist()):
+        sets.union(present[representative], position)
+
+    if max_distance > 0:
+        for rows, cols in near_pairs(distinct, max_distance):
+            for a, b in zip(first[rows].tolist(), first[cols].tolist()):
+                sets.union(present[a], present[b])
+    return sets.groups()
@@ -0,0 +1,137 @@
+"""
+Candidate-aware planning of metadata calculation.
+
+Running every calculator over every file wastes most of the work: a file
+whose size is unique can never be in a size-based group, so its histogram or
+embedding is never compared. The planner orders the selected strategies from
+cheap to expensive and only computes an expensive value for the files that
+can still end up in a duplicate group:
+
+1. Name, size and date come from the scan and are read for every file.
+2. Content digests are filled by progressive hashing, for files that share
+   size, partial hash and the other selected exact keys.
+3. The files sharing all exact keys with another file are the candidates for
+   the similarity strategies. These run in the order `find_duplicates_strategy`
+   refines groups in (perceptual hash, LLM embedding, histogram). After each
+   one, the candidates shrink to the members of the refined groups, which are
+   exactly the files the next refinement will see.
+
+The similarity stages keep the refinement order rather than their cost order:
+the LLM clustering is transitive, so dropping a file because of its histogram
+before embedding it could split an LLM group and change the result.
+"""
+import logging
+from pathlib import Path
+import database
+from hashing import algorithms
+from . import utils, find_duplicates_strategy
+from .md5 import progressive
+
+logger = logging.getLogger(__name__)
+
+# Relative cost of computing a value per file; 0 means it is known from the scan
+COSTS = {
+    'name': 0,
+    'size': 0,
+    'modified_date': 0,
+    'md5': 2,
+    'phash': 3,
+    'histogram': 4,
+    'llm_embedding': 5,
+}
+
+# File info keys of the exact-match GROUP BY parts
+EXACT_KEYS = {
+    'f.name': 'name',
+    'fm.size': 'size',
+    'fm.modified_date': 'modified_date',
+    'fm.md5': 'md5',
+}
+
+# Keys filled by a planned stage rather than for every file
+PLANNED_KEYS = {'md5', *find_duplicates_strategy.SIMILARITY_KEYS}
+
+
+def _cost(part):
+    return COSTS.get(EXACT_KEYS.get(part), max(COSTS.values()))
+
+
+def exact_groups(file_infos, group_by_parts):
+    """
+    Splits file infos into the groups the exact-match strategies would form.
+    Without exact parts, or with one the planner does not know, all files
+    form a single group.
+    """
+    if not group_by_parts or any(part not in EXACT_KEYS for part in group_by_parts):
+        return [file_infos]
+    keys = [EXACT_KEYS[part] for part in group_by_parts]
+    groups = {}
+    for info in file_infos:
+        key = tuple(info.get(k) for k in keys)
+        if None not in key:
+            groups.setdefault(key, []).append(info)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def calculate_metadata(conn, folders, opts, file_type_filter="all", llm_engine=None, on_stage=None):
+    """
+    Calculates the metadata needed to find duplicates among `folders` with
+    the strategies selected in `opts`, computing expensive values only for
+    candidate files.
+
+    Args:
+        conn: The database connection.
+        folders (dict): Maps folder_index to the folder's root path.
+        opts (dict): The legacy options dictionary.
+        file_type_filter (str): The file type category to restrict to.
+        llm_engine: The loaded LLM engine, if any.
+        on_stage (callable, optional): Called with a status message before each stage.
+
+    Returns:
+        list: File info dicts of all files in the folders.
+    """
+    report = on_stage or (lambda message: None)
+    group_by_parts, similarity = find_duplicates_strategy.selected_strategies(opts)
+    group_by_parts = sorted(group_by_parts, key=_cost)
+
+    if 'fm.md5' in group_by_parts:
+        # Once per comparison: digests of another algorithm must never be grouped with new ones
+        algorithm = algorithms.resolve(opts.get('hash_algorithm'))
+        cleared = database.invalidate_content_hashes(conn, algorithm)
+        if cleared:
+            logger.info(f"Planner: discarded digests of {cleared} files hashed with another algorithm.")
+        report("Hashing files with matching sizes...")
+        progressive.run(conn, folders, file_type_filter=file_type_filter, algorithm=algorithm,
+                        group_by=[part for part in group_by_parts if part != 'fm.md5'], invalidate=False)
+
+    file_infos = []
+    for folder_index, path in folders.items():
+        report(f"Calculating metadata for {Path(path).name}...")
+        infos, _ = utils.calculate_metadata_db(conn, folder_index, path, opts, file_type_filter=file_type_filter,
+                                               llm_engine=llm_engine, skip_keys=PLANNED_KEYS)
+        file_infos.extend(infos)
+
+    steps = find_duplicates_strategy.refinements(conn, opts, similarity)
+    if not steps:
+        return file_infos
+
+    by_id = {info['id']: info for info in file_infos}
+    groups = exact_groups(file_infos, group_by_parts)
+    for position, (key, refine) in enumerate(steps):
+        candidates = {info['id'] for group in groups for info in group}
+        logger.info(f"Planner: computing {key} for {len(candidates)} of {len(file_infos)} files.")
+        for folder_index, path in folders.items():
+            folder_candidates = {file_id for file_id in candidates if by_id[file_id]['folder_index'] == folder_index}
+            if not folder_candidates:
+                continue
+            report(f"Calculating {similarity[key].metadata.display_name} for {Path(path).name}...")
+            infos, _ = utils.calculate_metadata_db(conn, folder_index, path, opts, file_type_filter=file_type_filter,
+                                                   llm_engine=llm_engine, skip_keys=PLANNED_KEYS - {key},
+                                                   candidates=folder_candidates)
+            for info in infos:
+                if info.get(key) is not None:
+                    by_id[info['id']][key] = info[key]
+        # The last refinement is left to find_duplicates_strategy
+        if position < len(steps) - 1:
+            groups = [subgroup for group in groups for subgroup in refine(group)]
+    return file_infos
@@ -0,0 +1,28 @@
+class UnionFind:
+    """Disjoint sets over the integers 0..n-1."""
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, item):
+        parent = self.parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # Keep the smaller index as the root so group order is stable
+            if root_a < root_b:
+                self.parent[root_b] = root_a
+            else:
+                self.parent[root_a] = root_b
+
+    def groups(self):
+        """Returns the sets with at least two members, ordered by their smallest member."""
+        members = {}
+        for item in range(len(self.parent)):
+            members.setdefault(self.find(item), []).append(item)
+        return [group for root, group in sorted(members.items()) if len(group) > 1]
@@ -1,87 +1,233 @@
-import hashlib
 import logging
+import os
+from collections import defaultdict
+from pathlib import Path
 from .calculator_registry import get_calculators
 import database
+import jobs
+import progress
+from config import config
+from models import FileNode
+from hashing import algorithms, reader, cache as hash_cache
+from hashing.algorithms import DEFAULT_ALGORITHM
 
 logger = logging.getLogger(__name__)
 
-def calculate_md5(file_path, block_size=65536):
+def calculate_digest(file_path, algorithm=DEFAULT_ALGORITHM, block_size=None):
+    """Calculates the content digest of a file with the given hash algorithm."""
+    hasher = algorithms.new(algorithm)
+    try:
+        reader.update_from_file(hasher, file_path, block_size=block_size)
+        return hasher.hexdigest()
+    except OSError as e:
+        logger.error(f"Could not calculate {algorithm} digest for {file_path}: {e}")
+        return None
+
+def calculate_md5(file_path, block_size=None):
     """Calculates the MD5 hash of a file."""
-    md5 = hashlib.md5()
+    return calculate_digest(file_path, 'md5', block_size)
+
+def calculate_partial_digest(file_path, size, chunk_size=65536, algorithm=DEFAULT_ALGORITHM):
+    """
+    Calculates a digest over the first and last `chunk_size` bytes of a file.
+    Files no larger than two chunks are hashed in full, so for them the
+    partial hash equals the content hash.
+    """
+    if size is None or size <= 2 * chunk_size:
+        return calculate_digest(file_path, algorithm)
+    hasher = algorithms.new(algorithm)
     try:
-        with open(file_path, 'rb') as f:
-            for block in iter(lambda: f.read(block_size), b''):
-                md5.update(block)
-        return md5.hexdigest()
+        reader.update_from_file(hasher, file_path, ranges=[(0, chunk_size), (-chunk_size, chunk_size)],
+                                block_size=chunk_size, mode='readinto')
+        return hasher.hexdigest()
     except OSError as e:
-        logger.error(f"Could not calculate MD5 for {file_path}: {e}")
+        logger.error(f"Could not calculate partial {algorithm} digest for {file_path}: {e}")
         return None
 
-def calculate_metadata_db(conn, folder_index, root_path, opts, file_type_filter="all", llm_engine=None):
+def calculate_partial_md5(file_path, size, chunk_size=65536):
+    """Calculates an MD5 over the first and last `chunk_size` bytes of a file."""
+    return calculate_partial_digest(file_path, size, chunk_size, 'md5')
+
+def _embed_missing_images(conn, files, root_path, llm_engine):
+    """
+    Embeds the image files that have no LLM embedding yet and stores the vectors
+    in bulk. Returns the file rows with their embedding column filled in.
+    """
+    from .image_loader import is_image
+    from .llm.calculator import LLMEmbeddingCalculator, cache_kind
+
+    missing = [(row[0], os.path.join(root_path, row[2] or '', row[3]))
+               for row in files if row[9] is None and is_image(row[4])]
+    if not missing:
+        return files
+
+    embeddings = {}
+    def collect(tracker):
+        embed = lambda items: LLMEmbeddingCalculator().embed_files(llm_engine, items)
+        for file_id, blob in tracker.follow(hash_cache.cached(cache_kind(), embed, missing)):
+            embeddings[file_id] = blob
+            yield blob, file_id
+
+    with progress.track("Embedding images", len(missing)) as tracker:
+        database.executemany_batched(conn, "UPDATE file_metadata SET llm_embedding = ? WHERE file_id = ?", collect(tracker))
+    logger.info(f"Embedded {sum(1 for blob in embeddings.values() if blob)} of {len(missing)} images without an embedding.")
+    return [row[:9] + (embeddings.get(row[0], row[9]),) + row[10:] for row in files]
+
+def _reuse_cached_histograms(conn, files, root_path):
+    """
+    Copies the histograms of files without one out of the user-level hash
+    cache into the project. Returns the stored (float16) histograms found, by
+    file id, and the cache keys of the files that still need one.
+    """
+    missing = [(row[0], os.path.join(root_path, row[2] or '', row[3])) for row in files if row[11] is None]
+    if not missing:
+        return {}, {}
+    found, keys = hash_cache.lookup('histogram', missing)
+    if found:
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO histograms (file_id, bins) VALUES (?, ?)", found.items())
+    return found, keys
+
+class _MetadataWriter:
+    """
+    Collects computed metadata in memory and writes it with `executemany`,
+    one transaction per `database.write_batch` values, instead of one
+    transaction per file and calculator.
+    """
+
+    def __init__(self, conn, algorithm):
+        from .histogram.database import HistogramDatabase
+
+        self.conn = conn
+        self.algorithm = algorithm
+        self.histogram_db = HistogramDatabase()
+        self.batch_size = int(config.get("database.write_batch", database.DEFAULT_WRITE_BATCH))
+        self.columns = defaultdict(list)
+        self.histograms = []
+        self.pending = 0
+        self.written = 0
+
+    def add(self, file_id, key, value):
+        if key == 'histogram':
+            self.histograms.append((file_id, value))
+        elif key == 'md5':
+            self.columns[key].append((value, self.algorithm, file_id))
+        else:
+            self.columns[key].append((value, file_id))
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.conn:
+            for key, rows in self.columns.items():
+                if key == 'md5':
+                    query = "UPDATE file_metadata SET md5 = ?, hash_algorithm = ? WHERE file_id = ?"
+                else:
+                    query = f"UPDATE file_metadata SET {key} = ? WHERE file_id = ?"
+                self.conn.executemany(query, rows)
+            self.histogram_db.save_many(self.conn, self.histograms)
+        self.written += self.pending
+        self.columns.clear()
+        self.histograms = []
+        self.pending = 0
+
+def calculate_metadata_db(conn, folder_index, root_path, opts, file_type_filter="all", llm_engine=None, skip_keys=None,
+                          candidates=None):
     """
     Calculates and stores metadata for all files in a given folder.
+    Calculators whose db_key is in `skip_keys` are not run; this is used when
+    a key is filled by a dedicated stage such as progressive hashing. With
+    `candidates` (a set of file ids), only those files are processed and
+    returned; see `strategies.planner`.
+
+    Files are read with their stored metadata, perceptual hash and histogram
+    in one joined query. Embeddings are then filled in bulk, and the per-file
+    calculators' results are written back in batches. Content digests are
+    left to `progressive.run` by the planner, which skips the md5 calculator.
     """
+    from .histogram.database import quantize, dequantize
+
     logger.info(f"Calculating metadata for folder {folder_index} with opts: {opts}")
-    calculators = get_calculators()
-    files = database.get_all_files(conn, folder_index, file_type_filter=file_type_filter)
+    skip_keys = set(skip_keys or ())
+    calculators = [c for c in get_calculators() if c.db_key not in skip_keys]
+    algorithm = algorithms.resolve(opts.get('hash_algorithm'))
+    # One stored histogram serves every comparison method
+    files = database.get_files_with_metadata(conn, folder_index, file_type_filter=file_type_filter,
+                                             histograms=bool(opts.get('compare_histogram')))
+    if candidates is not None:
+        files = [row for row in files if row[0] in candidates]
+
+    if opts.get('compare_llm') and llm_engine is not None and any(c.db_key == 'llm_embedding' for c in calculators):
+        files = _embed_missing_images(conn, files, root_path, llm_engine)
+
+    cached_histograms, histogram_keys = {}, {}
+    if opts.get('compare_histogram'):
+        cached_histograms, histogram_keys = _reuse_cached_histograms(conn, files, root_path)
+    new_cache_entries = []
 
+    writer = _MetadataWriter(conn, algorithm)
+    tracker = progress.track(f"Calculating metadata for {Path(root_path).name}", len(files))
     file_infos = []
+    try:
+        for file_data in files:
+            jobs.checkpoint()
+            tracker.advance()
+            file_id, _, path, name, ext, _, size, modified_date, md5, llm_embedding, phash, bins = file_data
 
-    for file_data in files:
-        file_id, _, path, name, ext, _, size, modified_date, md5, llm_embedding = file_data
-
-        file_info = {
-            'id': file_id,
-            'folder_index': folder_index,
-            'relative_path': path,
-            'name': name,
-            'ext': ext,
-            'size': size,
-            'modified_date': modified_date,
-            'md5': md5,
-            'llm_embedding': llm_embedding
-        }
-
-        # This is a simplified representation of the FileNode.
-        # In a real implementation, we would fetch the FileNode from the database.
-        from models import FileNode
-        from pathlib import Path
-        file_node = FileNode(Path(f"{root_path}/{path}/{name}"))
-        file_node.metadata = file_info
-
-        # Load existing histogram if available
-        if opts.get('compare_histogram'):
-            from .histogram.database import HistogramDatabase
-            hist_db = HistogramDatabase()
-            method = opts.get('histogram_method')
-            existing_histogram = hist_db.load(conn, file_id, method)
-            if existing_histogram:
-                file_info['histogram'] = existing_histogram
-
-        for calculator in calculators:
-            key = calculator.db_key
-            
-            # Skip if we already have this metadata in the database
-            if file_info.get(key) is not None:
-                continue
-
-            result = calculator.calculate(file_node, opts)
-            if result is not None:
-                file_info[key] = result
-
-                if key == 'histogram':
-                    from .histogram.database import HistogramDatabase
-                    hist_db = HistogramDatabase()
-                    method = opts.get('histogram_method')
-                    hist_db.save(conn, file_id, result, method)
-                else:
-                    # Save the metadata to the database.
-                    with conn:
-                        conn.execute(
-                            f"UPDATE file_metadata SET {key} = ? WHERE file_id = ?",
-                            (result, file_id)
-                        )
+            file_info = {
+                'id': file_id,
+                'folder_index': folder_index,
+                'relative_path': path,
+                # Same key as the rows of find_duplicates_strategy, for groups built from these infos
+                'path': path,
+                'name': name,
+                'ext': ext,
+                'size': size,
+                'modified_date': modified_date,
+                'md5': md5,
+                'llm_embedding': llm_embedding
+            }
+
+            # This is a simplified representation of the FileNode.
+            # In a real implementation, we would fetch the FileNode from the database.
+            file_node = FileNode(Path(f"{root_path}/{path}/{name}"))
+            file_node.metadata = file_info
+
+            if opts.get('compare_phash') and phash is not None:
+                file_info['phash'] = phash
+
+            bins = bins if bins is not None else cached_histograms.get(file_id)
+            if bins is not None:
+                file_info['histogram'] = dequantize(bins)
+
+            for calculator in calculators:
+                key = calculator.db_key
+
+                # Skip if we already have this metadata in the database
+                if file_info.get(key) is not None:
+                    continue
+
+                result = calculator.calculate(file_node, opts)
+                if result is not None:
+                    file_info[key] = result
+                    writer.add(file_id, key, result)
+
+                    if key == 'histogram':
+                        # Compare with the stored precision, as later runs will
+                        file_info[key] = dequantize(quantize(result))
+                        cache_key = histogram_keys.get(file_id)
+                        if cache_key is not None and hash_cache.file_key(file_node.fullpath) == cache_key:
+                            new_cache_entries.append((cache_key, quantize(result)))
 
-        file_infos.append(file_info)
+            file_infos.append(file_info)
+    finally:
+        # Keep what was computed even if the loop is interrupted
+        writer.flush()
 
+    tracker.finish()
+    logger.info(f"Stored {writer.written} computed metadata values for folder {folder_index}.")
+    hash_cache.store('histogram', new_cache_entries)
     return file_infos, [] # Return empty list for inaccessible paths for now.
@@ -1,37 +1,184 @@
 import threading
 import queue
 import logging
+import time
+from contextlib import nullcontext
+import jobs
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_FLUSH_INTERVAL = 0.25
+DEFAULT_MAX_PENDING_BATCHES = 4
+# How often a worker waiting for the main thread checks whether its job was cancelled
+SLOT_POLL_INTERVAL = 0.1
+
 class TaskRunner:
     def __init__(self, view):
         self.view = view
         self.task_queue = queue.Queue()
+        self.active = {}
+        self._lock = threading.Lock()
         self.view.root.after(100, self.process_queue)
 
-    def run_task(self, task_func, on_success=None, on_error=None, on_finally=None):
-        thread = threading.Thread(target=self._execute_task, args=(task_func, on_success, on_error, on_finally))
+    def run_task(self, task_func, on_success=None, on_error=None, on_finally=None, job=None):
+        """
+        Runs `task_func` on a worker thread. With a `jobs.Job`, the task runs as
+        that job and can be stopped with `cancel_jobs`; `on_error` then receives
+        a `jobs.JobCancelled`.
+        """
+        thread = threading.Thread(target=self._execute_task, args=(task_func, on_success, on_error, on_finally, job))
         thread.daemon = True
+        if job is not None:
+            with self._lock:
+                self.active[job] = thread
         thread.start()
 
-    def _execute_task(self, task_func, on_success, on_error, on_finally):
+    def _execute_task(self, task_func, on_success, on_error, on_finally, job=None):
         try:
-            result = task_func()
+            with jobs.running(job) if job is not None else nullcontext():
+                result = task_func()
             if on_success:
                 self.post_to_main_thread(on_success, result)
+        except jobs.JobCancelled as e:
+            logger.info(f"Background task stopped: {e}")
+            if on_error:
+                self.post_to_main_thread(on_error, e)
         except Exception as e:
             logger.error("An error occurred in the background task", exc_info=True)
             if on_error:
                 self.post_to_main_thread(on_error, e)
         finally:
+            if job is not None:
+                with self._lock:
+                    self.active.pop(job, None)
             if on_finally:
                 self.post_to_main_thread(on_finally)
 
+    def cancel_jobs(self):
+        """Asks every running job to stop at its next checkpoint. Returns the number of jobs."""
+        with self._lock:
+            running = list(self.active)
+        for job in running:
+            job.cancel()
+        return len(running)
+
+    def wait(self, timeout=None, pump=False):
+        """
+        Waits up to `timeout` seconds for the running jobs' threads to finish.
+        Returns True if none is left.
+
+        With `pump`, callbacks posted by the workers keep running meanwhile,
+        so this can be called on the main thread: streaming workers waiting
+        for their batches to be delivered can then move on to their next
+        checkpoint, and status updates are drawn.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            threads = list(self.active.values())
+        for thread in threads:
+            while thread.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                if not pump:
+                    thread.join(remaining)
+                    break
+                self._run_pending_callbacks()
+                thread.join(SLOT_POLL_INTERVAL if remaining is None else min(SLOT_POLL_INTERVAL, remaining))
+        if pump:
+            self._run_pending_callbacks()
+        return not any(thread.is_alive() for thread in threads)
+
+    def run_streaming_task(self, task_func, on_batch, on_success=None, on_error=None, on_finally=None,
+                           batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                           max_pending=DEFAULT_MAX_PENDING_BATCHES, job=None):
+        """
+        Runs `task_func`, which returns an iterable, on a worker thread and
+        forwards its items to `on_batch` on the main thread in lists of at most
+        `batch_size`. A partial batch is forwarded once it has waited
+        `flush_interval` seconds, even while the task is busy producing the
+        next item, so the first results show up quickly.
+
+        At most `max_pending` batches wait for the main thread; beyond that the
+        worker blocks, so a slow consumer throttles the producer instead of
+        results piling up in memory. `on_success` receives the item count.
+        """
+        def stream_task():
+            return self._forward_batches(task_func(), on_batch, batch_size, flush_interval, max_pending)
+        self.run_task(stream_task, on_success, on_error, on_finally, job=job)
+
+    def _forward_batches(self, items, on_batch, batch_size, flush_interval, max_pending):
+        slots = threading.Semaphore(max_pending)
+        job = jobs.current()
+        # The pending batch is shared with a timer thread that flushes it while
+        # `items` is busy; the lock also keeps the batches in order.
+        lock = threading.Lock()
+        pending = {'batch': [], 'since': None}
+        finished = threading.Event()
+
+        def deliver(batch):
+            try:
+                on_batch(batch)
+            finally:
+                slots.release()
+
+        def forward():
+            batch = pending['batch']
+            pending['batch'], pending['since'] = [], None
+            # Waiting for a free slot must not outlast a cancelled job: the
+            # main thread may itself be waiting for this worker to stop.
+            while not slots.acquire(timeout=SLOT_POLL_INTERVAL):
+                if job is not None:
+                    job.checkpoint()
+            self.post_to_main_thread(deliver, batch)
+
+        def flush_partial_batches():
+            wait = flush_interval
+            while not finished.wait(wait):
+                with lock:
+                    since = pending['since']
+                    if since is None:
+                        wait = flush_interval
+                        continue
+                    wait = since + flush_interval - time.monotonic()
+                    if wait <= 0:
+                        try:
+                            forward()
+                        except jobs.JobCancelled:
+                            # The worker stops at its own next checkpoint
+                            return
+                        wait = flush_interval
+
+        flusher = threading.Thread(target=flush_partial_batches, daemon=True)
+        flusher.start()
+        count = 0
+        try:
+            for item in items:
+                with lock:
+                    if pending['since'] is None:
+                        pending['since'] = time.monotonic()
+                    pending['batch'].append(item)
+                    count += 1
+                    if len(pending['batch']) >= batch_size:
+                        forward()
+        finally:
+            finished.set()
+            flusher.join()
+        if pending['batch']:
+            forward()
+        return count
+
     def post_to_main_thread(self, callback, *args):
         self.task_queue.put((callback, args))
 
     def process_queue(self):
+        try:
+            self._run_pending_callbacks()
+        finally:
+            self.view.root.after(100, self.process_queue)
+
+    def _run_pending_callbacks(self):
         try:
             while True:
                 callback, args = self.task_queue.get_nowait()
@@ -39,5 +186,3 @@ class TaskRunner:
                 self.view.root.update_idletasks()
         except queue.Empty:
             pass
-        finally:
-            self.view.root.after(100, self.process_queue)
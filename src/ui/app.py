@@ -12,6 +12,7 @@ import database
 from models import FileNode, FolderNode
 from strategies import find_common_strategy, find_duplicates_strategy, utils
 from config import config
+from hashing import algorithms
 import file_operations
 from project_manager import ProjectManager
 from interfaces.view_interface import IView
@@ -89,6 +90,7 @@ class FolderComparisonApp(IView):
         self.results_tree = None
         self.progress_bar = None
         self.action_button = None
+        self.stop_button = None
 
         # View variables (will be bound by controller)
         self.move_to_path = None
@@ -100,6 +102,8 @@ class FolderComparisonApp(IView):
         self.compare_content_md5 = None
         self.compare_histogram = None
         self.histogram_method = None
+        self.hash_algorithm = None
+        self.verify_content = None
         self.histogram_threshold = None
         self.compare_llm = None
         self.llm_similarity_threshold = None
@@ -115,6 +119,7 @@ class FolderComparisonApp(IView):
         from config import config
 
         self.create_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.controller.on_closing)
         self._set_main_ui_state('disabled')
         use_llm = config.get("use_llm", True)
         if not use_llm:
@@ -146,6 +151,13 @@ class FolderComparisonApp(IView):
         file_type_menu.add_radiobutton(label=config.get('ui.file_types.audio', "Audio"), variable=self.file_type_filter, value="audio")
         file_type_menu.add_radiobutton(label=config.get('ui.file_types.document', "Documents"), variable=self.file_type_filter, value="document")
 
+        hash_menu = tk.Menu(options_menu, tearoff=0)
+        options_menu.add_cascade(label=config.get('ui.labels.hash_algorithm', "Hash Algorithm"), menu=hash_menu)
+        for name in algorithms.available():
+            hash_menu.add_radiobutton(label=name, variable=self.hash_algorithm, value=name)
+        options_menu.add_checkbutton(label=config.get('ui.labels.verify_content', "Verify Content Byte-for-Byte"),
+                                     variable=self.verify_content)
+
         # Main Layout: PanedWindow
         self._main_container = ttk.PanedWindow(self.root, orient=tk.HORIZONTAL)
         self._main_container.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -182,6 +194,10 @@ class FolderComparisonApp(IView):
         self.action_button.pack(side=tk.TOP, fill=tk.X, pady=2)
         ToolTip(self.action_button, "Run the comparison or duplicate finding process.")
 
+        self.stop_button = ttk.Button(action_frame, text="Stop", command=self.controller.cancel_jobs)
+        self.stop_button.pack(side=tk.TOP, fill=tk.X, pady=2)
+        ToolTip(self.stop_button, "Stop the running build or comparison. Finished work is kept and reused when it is run again.")
+
         # Right Panel (Results)
         right_panel = ttk.Frame(self._main_container)
         self._main_container.add(right_panel, weight=3)
@@ -200,6 +216,10 @@ class FolderComparisonApp(IView):
         # Shortcuts
         self.root.bind('<Control-r>', lambda e: self.controller.run_action())
 
+    @property
+    def results_view(self):
+        return self._results_view
+
     def _on_folders_changed(self):
         """Handle folder list changes."""
         self.update_action_button_text()
@@ -310,7 +330,7 @@ class FolderComparisonApp(IView):
         base_path = full_path.parent
         relative_path = full_path.name
 
-        file_operations.move_file(self.controller, str(base_path), relative_path, dest_path, self.results_tree, iid, self.update_status)
+        file_operations.move_file(self.controller, str(base_path), relative_path, dest_path, self._results_view, iid, self.update_status)
         if preview_window: preview_window.destroy()
 
     def _delete_file(self, iid=None, full_path_str=None, preview_window=None):
@@ -322,7 +342,7 @@ class FolderComparisonApp(IView):
         base_path = full_path.parent
         relative_path = full_path.name
 
-        file_operations.delete_file(self.controller, str(base_path), relative_path, self.results_tree, iid, self.update_status)
+        file_operations.delete_file(self.controller, str(base_path), relative_path, self._results_view, iid, self.update_status)
         if preview_window: preview_window.destroy()
 
     def _delete_file_from_preview(self, iid, full_path_str, preview_window):
@@ -1,39 +1,94 @@
 """Results view component."""
 import tkinter as tk
 from tkinter import ttk
+from pathlib import Path
+import logging
+import time
+import database
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROW_HEIGHT = 20
+FILTER_DELAY_MS = 300
+# Minimum delay between refreshes while results are still being added
+REFRESH_INTERVAL_MS = 1000
+
+# Sort choices shown in the toolbar, mapped to database.RESULT_SORT_ORDERS keys
+SORT_OPTIONS = {
+    "Group order": 'group',
+    "Largest files": 'size',
+    "Most files": 'count',
+    "Name": 'name',
+}
 
 
 class ResultsView(ttk.Frame):
-    """Component for displaying comparison results in a TreeView."""
-    
+    """
+    Component for displaying comparison results in a TreeView.
+
+    The view is virtual: results live in the project database's results table,
+    and only the rows in the visible window exist as Treeview items. Scrolling
+    fetches the next page, and sorting and filtering are done in SQL, so memory
+    use and redraw time do not depend on the number of results.
+    """
+
     def __init__(self, parent, on_double_click=None, on_right_click=None):
         super().__init__(parent)
         self._on_double_click = on_double_click
         self._on_right_click = on_right_click
+        self._project_path = None
+        self._conn = None
+        self._message = None
+        self._total_rows = 0
+        self._offset = 0
+        self._visible_rows = 30
+        self._filter_job = None
+        self._refresh_job = None
+        self._refresh_cost_ms = 0
         self._create_widgets()
-    
+
     def _create_widgets(self):
-        """Create TreeView and scrollbars."""
+        """Create the toolbar, TreeView and scrollbar."""
+        toolbar = ttk.Frame(self)
+        toolbar.pack(side=tk.TOP, fill=tk.X, pady=(0, 2))
+        ttk.Label(toolbar, text="Filter:").pack(side=tk.LEFT)
+        self._filter_entry = ttk.Entry(toolbar, width=30)
+        self._filter_entry.pack(side=tk.LEFT, padx=(2, 10))
+        self._filter_entry.bind("<KeyRelease>", self._on_filter_changed)
+        ttk.Label(toolbar, text="Sort:").pack(side=tk.LEFT)
+        self._sort_box = ttk.Combobox(toolbar, values=list(SORT_OPTIONS), state='readonly', width=14)
+        self._sort_box.current(0)
+        self._sort_box.pack(side=tk.LEFT, padx=2)
+        self._sort_box.bind("<<ComboboxSelected>>", lambda e: self.refresh(reset_offset=True))
+
         self._tree = ttk.Treeview(self, columns=("path", "size", "modified"), show="tree headings")
         self._tree.heading("#0", text="Folder/File")
         self._tree.heading("path", text="Full Path")
         self._tree.heading("size", text="Size")
         self._tree.heading("modified", text="Modified Date")
-        
+
         self._tree.column("#0", width=250)
         self._tree.column("path", width=400)
         self._tree.column("size", width=100)
         self._tree.column("modified", width=150)
-        
+
         self._tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
-        scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._tree.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self._tree.config(yscrollcommand=scrollbar.set)
-        
+
+        self._scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self._scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self._tree.bind("<Configure>", self._on_resize)
+        self._tree.bind("<MouseWheel>", lambda e: self.scroll_by(-3 if e.delta > 0 else 3))
+        self._tree.bind("<Button-4>", lambda e: self.scroll_by(-3))
+        self._tree.bind("<Button-5>", lambda e: self.scroll_by(3))
+        self._tree.bind("<Up>", lambda e: self._on_arrow(-1))
+        self._tree.bind("<Down>", lambda e: self._on_arrow(1))
+        self._tree.bind("<Prior>", lambda e: self.scroll_by(-self._visible_rows))
+        self._tree.bind("<Next>", lambda e: self.scroll_by(self._visible_rows))
+
         if self._on_double_click:
             self._tree.bind("<Double-1>", lambda e: self._on_double_click(self._tree.identify_row(e.y)))
-        
+
         if self._on_right_click:
             self._tree.bind("<Button-3>", self._on_right_click)
             # For MacOS compatibility
@@ -45,29 +100,191 @@ class ResultsView(ttk.Frame):
         """Expose tree for direct manipulation if needed (temporary)."""
         return self._tree
 
+    @property
+    def total_rows(self):
+        return self._total_rows
+
+    def load(self, project_path):
+        """Shows the results stored in a project database; call refresh() once results exist."""
+        if self._refresh_job is not None:
+            self.after_cancel(self._refresh_job)
+            self._refresh_job = None
+        self._close_connection()
+        self._project_path = project_path
+        self._message = None
+        self._total_rows = 0
+        self._offset = 0
+        self._render()
+
     def clear(self):
         """Clear all items from the tree."""
-        for item in self._tree.get_children():
-            self._tree.delete(item)
-    
+        self.load(None)
+
+    def show_message(self, text):
+        """Replaces the results with a single informational row."""
+        self._message = text
+        self._render()
+
+    def refresh(self, reset_offset=False):
+        """Re-reads the stored results with the current sort and filter."""
+        if not self._project_path:
+            return
+        if self._conn is None:
+            self._conn = database.get_db_connection(self._project_path)
+        if self._refresh_job is not None:
+            self.after_cancel(self._refresh_job)
+            self._refresh_job = None
+        started = time.monotonic()
+        sort_key = SORT_OPTIONS.get(self._sort_box.get(), 'group')
+        self._total_rows = database.build_result_order(self._conn, sort_key, self._filter_entry.get().strip())
+        self._refresh_cost_ms = int((time.monotonic() - started) * 1000)
+        if reset_offset:
+            self._offset = 0
+        self._message = None
+        self.scroll_to(self._offset, force=True)
+
+    def refresh_later(self):
+        """
+        Schedules a refresh for results that are still streaming in. Refreshes
+        are spaced out by at least REFRESH_INTERVAL_MS, or five times the cost
+        of the last one, so that the UI stays responsive on large result sets.
+        """
+        if self._refresh_job is not None:
+            return
+        if not self._total_rows:
+            self.refresh()
+            return
+        delay = max(REFRESH_INTERVAL_MS, 5 * self._refresh_cost_ms)
+        self._refresh_job = self.after(delay, self._run_scheduled_refresh)
+
+    def _run_scheduled_refresh(self):
+        self._refresh_job = None
+        self.refresh()
+
+    def delete(self, iid):
+        """Removes a file row from the results, e.g. after the file was moved or deleted."""
+        if self._conn is not None and iid.startswith('r'):
+            database.delete_result(self._conn, int(iid[1:]))
+            self.refresh()
+
+    def scroll_to(self, offset, force=False):
+        offset = max(0, min(offset, self._total_rows - self._visible_rows))
+        if offset != self._offset or force:
+            self._offset = offset
+            self._render()
+
+    def scroll_by(self, rows):
+        self.scroll_to(self._offset + rows)
+        return "break"
+
+    def _on_scrollbar(self, *args):
+        if args[0] == 'moveto':
+            self.scroll_to(int(float(args[1]) * self._total_rows))
+        elif args[0] == 'scroll':
+            step = self._visible_rows if args[2] == 'pages' else 1
+            self.scroll_by(int(args[1]) * step)
+
+    def _on_arrow(self, direction):
+        """Moves the selection, scrolling the window when it reaches an edge."""
+        items = self._tree.get_children()
+        selection = self._tree.selection()
+        if not items or not selection:
+            return None
+        index = items.index(selection[0]) + direction
+        if 0 <= index < len(items):
+            return None
+        before = self._offset
+        self.scroll_by(direction)
+        if self._offset != before:
+            items = self._tree.get_children()
+            target = items[-1] if direction > 0 else items[0]
+            self._tree.selection_set(target)
+            self._tree.focus(target)
+        return "break"
+
+    def _on_resize(self, event):
+        row_height = ttk.Style().lookup('Treeview', 'rowheight')
+        try:
+            row_height = int(row_height)
+        except (TypeError, ValueError):
+            row_height = DEFAULT_ROW_HEIGHT
+        # One row is taken up by the headings
+        visible_rows = max(1, event.height // row_height - 1)
+        if visible_rows != self._visible_rows:
+            self._visible_rows = visible_rows
+            self.scroll_to(self._offset, force=True)
+
+    def _on_filter_changed(self, *args):
+        if self._filter_job is not None:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(FILTER_DELAY_MS, self._apply_filter)
+
+    def _apply_filter(self):
+        self._filter_job = None
+        self.refresh(reset_offset=True)
+
+    def _render(self):
+        selection = set(self._tree.selection())
+        children = self._tree.get_children()
+        if children:
+            self._tree.delete(*children)
+
+        if self._message is not None:
+            self._tree.insert('', tk.END, values=(self._message, "", ""), tags=('info_row',))
+            self._scrollbar.set(0, 1)
+            return
+
+        rows = []
+        if self._conn is not None and self._total_rows:
+            rows = database.get_result_window(self._conn, self._offset, self._visible_rows)
+        for row in rows:
+            if row[0] == 'group':
+                _, group_id, file_count = row
+                iid = f"g{group_id}"
+                self._tree.insert('', tk.END, iid=iid, values=(f"Duplicate Set {group_id} ({file_count} files)", "", "", ""),
+                                  open=True, tags=('header_row',))
+            else:
+                _, result_id, name, path, size, full_path = row
+                iid = f"r{result_id}"
+                display_path = str(Path(path, name)) if path else name
+                self._tree.insert('', tk.END, iid=iid, values=(f"  {name}", size, full_path, display_path), tags=('file_row',))
+            if iid in selection:
+                self._tree.selection_add(iid)
+
+        if self._total_rows:
+            first = self._offset / self._total_rows
+            last = min(1.0, (self._offset + self._visible_rows) / self._total_rows)
+            self._scrollbar.set(first, last)
+        else:
+            self._scrollbar.set(0, 1)
+
+    def _close_connection(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def destroy(self):
+        self._close_connection()
+        super().destroy()
+
     def display(self, results):
         """Display results (this logic will be refined as results structure is standardized)."""
-        # For now, it might be easier to let the controller/coordinator 
+        # For now, it might be easier to let the controller/coordinator
         # call tree methods directly or pass a more structured data.
         pass
-    
+
     def insert_group(self, text, values=None):
         """Insert a group header."""
         return self._tree.insert("", tk.END, text=text, values=values, open=True)
-    
+
     def insert_item(self, parent, text, values=None, tags=None):
         """Insert a file item."""
         return self._tree.insert(parent, tk.END, text=text, values=values, tags=tags)
-    
+
     def get_selection(self):
         """Get selected items."""
         return self._tree.selection()
-    
+
     def get_item(self, item_id):
         """Get item details."""
         return self._tree.item(item_id)
@@ -72,13 +72,7 @@ class SettingsPanel(ttk.Frame):
             label_text = f"{meta.threshold_label or 'Threshold'}:"
             ttk.Label(threshold_frame, text=label_text).pack(side=tk.LEFT)
             
-            threshold_key = f"{meta.option_key}_threshold"
-            # Special case for legacy keys if needed, e.g., histogram_threshold
-            if meta.option_key == 'compare_histogram':
-                threshold_key = 'histogram_threshold'
-            elif meta.option_key == 'compare_llm':
-                threshold_key = 'llm_similarity_threshold'
-                
+            threshold_key = ComparisonOptions.threshold_key(meta.option_key)
             default_threshold = self._app_options.options.get(threshold_key, meta.default_threshold or 0.8)
             
             if threshold_key not in self._variables:
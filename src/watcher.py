@@ -0,0 +1,403 @@
+"""
+Filesystem watcher that journals changes to source folders.
+
+While a folder is watched, every create/modify/delete/move below it is written
+to the project's `fs_journal` table. Once a full scan has completed after the
+watch was set up, `logic.build_folder_structure_db` only applies the journaled
+changes instead of walking the whole tree again. Before it does, the watch
+catches up: inotify events already queued in the kernel are dispatched, the
+polling backend diffs a fresh snapshot, and the queued events are written to
+the journal, so changes made just before a sync are never missed.
+
+On Linux the watcher uses inotify through ctypes; elsewhere, or when inotify
+cannot be used (e.g. the watch limit is exhausted), it falls back to
+periodically diffing directory snapshots.
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+import database
+from config import config
+from scanner import DirectoryWalker, is_project_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 30.0
+JOURNAL_FLUSH_INTERVAL = 0.5
+CATCH_UP_TIMEOUT = 5.0
+
+# inotify constants from <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+              IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class WatchOverflow(Exception):
+    """Raised by a backend when events may have been lost."""
+
+
+class InotifyBackend:
+    """Recursive inotify watch over a folder."""
+
+    def __init__(self, root_path, include_subfolders, emit):
+        self.root_path = root_path
+        self.include_subfolders = include_subfolders
+        self.emit = emit
+        self._fd = None
+        self._watches = {}
+        self._libc = None
+        # Counts the times `run` found the kernel queue empty
+        self._drained = 0
+        self._drained_cond = threading.Condition()
+
+    def start(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._fd = fd
+        try:
+            self._add_tree('')
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, relative_dir):
+        directory = os.path.join(self.root_path, relative_dir) if relative_dir else self.root_path
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch failed for {directory}: {os.strerror(errno)}", directory)
+        self._watches[wd] = relative_dir
+
+    def _add_tree(self, relative_dir):
+        pending = [relative_dir]
+        while pending:
+            current = pending.pop()
+            try:
+                self._add_watch(current)
+            except FileNotFoundError:
+                # Removed again before the watch could be added; its deletion is journaled.
+                continue
+            if not self.include_subfolders:
+                continue
+            directory = os.path.join(self.root_path, current) if current else self.root_path
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(f"{current}/{entry.name}" if current else entry.name)
+            except OSError as e:
+                logger.warning(f"Cannot watch directory {directory}: {e}")
+
+    def run(self, stop_event):
+        while not stop_event.is_set():
+            ready, _, _ = select.select([self._fd], [], [], 0.5)
+            if not ready:
+                with self._drained_cond:
+                    self._drained += 1
+                    self._drained_cond.notify_all()
+                continue
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            self._dispatch(data)
+
+    def catch_up(self, timeout):
+        """
+        Waits until `run` has dispatched every event queued before this call,
+        i.e. until it next finds the kernel queue empty. Returns False on timeout.
+        """
+        with self._drained_cond:
+            target = self._drained + 1
+            return self._drained_cond.wait_for(lambda: self._drained >= target, timeout)
+
+    def _dispatch(self, data):
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                raise WatchOverflow("inotify event queue overflowed")
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            relative_dir = self._watches.get(wd)
+            if relative_dir is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if relative_dir == '':
+                    raise WatchOverflow("watched folder was moved or deleted")
+                continue
+
+            is_dir = bool(mask & IN_ISDIR)
+            if is_dir and not self.include_subfolders:
+                continue
+            if mask & IN_CREATE:
+                event = 'created'
+            elif mask & IN_MOVED_TO:
+                event = 'moved_to'
+            elif mask & IN_MOVED_FROM:
+                event = 'moved_from'
+            elif mask & IN_DELETE:
+                event = 'deleted'
+            else:
+                event = 'modified'
+
+            if is_dir and event in ('created', 'moved_to'):
+                # Files created before the new watch is in place are picked up
+                # because the whole directory is rescanned on the next sync.
+                self._add_tree(f"{relative_dir}/{name}" if relative_dir else name)
+            self.emit(event, relative_dir, name, is_dir)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._watches.clear()
+
+
+class PollingBackend:
+    """Detects changes by diffing periodic snapshots of a folder."""
+
+    def __init__(self, root_path, include_subfolders, emit, interval=None):
+        self.root_path = root_path
+        self.include_subfolders = include_subfolders
+        self.emit = emit
+        self.interval = interval or float(config.get("watcher.poll_interval", DEFAULT_POLL_INTERVAL))
+        self._snapshot = {}
+        self._lock = threading.Lock()
+
+    def _take_snapshot(self):
+        walker = DirectoryWalker(self.root_path, self.include_subfolders)
+        return {(r.path, r.name): (r.size, r.modified_date) for r in walker.walk()}
+
+    def start(self):
+        self._snapshot = self._take_snapshot()
+
+    def run(self, stop_event):
+        while not stop_event.wait(self.interval):
+            self._diff()
+
+    def catch_up(self, timeout):
+        """Reports the changes since the last snapshot right away instead of at the next interval."""
+        self._diff()
+        return True
+
+    def _diff(self):
+        with self._lock:
+            snapshot = self._take_snapshot()
+            for key, value in snapshot.items():
+                previous = self._snapshot.get(key)
+                if previous is None:
+                    self.emit('created', key[0], key[1], False)
+                elif previous != value:
+                    self.emit('modified', key[0], key[1], False)
+            for key in self._snapshot.keys() - snapshot.keys():
+                self.emit('deleted', key[0], key[1], False)
+            self._snapshot = snapshot
+
+    def close(self):
+        self._snapshot = {}
+
+
+class _FolderWatch:
+    """Watch state of a single source folder."""
+
+    def __init__(self, service, folder_index, root_path, include_subfolders):
+        self.service = service
+        self.folder_index = folder_index
+        self.root_path = root_path
+        self.include_subfolders = include_subfolders
+        self.ready_at = None
+        self.synced = False
+        self.healthy = False
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.backend = None
+
+    def matches(self, root_path, include_subfolders):
+        return self.root_path == root_path and self.include_subfolders == include_subfolders
+
+    def _emit(self, event, path, name, is_dir):
+        if is_project_file(name):
+            return
+        self.service.events.put((self.folder_index, event, path, name, int(is_dir), time.time()))
+
+    def start(self):
+        backends = [PollingBackend]
+        if config.get("watcher.backend", "auto") != "polling":
+            backends.insert(0, InotifyBackend)
+        for backend_class in backends:
+            backend = backend_class(self.root_path, self.include_subfolders, self._emit)
+            try:
+                backend.start()
+            except OSError as e:
+                logger.warning(f"{backend_class.__name__} unavailable for {self.root_path}: {e}")
+                continue
+            self.backend = backend
+            break
+        else:
+            return
+
+        self.ready_at = time.time()
+        self.healthy = True
+        self._thread = threading.Thread(target=self._run, name=f"watch-{self.folder_index}", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching folder {self.folder_index} ({self.root_path}) with {type(self.backend).__name__}.")
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.backend.run(self._stop_event)
+            except WatchOverflow as e:
+                logger.warning(f"Watcher for {self.root_path} lost events ({e}); a full rescan is required.")
+                self.synced = False
+                self.ready_at = time.time()
+                if not os.path.isdir(self.root_path):
+                    break
+                continue
+            except Exception:
+                logger.error(f"Watcher for {self.root_path} failed.", exc_info=True)
+            break
+        self.healthy = False
+        self.synced = False
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self.backend:
+            self.backend.close()
+        self.healthy = False
+        self.synced = False
+
+
+class WatcherService:
+    """
+    Watches a project's source folders and journals their changes into the
+    project database from a background writer thread.
+    """
+
+    def __init__(self, project_path):
+        self.project_path = project_path
+        self.events = queue.Queue()
+        self._watches = {}
+        self._stop_event = threading.Event()
+        self._writer = threading.Thread(target=self._write_journal, name="watch-journal", daemon=True)
+        self._writer.start()
+
+    def watch(self, folders, include_subfolders):
+        """
+        Starts watching `folders` (a dict mapping folder_index to root path),
+        restarting any watch whose folder or subfolder setting changed.
+        """
+        for folder_index in list(self._watches):
+            watch = self._watches[folder_index]
+            if folder_index not in folders or not watch.matches(folders[folder_index], include_subfolders):
+                watch.stop()
+                del self._watches[folder_index]
+
+        for folder_index, root_path in folders.items():
+            if folder_index not in self._watches:
+                watch = _FolderWatch(self, folder_index, root_path, include_subfolders)
+                watch.start()
+                self._watches[folder_index] = watch
+
+    def is_live(self, folder_index, root_path, include_subfolders):
+        """True if the journal holds every change since the folder's last full scan."""
+        watch = self._watches.get(folder_index)
+        return bool(watch and watch.matches(root_path, include_subfolders) and watch.healthy and watch.synced)
+
+    def catch_up(self, folder_index, timeout=CATCH_UP_TIMEOUT):
+        """
+        Has the folder's backend report every change made before this call and
+        writes the queued events to the journal. Returns True if the journal
+        can then be trusted; otherwise the folder needs a full scan.
+        """
+        watch = self._watches.get(folder_index)
+        if watch is None or not watch.healthy or not watch.backend.catch_up(timeout):
+            return False
+        self.flush()
+        return watch.healthy and watch.synced
+
+    def mark_synced(self, conn, folder_index, root_path, include_subfolders, scan_start_time):
+        """
+        Records that a full scan started at `scan_start_time` has completed. If
+        the watch was already in place when the scan started, later syncs can
+        rely on the journal alone.
+        """
+        self.flush()
+        watch = self._watches.get(folder_index)
+        if not watch or not watch.matches(root_path, include_subfolders) or not watch.healthy:
+            return
+        if watch.ready_at is not None and watch.ready_at <= scan_start_time:
+            watch.synced = True
+        database.trim_journal(conn, folder_index, recorded_before=scan_start_time)
+
+    def flush(self):
+        """Waits until all queued events have been written to the journal."""
+        if self._writer.is_alive():
+            self.events.join()
+
+    def _write_journal(self):
+        conn = database.get_db_connection(self.project_path)
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    batch = [self.events.get(timeout=JOURNAL_FLUSH_INTERVAL)]
+                except queue.Empty:
+                    continue
+                while True:
+                    try:
+                        batch.append(self.events.get_nowait())
+                    except queue.Empty:
+                        break
+                try:
+                    database.append_journal(conn, batch)
+                except Exception:
+                    logger.error("Could not write filesystem events to the journal.", exc_info=True)
+                    for folder_index in {event[0] for event in batch}:
+                        if folder_index in self._watches:
+                            self._watches[folder_index].synced = False
+                finally:
+                    for _ in batch:
+                        self.events.task_done()
+        finally:
+            conn.close()
+
+    def stop(self):
+        for watch in self._watches.values():
+            watch.stop()
+        self._watches.clear()
+        self._stop_event.set()
+        self._writer.join(timeout=2)
@@ -1,7 +1,9 @@
 import os
 import sys
 import tkinter as tk
+from contextlib import nullcontext
 from controller import AppController
+import jobs
 from unittest.mock import MagicMock
 
 class SynchronousTaskRunner:
@@ -11,9 +13,10 @@ class SynchronousTaskRunner:
     def post_to_main_thread(self, callback, *args):
         callback(*args)
 
-    def run_task(self, task_func, on_success=None, on_error=None, on_finally=None):
+    def run_task(self, task_func, on_success=None, on_error=None, on_finally=None, job=None):
         try:
-            result = task_func()
+            with jobs.running(job) if job is not None else nullcontext():
+                result = task_func()
             if on_success:
                 on_success(result)
         except Exception as e:
@@ -23,7 +26,28 @@ class SynchronousTaskRunner:
         finally:
             if on_finally:
                 on_finally()
-                
+
+    def run_streaming_task(self, task_func, on_batch, on_success=None, on_error=None, on_finally=None, batch_size=200, job=None, **kwargs):
+        def stream_task():
+            count = 0
+            batch = []
+            for item in task_func():
+                batch.append(item)
+                count += 1
+                if len(batch) >= batch_size:
+                    on_batch(batch)
+                    batch = []
+            if batch:
+                on_batch(batch)
+            return count
+        self.run_task(stream_task, on_success, on_error, on_finally, job=job)
+
+    def cancel_jobs(self):
+        return 0
+
+    def wait(self, timeout=None, pump=False):
+        return True
+
 class HeadlessAppController(AppController):
     """A version of AppController that doesn't require a real UI."""
     def __init__(self, view=None):
@@ -54,6 +78,10 @@ class HeadlessAppController(AppController):
         self.compare_histogram.get.return_value = False
         self.histogram_method = MagicMock()
         self.histogram_method.get.return_value = "Correlation"
+        self.hash_algorithm = MagicMock()
+        self.hash_algorithm.get.return_value = "md5"
+        self.verify_content = MagicMock()
+        self.verify_content.get.return_value = False
         self.histogram_threshold = MagicMock()
         self.histogram_threshold.get.return_value = "0.9"
         self.compare_llm = MagicMock()
@@ -76,6 +104,7 @@ class HeadlessAppController(AppController):
         self.folder_structures = {}
         self.llm_engine = None
         self.llm_engine_loading = False
+        self.watcher = None
 
         self._bind_variables_to_view()
         # We don't call view.setup_ui() here as we might want to mock things first
@@ -90,3 +119,6 @@ class HeadlessAppController(AppController):
         if self.repository:
             self.repository.close()
         self.repository = None
+        if self.watcher:
+            self.watcher.stop()
+        self.watcher = None
@@ -0,0 +1,73 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import sqlite3
+import tempfile
+from unittest.mock import patch
+import numpy as np
+from PIL import Image
+
+import database
+from logic import build_folder_structure_db
+from strategies import utils
+from strategies.phash.calculator import PHashCalculator
+
+
+class TestCalculateMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        rng = np.random.default_rng(5)
+        for i in range(5):
+            Image.fromarray(rng.integers(0, 255, (40, 40, 3), dtype=np.uint8)).save(os.path.join(self.root, f"img{i}.png"))
+        self.conn = sqlite3.connect(":memory:")
+        database.create_tables(self.conn)
+        build_folder_structure_db(self.conn, 1, self.root)
+        self.statements = []
+        self.conn.set_trace_callback(self.statements.append)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def _commits(self):
+        return sum(1 for statement in self.statements if statement.strip().upper() == 'COMMIT')
+
+    def test_results_are_written_in_batches(self):
+        opts = {'compare_phash': True, 'compare_histogram': True, 'histogram_threshold': 0.9}
+        get = utils.config.get
+        with patch.object(utils.config, 'get',
+                          side_effect=lambda key, default=None: 4 if key == 'database.write_batch' else get(key, default)):
+            infos, _ = utils.calculate_metadata_db(self.conn, 1, self.root, opts)
+
+        # 10 values (a hash and a histogram per image) in batches of 4
+        self.assertEqual(self._commits(), 3)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM file_metadata WHERE phash IS NOT NULL").fetchone()[0], 5)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM histograms").fetchone()[0], 5)
+
+        # A second run reads everything back in the joined query and writes nothing
+        self.statements.clear()
+        again, _ = utils.calculate_metadata_db(self.conn, 1, self.root, opts)
+        self.assertEqual(self._commits(), 0)
+        self.assertEqual([(i['phash'], i['histogram']) for i in again], [(i['phash'], i['histogram']) for i in infos])
+
+    def test_interrupted_run_keeps_computed_values(self):
+        calculate = PHashCalculator.calculate
+        calls = []
+
+        def fail_on_third(calculator, file_node, opts):
+            calls.append(file_node)
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            return calculate(calculator, file_node, opts)
+
+        with patch.object(PHashCalculator, 'calculate', fail_on_third):
+            with self.assertRaises(KeyboardInterrupt):
+                utils.calculate_metadata_db(self.conn, 1, self.root, {'compare_phash': True})
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM file_metadata WHERE phash IS NOT NULL").fetchone()[0], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
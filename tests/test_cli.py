@@ -0,0 +1,92 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import csv
+import json
+import sqlite3
+import subprocess
+import tempfile
+from unittest.mock import MagicMock, patch
+
+import cli
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmpdir.name, "files")
+        os.makedirs(os.path.join(self.root, "sub"))
+        for name, data in (("a.txt", "same"), ("sub/b.txt", "same"), ("c.txt", "diff"), ("d.txt", "longer")):
+            with open(os.path.join(self.root, name), 'w') as f:
+                f.write(data)
+        self.project = os.path.join(self.tmpdir.name, "scan.cfp-db")
+        self.output = os.path.join(self.tmpdir.name, "out")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_jsonl_groups_are_written_and_stored(self):
+        code = cli.main([self.project, '--source', self.root, '--strategy', 'size', '--strategy', 'md5',
+                         '--output', self.output, '--progress', self.output + '.progress'])
+        self.assertEqual(code, 0)
+        with open(self.output) as f:
+            groups = [json.loads(line) for line in f]
+        self.assertEqual([sorted(file['full_path'] for file in g['files']) for g in groups],
+                         [[os.path.join(self.root, "a.txt"), os.path.join(self.root, "sub", "b.txt")]])
+        with open(self.output + '.progress') as f:
+            self.assertIn("Hashing", {json.loads(line)['stage'] for line in f})
+
+        conn = sqlite3.connect(self.project)
+        self.assertEqual(conn.execute("SELECT path FROM sources").fetchall(), [(self.root,)])
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM results").fetchone()[0], 2)
+        self.assertEqual(conn.execute("SELECT status FROM jobs").fetchall(), [('done',)])
+        conn.close()
+
+        # The source is only added once; groups are not stored with --no-store
+        code = cli.main([self.project, '--source', self.root, '--strategy', 'size', '--format', 'csv',
+                         '--no-subfolders', '--no-store', '--output', self.output])
+        self.assertEqual(code, 0)
+        with open(self.output, newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(sorted(row['name'] for row in rows), ["a.txt", "c.txt"])
+        conn = sqlite3.connect(self.project)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0], 1)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM results").fetchone()[0], 2)
+        conn.close()
+
+    def test_stored_results_are_shown_when_the_project_is_opened(self):
+        self.assertEqual(cli.main([self.project, '--source', self.root, '--strategy', 'size', '--strategy', 'md5',
+                                   '--output', self.output]), 0)
+        from project_manager import ProjectManager
+        controller = MagicMock()
+        with patch('project_manager.messagebox') as messagebox:
+            ProjectManager(controller)._load_project_db(self.project)
+        messagebox.showerror.assert_not_called()
+        controller.view.results_view.load.assert_called_once_with(self.project)
+        controller.view.results_view.refresh.assert_called_once()
+
+    def test_options(self):
+        args = cli.parse_args([self.project, '--strategy', 'histogram', '--strategy', 'md5',
+                               '--threshold', 'histogram=0.75', '--threshold', 'phash=4'])
+        options = cli.build_options(args)
+        self.assertTrue(options.compare_histogram and options.compare_content_md5)
+        self.assertFalse(options.compare_size)
+        self.assertEqual((options.histogram_threshold, options.compare_phash_threshold), (0.75, 4.0))
+        self.assertEqual(cli.main([self.project, '--source', self.root, '--threshold', 'histogram']), 2)
+
+    def test_gui_and_optional_libraries_are_not_imported(self):
+        script = (f"import sys; sys.path.insert(0, {SRC!r}); import cli; "
+                  f"code = cli.main([{self.project!r}, '--source', {self.root!r}, '--strategy', 'phash', "
+                  f"'--strategy', 'size', '--output', {self.output!r}]); "
+                  "print(code, sorted(m for m in ('tkinter', 'cv2', 'llama_cpp') if m in sys.modules))")
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True,
+                                cwd=os.path.dirname(SRC), timeout=120)
+        self.assertEqual(result.stdout.strip(), "0 []", result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
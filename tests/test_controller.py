@@ -59,6 +59,9 @@ class TestAppController(unittest.TestCase):
                 f.write("hello")
             with open(os.path.join(tmpdir, "file2.txt"), "w") as f:
                 f.write("world")
+            # Only files sharing size and date are hashed
+            for name in ("file1.txt", "file2.txt"):
+                os.utime(os.path.join(tmpdir, name), (1700000000, 1700000000))
 
             # Set up the controller
             self.controller.project_manager.current_project_path = os.path.join(tmpdir, "test.cfp-db")
@@ -6,6 +6,8 @@ import sqlite3
 from pathlib import Path
 import os
 
+import tempfile
+import database
 from database import create_tables, save_setting, load_setting, clear_folder_data, insert_file_node, get_all_files
 from models import FileNode, FolderNode
 
@@ -51,5 +53,69 @@ class TestDatabase(unittest.TestCase):
         files = get_all_files(self.conn, 1)
         self.assertEqual(len(files), 2)
 
+    def test_migrations_are_versioned(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        self.assertEqual(version, len(database.MIGRATIONS))
+        indexes = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        self.assertTrue({'idx_file_metadata_size_md5', 'idx_files_folder_last_seen', 'idx_files_ext'} <= indexes)
+
+        # Reopening an up-to-date project does not rerun anything
+        self.conn.execute("DROP INDEX idx_files_ext")
+        create_tables(self.conn)
+        indexes = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        self.assertNotIn('idx_files_ext', indexes)
+
+    def test_histogram_tables_are_replaced(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE histogram_correlation (id INTEGER PRIMARY KEY, file_id INTEGER UNIQUE, histogram_values BLOB)")
+        conn.execute("PRAGMA user_version = 3")
+        create_tables(conn)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        self.assertIn('histograms', tables)
+        self.assertNotIn('histogram_correlation', tables)
+        conn.close()
+
+    def test_connection_profile(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            conn = database.get_db_connection(os.path.join(tmpdir, "project.cfp-db"))
+            try:
+                self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+                self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)
+                self.assertEqual(conn.execute("PRAGMA temp_store").fetchone()[0], 2)
+            finally:
+                conn.close()
+
+    def _store_results(self):
+        def info(file_id, name, size):
+            return {'id': file_id, 'folder_index': 1, 'path': 'sub', 'name': name, 'size': size}
+        groups = [
+            [info(1, 'a1', 10), info(2, 'a2', 10)],
+            [info(3, 'b1', 50), info(4, 'b2', 50), info(5, 'b3', 50)],
+        ]
+        stored = list(database.store_result_groups(self.conn, iter(groups), {1: '/root'}))
+        self.assertEqual(stored, [(1, 2), (2, 3)])
+
+    def test_result_window_pages_across_groups(self):
+        self._store_results()
+        self.assertEqual(database.build_result_order(self.conn), 7)
+        window = database.get_result_window(self.conn, 2, 3)
+        self.assertEqual([row[0] for row in window], ['file', 'group', 'file'])
+        self.assertEqual(window[0][2], 'a2')
+        self.assertEqual(window[1][1:], (2, 3))
+        self.assertEqual(window[2][5], os.path.normpath('/root/sub/b1'))
+
+    def test_result_sort_and_filter(self):
+        self._store_results()
+        database.build_result_order(self.conn, 'size')
+        self.assertEqual(database.get_result_window(self.conn, 0, 1), [('group', 2, 3)])
+        self.assertEqual(database.build_result_order(self.conn, 'group', 'a2'), 3)
+        self.assertEqual(database.build_result_order(self.conn, 'group', '%'), 0)
+
+    def test_delete_result_drops_exhausted_group(self):
+        self._store_results()
+        result_id = self.conn.execute("SELECT id FROM results WHERE name = 'a1'").fetchone()[0]
+        database.delete_result(self.conn, result_id)
+        self.assertEqual(database.build_result_order(self.conn), 4)
+
 if __name__ == '__main__':
     unittest.main()
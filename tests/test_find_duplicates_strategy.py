@@ -3,6 +3,7 @@ import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
 import unittest
 import sqlite3
+from unittest.mock import patch
 
 from strategies import find_duplicates_strategy
 from strategies.strategy_registry import discover_strategies, clear_strategies
@@ -120,6 +121,16 @@ class TestFindDuplicatesStrategy(unittest.TestCase):
         group2 = next((g for g in duplicates if {d['id'] for d in g} == {6, 7}), None)
         self.assertIsNotNone(group2)
 
+    def test_run_with_multiple_criteria_uses_one_query(self):
+        opts = {'options': {'compare_size': True, 'compare_content_md5': True}}
+        with patch('database.get_files_by_ids') as mock_get_files:
+            duplicates = find_duplicates_strategy.run(self.conn, opts)
+        mock_get_files.assert_not_called()
+
+        self.assertEqual([[d['id'] for d in g] for g in duplicates], [[1, 4]])
+        self.assertEqual(duplicates[0][1]['folder_index'], 2)
+        self.assertEqual(duplicates[0][1]['md5'], 'aaa')
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,113 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import sqlite3
+import tempfile
+from unittest.mock import patch
+import numpy as np
+from PIL import Image
+
+from database import create_tables
+from logic import build_folder_structure_db
+from hashing import cache as hash_cache
+from strategies import utils
+from strategies.md5 import progressive
+
+# Larger than the two 64 KiB chunks of a partial hash, so equal files are fully hashed
+BIG = 3 * 64 * 1024
+
+
+class TestHashCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmpdir.name, "files")
+        os.makedirs(self.root)
+        self.settings = {
+            'hash_cache.enabled': True,
+            'hash_cache.path': os.path.join(self.tmpdir.name, "cache", "hash_cache.db"),
+        }
+        patcher = patch.object(hash_cache.config, 'get',
+                               side_effect=lambda key, default=None: self.settings.get(key, default))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write(self, name, data):
+        path = os.path.join(self.root, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _project(self):
+        conn = sqlite3.connect(":memory:")
+        create_tables(conn)
+        build_folder_structure_db(conn, 1, self.root)
+        self.addCleanup(conn.close)
+        return conn
+
+    def test_lru_caps(self):
+        paths = [self._write(f"f{i}.txt", b'x' * i) for i in range(1, 6)]
+        keys = [hash_cache.file_key(path) for path in paths]
+        with hash_cache.HashCache(max_entries=3) as cache:
+            for key in keys[:3]:
+                cache.put_many('md5', [(key, f"digest{key[2]}")])
+            cache.get_many('md5', [keys[0]])
+            cache.put_many('md5', [(keys[3], "digest4"), (keys[4], "digest5")])
+            self.assertEqual(cache.prune(), 2)
+            # The entry read last survives; the two oldest unread ones are dropped
+            self.assertEqual(set(cache.get_many('md5', keys)), {keys[0], keys[3], keys[4]})
+
+        with hash_cache.HashCache(max_mib=10 / (1024 * 1024)) as cache:
+            cache.prune()
+            self.assertEqual(len(cache.get_many('md5', keys)), 1)
+
+    def _hashed(self):
+        conn = self._project()
+        progressive.run(conn, {1: self.root})
+        return dict(conn.execute("SELECT f.name, fm.md5 FROM files f JOIN file_metadata fm ON f.id = fm.file_id"))
+
+    def test_second_project_reuses_digests(self):
+        for name in ("a.bin", "b.bin"):
+            self._write(name, b'x' * BIG)
+        first = self._hashed()
+
+        with patch('strategies.utils.calculate_digest', side_effect=AssertionError("file was read")):
+            second = self._hashed()
+        self.assertEqual(second, first)
+
+    def test_changed_file_is_rehashed(self):
+        path = self._write("a.bin", b'x' * BIG)
+        self._write("b.bin", b'x' * BIG)
+        self._hashed()
+
+        # Same size and ends, so the file is still fully hashed
+        self._write("a.bin", b'x' * 64 * 1024 + b'y' * 64 * 1024 + b'x' * 64 * 1024)
+        self.assertEqual(self._hashed()["a.bin"], utils.calculate_md5(path))
+
+    def test_disabled_cache_is_not_created(self):
+        self.settings['hash_cache.enabled'] = False
+        for name in ("a.bin", "b.bin"):
+            self._write(name, b'x' * BIG)
+        self._hashed()
+        self.assertFalse(os.path.exists(self.settings['hash_cache.path']))
+
+    def test_second_project_reuses_histograms(self):
+        pixels = np.random.default_rng(3).integers(0, 255, (64, 64, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(os.path.join(self.root, "a.png"))
+        opts = {'compare_histogram': True}
+        first, _ = utils.calculate_metadata_db(self._project(), 1, self.root, opts)
+
+        conn = self._project()
+        with patch('strategies.histogram.calculator.HistogramCalculator.calculate',
+                   side_effect=AssertionError("histogram was recomputed")):
+            second, _ = utils.calculate_metadata_db(conn, 1, self.root, opts)
+        self.assertEqual(second[0]['histogram'], first[0]['histogram'])
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM histograms").fetchone()[0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import hashlib
+import tempfile
+
+from hashing import reader
+from strategies import utils
+
+
+class TestHashReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.data = os.urandom(300_007)
+        self.path = os.path.join(self.tmpdir.name, "data.bin")
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_modes_match_hashlib(self):
+        for mode in reader.MODES:
+            for block_size in (4096, 65536, 1 << 20):
+                with self.subTest(mode=mode, block_size=block_size):
+                    md5 = hashlib.md5()
+                    self.assertEqual(reader.update_from_file(md5, self.path, block_size=block_size, mode=mode),
+                                     len(self.data))
+                    self.assertEqual(md5.hexdigest(), hashlib.md5(self.data).hexdigest())
+
+    def test_ranges(self):
+        expected = hashlib.md5(self.data[:1000] + self.data[-1000:]).hexdigest()
+        for mode in reader.MODES:
+            md5 = hashlib.md5()
+            reader.update_from_file(md5, self.path, ranges=[(0, 1000), (-1000, 1000)], block_size=512, mode=mode)
+            self.assertEqual(md5.hexdigest(), expected, mode)
+
+    def test_empty_file(self):
+        path = os.path.join(self.tmpdir.name, "empty.bin")
+        open(path, 'wb').close()
+        for mode in reader.MODES:
+            md5 = hashlib.md5()
+            self.assertEqual(reader.update_from_file(md5, path, mode=mode), 0)
+            self.assertEqual(md5.hexdigest(), hashlib.md5().hexdigest())
+
+    def test_partial_digest(self):
+        chunk = 65536
+        self.assertEqual(utils.calculate_partial_md5(self.path, len(self.data), chunk),
+                         hashlib.md5(self.data[:chunk] + self.data[-chunk:]).hexdigest())
+        self.assertIsNone(utils.calculate_md5(os.path.join(self.tmpdir.name, "missing.bin")))
+
+
+if __name__ == '__main__':
+    unittest.main()
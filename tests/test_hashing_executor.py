@@ -0,0 +1,62 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import tempfile
+import threading
+import time
+
+from hashing.executor import HashingExecutor
+from strategies.utils import calculate_md5
+
+
+class TestHashingExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.items = []
+        for i in range(40):
+            path = os.path.join(self.tmpdir.name, f"file{i}.txt")
+            with open(path, 'w') as f:
+                f.write(f"content {i}")
+            self.items.append((i, path))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_results_match_serial_hashing(self):
+        executor = HashingExecutor(calculate_md5, max_workers=4)
+        results = dict(executor.imap(iter(self.items)))
+        self.assertEqual(results, {file_id: calculate_md5(path) for file_id, path in self.items})
+
+    def test_per_device_limit_is_respected(self):
+        lock = threading.Lock()
+        active = 0
+        peak = 0
+
+        def slow_hash(path):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.005)
+            with lock:
+                active -= 1
+            return path
+
+        executor = HashingExecutor(slow_hash, max_workers=8, per_device_limit=2)
+        results = list(executor.imap(self.items))
+
+        self.assertEqual(len(results), len(self.items))
+        self.assertLessEqual(peak, 2)
+
+    def test_failing_files_yield_none(self):
+        def broken_hash(path):
+            raise OSError("unreadable")
+
+        results = list(HashingExecutor(broken_hash, max_workers=2).imap(self.items[:3]))
+        self.assertEqual(sorted(results), [(0, None), (1, None), (2, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import sqlite3
+import numpy as np
+import cv2
+
+from strategies.histogram import engine
+from strategies.histogram.comparator import HistogramComparator
+from strategies.histogram.database import HistogramDatabase
+import database
+
+
+def pairwise_groups(histograms, method, threshold):
+    """The greedy pairwise loop the engine replaces, scored with cv2.compareHist."""
+    comparator = HistogramComparator()
+    group = list(range(len(histograms)))
+    groups = []
+    while len(group) > 1:
+        first = group.pop(0)
+        new_group = [first]
+        remaining = []
+        for other in group:
+            if histograms[first] and histograms[other] and \
+                    comparator.compare(histograms[first], histograms[other], method) >= threshold:
+                new_group.append(other)
+            else:
+                remaining.append(other)
+        group = remaining
+        if len(new_group) > 1:
+            groups.append(new_group)
+    return groups
+
+
+class TestHistogramEngine(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        bases = [rng.random(96).astype(np.float32) for _ in range(4)]
+        self.histograms = []
+        for i in range(40):
+            hist = bases[i % 4] + rng.random(96).astype(np.float32) * 0.3
+            hist = cv2.normalize(hist, hist).flatten()
+            self.histograms.append(hist.astype(np.float32).tobytes())
+        # Files without a histogram never join a group
+        self.histograms[5] = None
+        self.histograms[17] = b''
+
+    def test_scores_match_compare_hist(self):
+        matrix, present = engine.stack_histograms(self.histograms)
+        self.assertFalse(present[5])
+        self.assertFalse(present[17])
+        comparator = HistogramComparator()
+        rows = np.array([0, 1, 2])
+        columns = np.arange(20, 30)
+        for method in engine.METHODS:
+            scores = engine._Scorer(matrix, method).scores(rows, columns, tile_rows=2, tile_columns=3)
+            for r, i in enumerate(rows):
+                for c, j in enumerate(columns):
+                    expected = comparator.compare(self.histograms[i], self.histograms[j], method)
+                    self.assertAlmostEqual(scores[r, c], expected, places=4, msg=method)
+
+    def test_tiles_stay_within_budget(self):
+        budget = 64 * 1024 * 1024
+        matrix = np.zeros((4, 768), dtype=np.float32)
+        for method in engine.METHODS:
+            tile_rows, tile_columns = engine._Scorer(matrix, method).tile_shape(20000, budget)
+            with self.subTest(method=method):
+                self.assertLessEqual(tile_columns * 768 * 8, budget)
+                self.assertLessEqual(tile_rows * 768 * 8, budget)
+                if method == 'Intersection':
+                    self.assertLessEqual(tile_rows * tile_columns * 768 * 8, budget)
+
+    def test_grouping_matches_pairwise_loop(self):
+        thresholds = {'Correlation': 0.9, 'Intersection': 0.9, 'Chi-Square': 0.5, 'Bhattacharyya': 0.1}
+        for method, threshold in thresholds.items():
+            expected = pairwise_groups(self.histograms, method, threshold)
+            # A tiny budget forces one pivot row per block
+            for block_mib in (64, 0.0001):
+                with self.subTest(method=method, block_mib=block_mib):
+                    self.assertEqual(engine.group_similar(self.histograms, method, threshold, block_mib=block_mib),
+                                     expected)
+
+    def test_quantized_store_serves_every_method(self):
+        conn = sqlite3.connect(":memory:")
+        database.create_tables(conn)
+        store = HistogramDatabase()
+        with conn:
+            store.save_many(conn, [(i, h) for i, h in enumerate(self.histograms) if h])
+        stored = store.load_many(conn, range(len(self.histograms)))
+        self.assertEqual(len(stored[0]), len(self.histograms[0]))
+        self.assertEqual(len(conn.execute("SELECT bins FROM histograms WHERE file_id = 0").fetchone()[0]), 96 * 2)
+        conn.close()
+
+        restored = [stored.get(i) for i in range(len(self.histograms))]
+        comparator = HistogramComparator()
+        tolerances = {'Correlation': 1e-3, 'Intersection': 1e-3, 'Chi-Square': 1e-2, 'Bhattacharyya': 1e-3}
+        for method, tolerance in tolerances.items():
+            for i, j in ((0, 4), (0, 1), (2, 30)):
+                self.assertAlmostEqual(comparator.compare(restored[i], restored[j], method),
+                                       comparator.compare(self.histograms[i], self.histograms[j], method),
+                                       delta=tolerance, msg=method)
+
+    def test_small_inputs(self):
+        self.assertEqual(engine.group_similar([]), [])
+        self.assertEqual(engine.group_similar([self.histograms[0]]), [])
+        self.assertEqual(engine.group_similar([None, None]), [])
+        self.assertEqual(engine.group_similar([self.histograms[0], self.histograms[0]]), [[0, 1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+from PIL import Image, JpegImagePlugin
+
+from models import FileNode
+from strategies import image_loader
+from strategies.histogram.calculator import HistogramCalculator
+from strategies.phash.calculator import PHashCalculator
+
+
+class TestImageLoader(unittest.TestCase):
+
+    def setUp(self):
+        image_loader.clear_cache()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.jpeg = os.path.join(self.tmpdir.name, 'large.jpg')
+        Image.new('RGB', (3000, 2000), (200, 30, 30)).save(self.jpeg, quality=90)
+
+    def tearDown(self):
+        image_loader.clear_cache()
+        self.tmpdir.cleanup()
+
+    def test_jpeg_is_decoded_at_reduced_scale(self):
+        drafts = []
+        original_draft = JpegImagePlugin.JpegImageFile.draft
+
+        def record_draft(img, mode, size):
+            result = original_draft(img, mode, size)
+            drafts.append(img.size)
+            return result
+
+        with patch.object(JpegImagePlugin.JpegImageFile, 'draft', record_draft):
+            thumbnail = image_loader.load_thumbnail(self.jpeg, 300)
+        self.assertEqual(max(thumbnail.size), 300)
+        self.assertEqual(thumbnail.mode, 'RGB')
+        # libjpeg scaled 3000x2000 by 1/4 in the DCT, never decoding the full size
+        self.assertIn((750, 500), drafts)
+
+    def test_image_calculators_share_one_decode(self):
+        node = FileNode(Path(self.jpeg))
+        opts = {'compare_histogram': True, 'compare_phash': True}
+        with patch.object(image_loader, '_decode', wraps=image_loader._decode) as decode:
+            self.assertIsNotNone(HistogramCalculator().calculate(node, opts))
+            self.assertIsNotNone(PHashCalculator().calculate(node, opts))
+            self.assertEqual(decode.call_count, 1)
+
+            # A modified file is decoded again
+            Image.new('RGB', (3000, 2000), (30, 200, 30)).save(self.jpeg, quality=90)
+            os.utime(self.jpeg, ns=(0, 10 ** 9))
+            HistogramCalculator().calculate(node, opts)
+            self.assertEqual(decode.call_count, 2)
+
+    def test_encoded_thumbnail(self):
+        small = os.path.join(self.tmpdir.name, 'small.png')
+        Image.new('RGB', (64, 48)).save(small)
+        with open(small, 'rb') as f:
+            self.assertEqual(image_loader.encoded_thumbnail(small), f.read())
+
+        data = image_loader.encoded_thumbnail(self.jpeg, 200)
+        self.assertTrue(data.startswith(b'\x89PNG'))
+
+        not_an_image = os.path.join(self.tmpdir.name, 'notes.jpg')
+        with open(not_an_image, 'wb') as f:
+            f.write(b'not an image')
+        self.assertEqual(image_loader.encoded_thumbnail(not_an_image), b'not an image')
+
+
+if __name__ == '__main__':
+    unittest.main()
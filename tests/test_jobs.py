@@ -0,0 +1,125 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import tempfile
+import threading
+import time
+from unittest.mock import MagicMock, patch
+import numpy as np
+from PIL import Image
+
+import database
+import jobs
+from logic import build_folder_structure_db
+from strategies import utils
+from strategies.phash.calculator import PHashCalculator
+from threading_utils import TaskRunner
+
+
+class TestJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmpdir.name, "images")
+        os.makedirs(self.root)
+        rng = np.random.default_rng(7)
+        for i in range(5):
+            Image.fromarray(rng.integers(0, 255, (32, 32, 3), dtype=np.uint8)).save(os.path.join(self.root, f"img{i}.png"))
+        self.project = os.path.join(self.tmpdir.name, "project.cfp-db")
+        self.conn = database.get_db_connection(self.project)
+        database.create_tables(self.conn)
+        build_folder_structure_db(self.conn, 1, self.root)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def _hashed(self):
+        return self.conn.execute("SELECT COUNT(*) FROM file_metadata WHERE phash IS NOT NULL").fetchone()[0]
+
+    def test_cancelled_job_keeps_work_and_resumes(self):
+        job = jobs.Job('compare', {'folders': [self.root]}, self.project)
+        calculate = PHashCalculator.calculate
+        calls = []
+
+        def cancel_after_two(calculator, file_node, opts):
+            calls.append(file_node.name)
+            if len(calls) == 2:
+                job.cancel()
+            return calculate(calculator, file_node, opts)
+
+        with patch.object(PHashCalculator, 'calculate', cancel_after_two):
+            with self.assertRaises(jobs.JobCancelled):
+                with jobs.running(job):
+                    jobs.set_stage("Calculating metadata")
+                    utils.calculate_metadata_db(self.conn, 1, self.root, {'compare_phash': True})
+        self.assertEqual(self._hashed(), 2)
+
+        unfinished = database.get_unfinished_job(self.conn)
+        self.assertEqual((unfinished['id'], unfinished['status'], unfinished['stage']),
+                         (job.id, 'cancelled', "Calculating metadata"))
+        self.assertEqual(unfinished['params'], {'folders': [self.root]})
+
+        # Running it again only computes what is missing
+        calls.clear()
+        resumed = jobs.Job('compare', unfinished['params'], self.project)
+        with patch.object(PHashCalculator, 'calculate', cancel_after_two):
+            with jobs.running(resumed):
+                utils.calculate_metadata_db(self.conn, 1, self.root, {'compare_phash': True})
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(self._hashed(), 5)
+        self.assertIsNone(database.get_unfinished_job(self.conn))
+        statuses = dict(self.conn.execute("SELECT id, status FROM jobs"))
+        self.assertEqual(statuses, {job.id: 'superseded', resumed.id: 'done'})
+
+    def test_interrupted_job_is_reported(self):
+        job_id = database.start_job(self.conn, 'build', {'folder_index': 1, 'path': self.root})
+        self.assertEqual(database.get_unfinished_job(self.conn)['status'], 'running')
+        database.update_job(self.conn, job_id, status='dismissed')
+        self.assertIsNone(database.get_unfinished_job(self.conn))
+
+    def test_task_runner_cancels_jobs(self):
+        runner = TaskRunner(MagicMock())
+        started = threading.Event()
+        errors = []
+
+        def task():
+            started.set()
+            while True:
+                jobs.checkpoint()
+                time.sleep(0.01)
+
+        runner.run_task(task, on_error=errors.append, job=jobs.Job('build'))
+        self.assertTrue(started.wait(5))
+        self.assertEqual(runner.cancel_jobs(), 1)
+        self.assertTrue(runner.wait(timeout=5))
+        runner.process_queue()
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], jobs.JobCancelled)
+        self.assertEqual(runner.cancel_jobs(), 0)
+
+    def test_cancel_reaches_streaming_worker_waiting_for_the_ui(self):
+        runner = TaskRunner(MagicMock())
+        errors = []
+        batches = []
+
+        def task():
+            # Never checkpoints itself; the worker soon waits for a free slot
+            for i in range(1000):
+                yield i
+
+        runner.run_streaming_task(task, batches.append, on_error=errors.append, batch_size=1, max_pending=1,
+                                  job=jobs.Job('compare'))
+        time.sleep(0.2)
+        self.assertEqual(runner.cancel_jobs(), 1)
+        # Without the main thread delivering batches, the worker still reaches a checkpoint
+        self.assertTrue(runner.wait(timeout=5))
+        runner.process_queue()
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], jobs.JobCancelled)
+        self.assertLess(sum(len(batch) for batch in batches), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
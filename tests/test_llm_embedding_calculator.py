@@ -0,0 +1,88 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import sqlite3
+import tempfile
+import numpy as np
+
+import database
+from strategies import utils
+from strategies.llm.calculator import LLMEmbeddingCalculator
+
+
+class FakeEngine:
+    """Embeds an image as a vector derived from its bytes; 'broken' images fail."""
+
+    def __init__(self):
+        self.batches = []
+
+    def get_image_embeddings(self, images):
+        self.batches.append(len(images))
+        return [None if image == b'broken' else np.array([len(image), image[0], 1.0], dtype=np.float32)
+                for image in images]
+
+
+class TestLLMEmbeddingCalculator(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        self.conn = sqlite3.connect(":memory:")
+        database.create_tables(self.conn)
+        files = [('a.jpg', b'aaaa'), ('b.png', b'bb'), ('c.txt', b'text'), ('d.jpg', b'broken'), ('e.JPG', b'eeeee')]
+        with self.conn:
+            for file_id, (name, content) in enumerate(files, start=1):
+                with open(os.path.join(self.root, name), 'wb') as f:
+                    f.write(content)
+                ext = os.path.splitext(name)[1].lower()
+                self.conn.execute("INSERT INTO files (id, folder_index, path, name, ext, last_seen) VALUES (?, 0, '', ?, ?, 0)",
+                                  (file_id, name, ext))
+                self.conn.execute("INSERT INTO file_metadata (file_id, size) VALUES (?, ?)", (file_id, len(content)))
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def embeddings(self):
+        return dict(self.conn.execute("SELECT file_id, llm_embedding FROM file_metadata"))
+
+    def test_embed_files_batches_and_keeps_order(self):
+        engine = FakeEngine()
+        items = [(i, os.path.join(self.root, name)) for i, name in enumerate(['a.jpg', 'b.png', 'd.jpg', 'e.JPG'], start=1)]
+        results = list(LLMEmbeddingCalculator().embed_files(engine, items, batch_size=3))
+        self.assertEqual(engine.batches, [3, 1])
+        self.assertEqual([file_id for file_id, _ in results], [1, 2, 3, 4])
+        np.testing.assert_array_equal(np.frombuffer(results[0][1], dtype=np.float32), [4, ord('a'), 1])
+        self.assertEqual(results[2][1], b'')
+
+    def test_only_unembedded_images_are_sent_to_the_engine(self):
+        engine = FakeEngine()
+        opts = {'compare_llm': True}
+        infos, _ = utils.calculate_metadata_db(self.conn, 0, self.root, opts, llm_engine=engine)
+        self.assertEqual(sum(engine.batches), 4)
+        embeddings = self.embeddings()
+        self.assertIsNone(embeddings[3])
+        self.assertEqual(embeddings[4], b'')
+        self.assertEqual(len(embeddings[5]), 12)
+        self.assertEqual({info['id']: info['llm_embedding'] for info in infos}, embeddings)
+
+        # A second run does not recompute anything, including the failed image
+        engine.batches.clear()
+        utils.calculate_metadata_db(self.conn, 0, self.root, opts, llm_engine=engine)
+        self.assertEqual(engine.batches, [])
+
+        # Changed files lose their metadata and are embedded again
+        database.delete_metadata_for(self.conn, "?", (1,))
+        with self.conn:
+            self.conn.execute("INSERT INTO file_metadata (file_id, size) VALUES (1, 4)")
+        utils.calculate_metadata_db(self.conn, 0, self.root, opts, llm_engine=engine)
+        self.assertEqual(engine.batches, [1])
+
+    def test_no_engine_leaves_embeddings_empty(self):
+        utils.calculate_metadata_db(self.conn, 0, self.root, {'compare_llm': True})
+        self.assertTrue(all(value is None for value in self.embeddings().values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
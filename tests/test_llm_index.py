@@ -0,0 +1,121 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+from unittest.mock import patch
+import sqlite3
+import tempfile
+import numpy as np
+
+import database
+from strategies import find_duplicates_strategy
+from strategies.llm import ann_index
+
+
+def clustered_embeddings(count, dim=32, clusters=20, seed=3):
+    """Random embeddings where every vector is a slightly perturbed copy of one of `clusters` centers."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    labels = np.arange(count) % clusters
+    vectors = centers[labels] + rng.normal(scale=0.05, size=(count, dim))
+    return vectors.astype(np.float32), labels
+
+
+class TestLLMIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, 'project.cfp-db')
+        self.conn = sqlite3.connect(self.db_path)
+        database.create_tables(self.conn)
+        self.vectors, self.labels = clustered_embeddings(600)
+        with self.conn:
+            for i, vector in enumerate(self.vectors, start=1):
+                self.conn.execute("INSERT INTO files (id, folder_index, path, name, ext, last_seen) VALUES (?, 1, '', ?, '.jpg', 0)",
+                                  (i, f"img{i}.jpg"))
+                self.conn.execute("INSERT INTO file_metadata (file_id, size, modified_date, llm_embedding) VALUES (?, 100, 0, ?)",
+                                  (i, vector.tobytes()))
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def test_union_find(self):
+        sets = ann_index.UnionFind(6)
+        sets.union(4, 1)
+        sets.union(1, 3)
+        sets.union(0, 5)
+        self.assertEqual(sets.groups(), [[0, 5], [1, 3, 4]])
+
+    def test_exact_pairs_cluster_by_label(self):
+        vectors = ann_index.normalize(self.vectors)
+        groups = ann_index.cluster(len(vectors), ann_index.exact_pairs(vectors, 0.95, block_mib=0.01))
+        self.assertEqual(len(groups), 20)
+        for group in groups:
+            self.assertEqual(len(set(self.labels[group])), 1)
+
+    def test_index_finds_same_clusters_as_exact_search(self):
+        index = ann_index.EmbeddingIndex.build(self.conn, nlist=10)
+        self.assertEqual(len(index), 600)
+        self.assertEqual(index.offsets[-1], 600)
+        position = {file_id: i for i, file_id in enumerate(range(1, 601))}
+        pairs = ((np.array([position[i] for i in a]), np.array([position[i] for i in b]))
+                 for a, b in index.neighbour_pairs(0.95, nprobe=3))
+        groups = ann_index.cluster(600, pairs)
+        expected = ann_index.cluster(600, ann_index.exact_pairs(ann_index.normalize(self.vectors), 0.95))
+        self.assertEqual(groups, expected)
+
+    def test_index_is_persisted_and_rebuilt_when_stale(self):
+        path = ann_index.index_path(self.conn)
+        self.assertEqual(path, os.path.join(self.tmpdir.name, 'project.llm_index'))
+        first = ann_index.load_or_build(self.conn)
+        self.assertTrue(os.path.exists(os.path.join(path, 'meta.json')))
+
+        reloaded = ann_index.load_or_build(self.conn)
+        self.assertIsInstance(reloaded.vectors, np.memmap)
+        np.testing.assert_array_equal(reloaded.ids, first.ids)
+
+        with self.conn:
+            self.conn.execute("UPDATE file_metadata SET llm_embedding = NULL WHERE file_id = 1")
+        rebuilt = ann_index.load_or_build(self.conn)
+        self.assertEqual(len(rebuilt), 599)
+        self.assertNotIn(1, rebuilt.ids)
+
+    def test_reembedding_with_same_size_and_date_is_detected(self):
+        ann_index.load_or_build(self.conn)
+        with self.conn:
+            # Writing back an unchanged embedding keeps the index
+            self.conn.execute("UPDATE file_metadata SET llm_embedding = llm_embedding, size = 100")
+        with patch.object(ann_index.EmbeddingIndex, 'build') as build:
+            ann_index.load_or_build(self.conn)
+        build.assert_not_called()
+
+        # A new embedding of the same length, size and date (e.g. a restored mtime)
+        with self.conn:
+            self.conn.execute("UPDATE file_metadata SET llm_embedding = ? WHERE file_id = 2", (self.vectors[0].tobytes(),))
+        rebuilt = ann_index.load_or_build(self.conn)
+        position = int(np.flatnonzero(rebuilt.ids == 2)[0])
+        expected = ann_index.normalize(self.vectors[:1])[0].astype(np.float16)
+        np.testing.assert_array_equal(rebuilt.vectors[position], expected)
+
+    def test_search_is_limited_to_given_files(self):
+        index = ann_index.EmbeddingIndex.build(self.conn, nlist=10)
+        allowed = set(range(1, 101))
+        for a, b in index.neighbour_pairs(0.95, nprobe=10, file_ids=allowed):
+            self.assertTrue(set(a.tolist()) <= allowed)
+            self.assertTrue(set(b.tolist()) <= allowed)
+
+    def test_iter_groups_clusters_embeddings(self):
+        opts = {'options': {'compare_llm': True}, 'llm_similarity_threshold': 0.95}
+        for exact_limit in (4096, 10):
+            with self.subTest(exact_limit=exact_limit):
+                with patch.object(ann_index.config, 'get',
+                                side_effect=lambda key, default=None: exact_limit if key == 'llm.exact_limit' else default):
+                    groups = list(find_duplicates_strategy.iter_groups(self.conn, opts, folder_index=1))
+                self.assertEqual(len(groups), 20)
+                for group in groups:
+                    self.assertEqual(len({self.labels[info['id'] - 1] for info in group}), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,10 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..',
 import unittest
 from unittest.mock import patch, MagicMock, call, ANY
 from pathlib import Path
+import sqlite3
+import tempfile
 import logic
+import database
 from models import FileNode, FolderNode
 
 class TestLogic(unittest.TestCase):
@@ -64,32 +67,99 @@ class TestLogic(unittest.TestCase):
         self.assertEqual(len(inaccessible_paths), 0)
 
     def test_build_folder_structure_db(self):
-        """Test building a folder structure for SQLite projects."""
-        # Mock connection and cursor
-        mock_conn = MagicMock()
-        mock_cursor = MagicMock()
-        mock_conn.execute.return_value = mock_cursor
-        mock_cursor.fetchone.return_value = None
-
-        # Create a mock file system structure
-        mock_file1 = MagicMock(spec=Path)
-        mock_file1.name = "file1.txt"
-        mock_file1.suffix = ".txt"
-        mock_file1.is_file.return_value = True
-        mock_file1.stat.return_value.st_size = 100
-        mock_file1.stat.return_value.st_mtime = 12345.0
-        mock_file1.parent.relative_to.return_value.as_posix.return_value = "."
-
-        mock_root = MagicMock(spec=Path)
-        mock_root.is_dir.return_value = True
-        mock_root.rglob.return_value = [mock_file1]
-
-        with patch('logic.Path', return_value=mock_root):
-            logic.build_folder_structure_db(mock_conn, 1, "dummy_path")
-
-        # Assertions
-        self.assertIn(call('SELECT id FROM files WHERE folder_index = ? AND path = ? AND name = ?', ANY), mock_conn.execute.call_args_list)
-        self.assertIn(call('\n                    INSERT INTO files (folder_index, path, name, ext, last_seen)\n                    VALUES (?, ?, ?, ?, ?)\n                    ', ANY), mock_conn.execute.call_args_list)
+        """Test syncing a folder structure into a SQLite project."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.makedirs(os.path.join(tmpdir, "sub"))
+            for rel, content in [("file1.txt", "hello"), ("sub/file2.txt", "world"), ("gone.txt", "bye")]:
+                with open(os.path.join(tmpdir, rel), "w") as f:
+                    f.write(content)
+
+            conn = sqlite3.connect(":memory:")
+            database.create_tables(conn)
+            self.assertEqual(logic.build_folder_structure_db(conn, 1, tmpdir), [])
+            rows = conn.execute("SELECT f.path, f.name, fm.size FROM files f JOIN file_metadata fm ON f.id = fm.file_id").fetchall()
+            self.assertEqual(sorted(rows), [("", "file1.txt", 5), ("", "gone.txt", 3), ("sub", "file2.txt", 5)])
+
+            # Cache a hash for both remaining files, then change one and delete another
+            conn.execute("UPDATE file_metadata SET md5 = 'cached'")
+            conn.commit()
+            file1_id = conn.execute("SELECT id FROM files WHERE name = 'file1.txt'").fetchone()[0]
+            with open(os.path.join(tmpdir, "sub", "file2.txt"), "w") as f:
+                f.write("changed!")
+            os.remove(os.path.join(tmpdir, "gone.txt"))
+
+            logic.build_folder_structure_db(conn, 1, tmpdir)
+            rows = conn.execute("SELECT f.id, f.name, fm.size, fm.md5 FROM files f JOIN file_metadata fm ON f.id = fm.file_id").fetchall()
+            by_name = {name: (file_id, size, md5) for file_id, name, size, md5 in rows}
+            self.assertEqual(set(by_name), {"file1.txt", "file2.txt"})
+            self.assertEqual(by_name["file1.txt"], (file1_id, 5, 'cached'))
+            self.assertEqual(by_name["file2.txt"][1:], (8, None))
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM file_metadata").fetchone()[0], 2)
+            conn.close()
+
+    def test_build_folder_structure_db_skips_unchanged_directories(self):
+        """Directories with an unchanged mtime and entry count are not rescanned."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            sub = os.path.join(tmpdir, "sub")
+            os.makedirs(sub)
+            for rel in ["file1.txt", "sub/file2.txt"]:
+                with open(os.path.join(tmpdir, rel), "w") as f:
+                    f.write("hello")
+            for directory in (tmpdir, sub):
+                os.utime(directory, (1_000_000, 1_000_000))
+
+            conn = sqlite3.connect(":memory:")
+            database.create_tables(conn)
+            shortcut = patch.object(logic.config, 'get',
+                                    side_effect=lambda key, default=None: True if key == 'scan.directory_mtime_shortcut' else default)
+            shortcut.start()
+            self.addCleanup(shortcut.stop)
+            logic.build_folder_structure_db(conn, 1, tmpdir)
+            self.assertEqual(sorted(database.get_directories(conn, 1)), ["", "sub"])
+            conn.execute("UPDATE file_metadata SET md5 = 'cached'")
+            conn.commit()
+
+            # An in-place edit leaves the directory untouched, so only a full rescan notices it
+            with open(os.path.join(sub, "file2.txt"), "w") as f:
+                f.write("world")
+            os.utime(sub, (1_000_000, 1_000_000))
+            logic.build_folder_structure_db(conn, 1, tmpdir)
+            md5s = dict(conn.execute("SELECT f.name, fm.md5 FROM files f JOIN file_metadata fm ON f.id = fm.file_id"))
+            self.assertEqual(md5s, {"file1.txt": "cached", "file2.txt": "cached"})
+
+            logic.build_folder_structure_db(conn, 1, tmpdir, full_rescan=True)
+            md5s = dict(conn.execute("SELECT f.name, fm.md5 FROM files f JOIN file_metadata fm ON f.id = fm.file_id"))
+            self.assertEqual(md5s, {"file1.txt": "cached", "file2.txt": None})
+
+            # Adding a file changes the directory, which is then rescanned
+            with open(os.path.join(sub, "file3.txt"), "w") as f:
+                f.write("new")
+            logic.build_folder_structure_db(conn, 1, tmpdir)
+            names = [row[0] for row in conn.execute("SELECT name FROM files ORDER BY name")]
+            self.assertEqual(names, ["file1.txt", "file2.txt", "file3.txt"])
+            conn.close()
+
+    def test_build_folder_structure_db_rescans_in_place_edits_by_default(self):
+        """Without the directory shortcut, a file edited in place loses its stale digest."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "file1.txt")
+            with open(path, "w") as f:
+                f.write("hello")
+            os.utime(tmpdir, (1_000_000, 1_000_000))
+
+            conn = sqlite3.connect(":memory:")
+            database.create_tables(conn)
+            logic.build_folder_structure_db(conn, 1, tmpdir)
+            conn.execute("UPDATE file_metadata SET md5 = 'cached'")
+            conn.commit()
+
+            with open(path, "w") as f:
+                f.write("world")
+            os.utime(path, (2_000_000, 2_000_000))
+            os.utime(tmpdir, (1_000_000, 1_000_000))
+            logic.build_folder_structure_db(conn, 1, tmpdir)
+            self.assertIsNone(conn.execute("SELECT md5 FROM file_metadata").fetchone()[0])
+            conn.close()
 
 if __name__ == '__main__':
     unittest.main()
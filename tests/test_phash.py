@@ -0,0 +1,106 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+from unittest.mock import patch
+import random
+import sqlite3
+import numpy as np
+import tempfile
+from pathlib import Path
+from PIL import Image
+
+import database
+from models import FileNode
+from strategies import find_duplicates_strategy
+from strategies.phash import hamming_index
+from strategies.phash.calculator import PHashCalculator, to_signed, to_unsigned
+from strategies.phash.comparator import hamming_distance
+
+IMAGE = os.path.join(os.path.dirname(__file__), 'imgs', '1623.jpg')
+
+
+class TestPHash(unittest.TestCase):
+
+    def test_resized_copy_has_a_near_hash(self):
+        calculator = PHashCalculator()
+        opts = {'compare_phash': True}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            copy_path = os.path.join(tmpdir, 'small.png')
+            other_path = os.path.join(tmpdir, 'other.png')
+            with Image.open(IMAGE) as img:
+                img.convert('RGB').resize((img.width // 3, img.height // 3)).save(copy_path)
+                img.convert('RGB').rotate(90, expand=True).save(other_path)
+            original = calculator.calculate(FileNode(Path(IMAGE)), opts)
+            copy = calculator.calculate(FileNode(Path(copy_path)), opts)
+            other = calculator.calculate(FileNode(Path(other_path)), opts)
+        self.assertLessEqual(hamming_distance(original, copy), 4)
+        self.assertGreater(hamming_distance(original, other), 16)
+        self.assertIsNone(calculator.calculate(FileNode(Path(IMAGE)), {}))
+
+    def test_non_images_are_skipped(self):
+        calculator = PHashCalculator()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'notes.txt')
+            with open(path, 'w') as f:
+                f.write("not an image")
+            with patch('strategies.image_loader.load_resized') as load_resized:
+                self.assertIsNone(calculator.calculate(FileNode(Path(path)), {'compare_phash': True}))
+        load_resized.assert_not_called()
+
+    def test_signed_storage_round_trip(self):
+        value = 0xFEDCBA9876543210
+        self.assertLess(to_signed(value), 0)
+        self.assertEqual(to_unsigned(to_signed(value)), value)
+        self.assertEqual(hamming_distance(to_signed(value), value ^ 0b101), 2)
+
+    def test_near_pairs_match_linear_scan(self):
+        rng = random.Random(5)
+        values = [rng.getrandbits(64) for _ in range(300)]
+        # Near copies of the first 50 hashes
+        values += [v ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for v in values[:50]]
+        array = np.array(values, dtype=np.uint64)
+        for max_distance in (0, 3, 9, 20):
+            expected = {(i, j) for i in range(len(values)) for j in range(i + 1, len(values))
+                        if (values[i] ^ values[j]).bit_count() <= max_distance}
+            found = set()
+            for rows, cols in hamming_index.near_pairs(array, max_distance):
+                found.update(zip(rows.tolist(), cols.tolist()))
+            self.assertEqual(found, expected, max_distance)
+
+    def test_candidate_slices(self):
+        values = np.array([0, 1, 3, 7, 0b111 << 61], dtype=np.uint64)
+        with patch.object(hamming_index, 'MAX_CANDIDATES', 2):
+            found = {pair for rows, cols in hamming_index.near_pairs(values, 1) for pair in zip(rows.tolist(), cols.tolist())}
+        self.assertEqual(found, {(0, 1), (1, 2), (2, 3)})
+
+    def test_similar_groups(self):
+        hashes = [0b1111, None, 0b1110, 1 << 40, 0b1111, (1 << 40) | 0b11, 0b111 << 20]
+        self.assertEqual(hamming_index.similar_groups(hashes, 0), [[0, 4]])
+        self.assertEqual(hamming_index.similar_groups(hashes, 2), [[0, 2, 4], [3, 5]])
+        # Transitive: 0b1111 -> 0b1110 -> ... -> 0 within 1 bit per step
+        self.assertEqual(hamming_index.similar_groups([0b11, 0b01, 0b00], 1), [[0, 1, 2]])
+
+    def test_iter_groups_refines_by_phash(self):
+        conn = sqlite3.connect(":memory:")
+        database.create_tables(conn)
+        hashes = [to_signed(0xFFFF000000000000), to_signed(0xFFFF000000000001), 0x00FF, None, 0x00FE]
+        with conn:
+            for file_id, value in enumerate(hashes, start=1):
+                conn.execute("INSERT INTO files (id, folder_index, path, name, ext, last_seen) VALUES (?, 0, '', ?, '.jpg', 0)",
+                             (file_id, f"{file_id}.jpg"))
+                conn.execute("INSERT INTO file_metadata (file_id, size, phash) VALUES (?, ?, ?)",
+                             (file_id, 100 if file_id < 3 else 200, value))
+        opts = {'options': {'compare_phash': True}, 'compare_phash_threshold': 1}
+        groups = list(find_duplicates_strategy.iter_groups(conn, opts, folder_index=0))
+        self.assertEqual([[info['id'] for info in group] for group in groups], [[1, 2], [3, 5]])
+
+        # Combined with size, the hash refines each size group
+        opts = {'options': {'compare_size': True, 'compare_phash': True}, 'compare_phash_threshold': 1}
+        groups = list(find_duplicates_strategy.iter_groups(conn, opts, folder_index=0))
+        self.assertEqual([[info['id'] for info in group] for group in groups], [[1, 2], [3, 5]])
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import shutil
+import sqlite3
+import tempfile
+from unittest.mock import patch
+import numpy as np
+from PIL import Image
+
+import database
+from database import create_tables
+from logic import build_folder_structure_db
+from strategies import planner, find_duplicates_strategy
+from strategies.histogram.calculator import HistogramCalculator
+
+
+class TestPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folders = {}
+        self.conn = sqlite3.connect(":memory:")
+        create_tables(self.conn)
+        self.rng = np.random.default_rng(11)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def _folder(self, folder_index):
+        root = os.path.join(self.tmpdir.name, f"folder{folder_index}")
+        os.makedirs(root, exist_ok=True)
+        self.folders[folder_index] = root
+        return root
+
+    def _image(self, path, side, pixels=None):
+        if pixels is None:
+            pixels = self.rng.integers(0, 255, (side, side, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(path)
+        return pixels
+
+    def _run(self, **options):
+        for folder_index, root in self.folders.items():
+            build_folder_structure_db(self.conn, folder_index, root)
+        opts = dict(options)
+        opts['options'] = dict(options)
+        calls = []
+        calculate = HistogramCalculator.calculate
+
+        def record(calculator, file_node, opts):
+            calls.append(file_node.name)
+            return calculate(calculator, file_node, opts)
+
+        with patch.object(HistogramCalculator, 'calculate', record):
+            infos = planner.calculate_metadata(self.conn, self.folders, opts)
+        groups = find_duplicates_strategy.run(self.conn, opts, folder_index=list(self.folders), file_infos=infos)
+        return calls, [sorted(info['name'] for info in group) for group in groups]
+
+    def test_histograms_only_for_colliding_sizes(self):
+        root = self._folder(1)
+        self._image(os.path.join(root, "a.png"), 32)
+        shutil.copy(os.path.join(root, "a.png"), os.path.join(root, "b.png"))
+        for i, side in enumerate((20, 24, 28)):
+            self._image(os.path.join(root, f"unique{i}.png"), side)
+
+        calls, groups = self._run(compare_size=True, compare_histogram=True, histogram_threshold=0.9)
+        self.assertEqual(sorted(calls), ["a.png", "b.png"])
+        self.assertEqual(groups, [["a.png", "b.png"]])
+
+    def test_digests_only_for_matching_names(self):
+        first, second = self._folder(1), self._folder(2)
+        for root in (first, second):
+            with open(os.path.join(root, "same.txt"), 'w') as f:
+                f.write("same content")
+        with open(os.path.join(first, "other.txt"), 'w') as f:
+            f.write("same content")
+
+        calls, groups = self._run(compare_name=True, compare_content_md5=True)
+        hashed = dict(self.conn.execute("SELECT f.name, COUNT(fm.md5) FROM files f JOIN file_metadata fm ON f.id = fm.file_id GROUP BY f.name"))
+        self.assertEqual(hashed, {"same.txt": 2, "other.txt": 0})
+        self.assertEqual(groups, [["same.txt", "same.txt"]])
+
+    def test_histograms_only_for_phash_neighbours(self):
+        root = self._folder(1)
+        pixels = self._image(os.path.join(root, "a.png"), 64)
+        self._image(os.path.join(root, "b.png"), 64, np.clip(pixels.astype(int) + 3, 0, 255).astype(np.uint8))
+        for i in range(3):
+            self._image(os.path.join(root, f"other{i}.png"), 64)
+
+        calls, groups = self._run(compare_phash=True, compare_histogram=True, histogram_threshold=0.5)
+        self.assertEqual(sorted(calls), ["a.png", "b.png"])
+        self.assertEqual(groups, [["a.png", "b.png"]])
+
+    def test_content_hashes_are_invalidated_once(self):
+        for folder_index in (1, 2):
+            with open(os.path.join(self._folder(folder_index), "same.txt"), 'w') as f:
+                f.write("same content")
+        with patch('database.invalidate_content_hashes', wraps=database.invalidate_content_hashes) as invalidate:
+            self._run(compare_content_md5=True, compare_histogram=True, histogram_threshold=0.9)
+        self.assertEqual(invalidate.call_count, 1)
+
+    def test_exact_groups(self):
+        infos = [{'id': 1, 'size': 5, 'name': 'a'}, {'id': 2, 'size': 5, 'name': 'b'},
+                 {'id': 3, 'size': 5, 'name': 'a'}, {'id': 4, 'size': None, 'name': 'a'}]
+        self.assertEqual([[i['id'] for i in g] for g in planner.exact_groups(infos, ['fm.size'])], [[1, 2, 3]])
+        self.assertEqual([[i['id'] for i in g] for g in planner.exact_groups(infos, ['f.name', 'fm.size'])], [[1, 3]])
+        self.assertEqual(planner.exact_groups(infos, []), [infos])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import io
+import json
+import sqlite3
+import tempfile
+
+import jobs
+import progress
+from database import create_tables
+from logic import build_folder_structure_db
+from strategies.md5 import progressive
+
+
+class TestProgress(unittest.TestCase):
+
+    def test_events_are_throttled(self):
+        events = []
+        with progress.Tracker("Hashing", files_total=100, bytes_total=1000, listener=events.append, interval=60) as tracker:
+            for _ in range(40):
+                tracker.advance(1, 10)
+        # The first advance and the end of the stage
+        self.assertEqual([(e.files_done, e.finished) for e in events], [(1, False), (40, True)])
+        last = events[-1]
+        self.assertEqual(last.percent, 40.0)
+        self.assertGreater(last.mb_per_s, 0)
+        self.assertAlmostEqual(last.eta, last.elapsed * 1.5, places=6)
+        self.assertTrue(last.describe().startswith("Hashing: 40/100 files, "))
+
+    def test_no_listener_outside_a_job(self):
+        tracker = progress.track("Scanning")
+        tracker.advance(3, 30)
+        self.assertIsNone(tracker.listener)
+        self.assertEqual((tracker.files_done, tracker.bytes_done), (3, 30))
+
+    def test_hashing_stages_report_to_the_job(self):
+        with tempfile.TemporaryDirectory() as root:
+            for name, data in (("a.bin", b'x' * 5000), ("b.bin", b'x' * 5000), ("c.bin", b'y' * 5000), ("d.bin", b'z')):
+                with open(os.path.join(root, name), 'wb') as f:
+                    f.write(data)
+            conn = sqlite3.connect(":memory:")
+            create_tables(conn)
+            stream = io.StringIO()
+            events = []
+
+            def listener(event):
+                events.append(event)
+                progress.jsonl_listener(stream)(event)
+
+            with jobs.running(jobs.Job('compare', on_progress=listener)):
+                build_folder_structure_db(conn, 1, root)
+                progressive.run(conn, {1: root})
+            conn.close()
+
+        finals = {e.stage: e for e in events if e.finished}
+        self.assertEqual(set(finals), {"Scanning " + os.path.basename(root), "Partial hashing", "Hashing"})
+        self.assertEqual((finals["Partial hashing"].files_done, finals["Partial hashing"].bytes_total), (3, 15000))
+        self.assertEqual(finals["Hashing"].files_total, 0)
+        self.assertEqual(finals["Scanning " + os.path.basename(root)].bytes_done, 15001)
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(len(lines), len(events))
+        self.assertEqual(lines[-1]['percent'], 100.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
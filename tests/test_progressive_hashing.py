@@ -0,0 +1,91 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import sqlite3
+import tempfile
+import hashlib
+from unittest.mock import patch
+
+from database import create_tables
+from logic import build_folder_structure_db
+from strategies import find_duplicates_strategy
+from strategies.md5 import progressive
+from hashing import algorithms as hash_algorithms
+
+
+class TestProgressiveHashing(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        chunk = 64 * 1024
+        big = b'a' * chunk + b'b' * chunk + b'c' * chunk
+        self._write("unique.bin", b'x' * 10)
+        self._write("small1.txt", b'hello')
+        self._write("small2.txt", b'world')
+        self._write("big1.bin", big)
+        self._write("big2.bin", big)
+        # Same size, first and last chunk as the big files, different middle.
+        self._write("big3.bin", b'a' * chunk + b'z' * chunk + b'c' * chunk)
+
+        self.conn = sqlite3.connect(":memory:")
+        create_tables(self.conn)
+        build_folder_structure_db(self.conn, 1, self.root)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def _write(self, name, data):
+        with open(os.path.join(self.root, name), 'wb') as f:
+            f.write(data)
+
+    def _md5s(self):
+        rows = self.conn.execute(
+            "SELECT f.name, fm.md5 FROM files f JOIN file_metadata fm ON f.id = fm.file_id"
+        ).fetchall()
+        return dict(rows)
+
+    def test_unique_sizes_are_never_read(self):
+        with patch('strategies.utils.calculate_digest', wraps=progressive.utils.calculate_digest) as mock_md5:
+            progressive.run(self.conn, {1: self.root})
+
+        hashed = {os.path.basename(call.args[0]) for call in mock_md5.call_args_list}
+        self.assertNotIn("unique.bin", hashed)
+        self.assertIsNone(self._md5s()["unique.bin"])
+
+    def test_groups_match_full_hashing(self):
+        progressive.run(self.conn, {1: self.root})
+        md5s = self._md5s()
+        self.assertEqual(md5s["small1.txt"], '5d41402abc4b2a76b9719d911017c592')
+        self.assertEqual(md5s["big1.bin"], md5s["big2.bin"])
+        self.assertNotEqual(md5s["big1.bin"], md5s["big3.bin"])
+
+        duplicates = find_duplicates_strategy.run(self.conn, {'options': {'compare_content_md5': True}}, folder_index=[1])
+        self.assertEqual(len(duplicates), 1)
+        self.assertEqual({d['name'] for d in duplicates[0]}, {"big1.bin", "big2.bin"})
+
+    def test_changing_algorithm_rehashes(self):
+        progressive.run(self.conn, {1: self.root})
+        progressive.run(self.conn, {1: self.root}, algorithm='sha256')
+        md5s = self._md5s()
+        self.assertEqual(md5s["small1.txt"], hashlib.sha256(b'hello').hexdigest())
+        self.assertEqual(md5s["big1.bin"], md5s["big2.bin"])
+        self.assertEqual(len(md5s["big1.bin"]), 64)
+        algorithms = {row[0] for row in self.conn.execute(
+            "SELECT hash_algorithm FROM file_metadata WHERE md5 IS NOT NULL OR partial_md5 IS NOT NULL")}
+        self.assertEqual(algorithms, {'sha256'})
+
+        # Going back discards the SHA-256 digests, so both kinds never mix
+        progressive.run(self.conn, {1: self.root}, algorithm='md5')
+        self.assertEqual(self._md5s()["small1.txt"], '5d41402abc4b2a76b9719d911017c592')
+
+    def test_unavailable_algorithm_falls_back(self):
+        with patch.dict(hash_algorithms._available, {'xxh3_128': False}):
+            progressive.run(self.conn, {1: self.root}, algorithm='xxh3_128')
+        self.assertEqual(self._md5s()["small1.txt"], '5d41402abc4b2a76b9719d911017c592')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import tempfile
+from pathlib import Path
+
+from scanner import DirectoryWalker, file_suffix
+
+
+class TestDirectoryWalker(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        for rel in ["a.JPG", "b.txt", "sub/c.tar.gz", "sub/deeper/d", "other/e.png"]:
+            path = os.path.join(self.root, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(rel)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_walk_matches_rglob(self):
+        for workers in (1, 4):
+            walker = DirectoryWalker(self.root, max_workers=workers)
+            records = sorted(walker.walk())
+            expected = []
+            for item in Path(self.root).rglob('*'):
+                if item.is_file():
+                    rel = item.parent.relative_to(self.root).as_posix()
+                    rel = '' if rel == '.' else rel
+                    stat = item.stat()
+                    expected.append((rel, item.name, item.suffix.lower(), stat.st_size, stat.st_mtime))
+            self.assertEqual([tuple(r) for r in records], sorted(expected))
+            self.assertEqual(walker.inaccessible_paths, [])
+
+    def test_walk_without_subfolders(self):
+        walker = DirectoryWalker(self.root, include_subfolders=False)
+        self.assertEqual(sorted(r.name for r in walker.walk()), ["a.JPG", "b.txt"])
+
+    def test_missing_directory_is_reported(self):
+        walker = DirectoryWalker(os.path.join(self.root, "missing"))
+        self.assertEqual(list(walker.walk()), [])
+        self.assertEqual(len(walker.inaccessible_paths), 1)
+
+    def test_unchanged_directories_are_not_stated(self):
+        sub = os.path.join(self.root, "sub")
+        os.utime(sub, (1_000_000, 1_000_000))
+        first = DirectoryWalker(self.root)
+        list(first.walk())
+        known = {path: (mtime, count) for path, mtime, count in first.directories}
+        self.assertEqual(known["sub"], (1_000_000, 2))
+
+        walker = DirectoryWalker(self.root, known_directories=known)
+        names = sorted(r.name for r in walker.walk())
+        self.assertEqual(walker.unchanged_directories, ["sub"])
+        self.assertNotIn("c.tar.gz", names)
+        # Subdirectories of an unchanged directory are still visited
+        self.assertIn("d", names)
+
+    def test_file_suffix(self):
+        for name in ["a.JPG", "archive.tar.gz", ".bashrc", "noext", "trailing."]:
+            self.assertEqual(file_suffix(name), Path(name).suffix.lower(), name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import time
+from unittest.mock import MagicMock
+
+from threading_utils import TaskRunner
+
+
+class TestStreamingTask(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = TaskRunner(MagicMock())
+
+    def _pump(self, until, timeout=5):
+        deadline = time.time() + timeout
+        while not until() and time.time() < deadline:
+            self.runner.process_queue()
+            time.sleep(0.01)
+
+    def test_items_are_forwarded_in_bounded_batches(self):
+        batches = []
+        done = []
+        produced = []
+
+        def task():
+            for i in range(1000):
+                produced.append(i)
+                yield i
+
+        self.runner.run_streaming_task(task, batches.append, on_success=done.append,
+                                       batch_size=100, max_pending=2)
+
+        # Without the main thread consuming, the worker stops after filling the pending slots
+        time.sleep(0.2)
+        self.assertLessEqual(self.runner.task_queue.qsize(), 2)
+        self.assertLess(len(produced), 1000)
+
+        self._pump(lambda: done)
+        self.assertEqual(done, [1000])
+        self.assertTrue(all(len(batch) <= 100 for batch in batches))
+        self.assertEqual([i for batch in batches for i in batch], list(range(1000)))
+
+    def test_partial_batch_is_flushed_after_interval(self):
+        batches = []
+        done = []
+
+        def task():
+            yield 'first'
+            # A slow refinement must not hold back the group already found
+            time.sleep(1)
+            yield 'second'
+            yield 'third'
+
+        self.runner.run_streaming_task(task, batches.append, on_success=done.append,
+                                       batch_size=100, flush_interval=0.05)
+        self._pump(lambda: batches, timeout=0.5)
+        self.assertEqual(batches, [['first']])
+        self._pump(lambda: done)
+        self.assertEqual(batches, [['first'], ['second', 'third']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import sqlite3
+import tempfile
+
+from database import create_tables
+from logic import build_folder_structure_db
+from hashing import verify
+from strategies import find_duplicates_strategy
+from strategies.md5 import progressive
+
+CHUNK = 4096
+
+
+class TestVerify(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        same = os.urandom(CHUNK * 3 + 10)
+        self._write("a.bin", same)
+        self._write("b.bin", same)
+        self._write("c.bin", same)
+        self._write("late.bin", same[:-1] + bytes([same[-1] ^ 1]))
+        self._write("early.bin", bytes([same[0] ^ 1]) + same[1:])
+        self._write("short.bin", same[:-1])
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _write(self, name, data):
+        with open(os.path.join(self.root, name), 'wb') as f:
+            f.write(data)
+
+    def _group(self, *names):
+        return [{'id': i, 'folder_index': 1, 'path': '', 'name': name} for i, name in enumerate(names)]
+
+    def _verify(self, groups, **kwargs):
+        return [[info['name'] for info in group]
+                for group in verify.verify_groups(groups, {1: self.root}, chunk_size=CHUNK, **kwargs)]
+
+    def test_only_identical_files_stay_grouped(self):
+        groups = [self._group("a.bin", "late.bin", "b.bin", "early.bin", "short.bin", "missing.bin", "c.bin")]
+        self.assertEqual(self._verify(groups), [["a.bin", "b.bin", "c.bin"]])
+        self.assertEqual(self._verify([self._group("a.bin", "early.bin")]), [])
+
+    def test_windows_are_merged(self):
+        groups = [self._group("a.bin", "late.bin", "b.bin", "early.bin", "c.bin")]
+        self.assertEqual(self._verify(groups, max_open=2), [["a.bin", "b.bin", "c.bin"]])
+
+    def test_each_byte_is_read_once(self):
+        verifier = verify.GroupVerifier(chunk_size=CHUNK)
+        paths = [os.path.join(self.root, name) for name in ("a.bin", "b.bin", "c.bin", "early.bin")]
+        with verify.ThreadPoolExecutor(max_workers=2) as pool:
+            self.assertEqual(verifier.identical_classes(paths, pool), [[0, 1, 2]])
+        # early.bin is dropped after its first chunk
+        self.assertEqual(verifier.bytes_read, 3 * os.path.getsize(paths[0]) + CHUNK)
+
+    def test_hash_collision_is_split(self):
+        conn = sqlite3.connect(":memory:")
+        create_tables(conn)
+        build_folder_structure_db(conn, 1, self.root)
+        progressive.run(conn, {1: self.root})
+        # Pretend late.bin collides with the a/b/c digest
+        conn.execute("""
+            UPDATE file_metadata SET md5 = (SELECT md5 FROM file_metadata fm JOIN files f ON f.id = fm.file_id WHERE f.name = 'a.bin')
+            WHERE file_id = (SELECT id FROM files WHERE name = 'late.bin')
+        """)
+        opts = {'options': {'compare_size': True, 'compare_content_md5': True}}
+        groups = list(find_duplicates_strategy.iter_groups(conn, opts, folder_index=[1]))
+        self.assertEqual(sorted(info['name'] for info in groups[0]), ["a.bin", "b.bin", "c.bin", "late.bin"])
+        verified = self._verify(groups)
+        self.assertEqual([sorted(group) for group in verified], [["a.bin", "b.bin", "c.bin"]])
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
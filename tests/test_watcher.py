@@ -0,0 +1,104 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+import unittest
+import tempfile
+import time
+from unittest.mock import patch
+
+import database
+import logic
+from watcher import WatcherService, PollingBackend
+
+
+class _StopAfter:
+    """Stop event stand-in that lets a backend run a fixed number of cycles."""
+    def __init__(self, cycles):
+        self.cycles = cycles
+
+    def wait(self, timeout):
+        self.cycles -= 1
+        return self.cycles < 0
+
+
+class TestWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmpdir.name, "photos")
+        os.makedirs(os.path.join(self.root, "sub"))
+        self._write("keep.txt", "keep")
+        self._write("sub/old.txt", "old")
+        self.project_path = os.path.join(self.tmpdir.name, "project.cfp-db")
+        self.conn = database.get_db_connection(self.project_path)
+        database.create_tables(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def _write(self, rel, content):
+        with open(os.path.join(self.root, rel), "w") as f:
+            f.write(content)
+
+    def _names(self):
+        return sorted(row[0] for row in self.conn.execute("SELECT name FROM files"))
+
+    def test_polling_backend_reports_changes(self):
+        events = []
+        backend = PollingBackend(self.root, True, lambda *event: events.append(event), interval=0.01)
+        backend.start()
+        self._write("new.txt", "new")
+        os.remove(os.path.join(self.root, "sub", "old.txt"))
+        backend.run(_StopAfter(1))
+        self.assertIn(('created', '', 'new.txt', False), events)
+        self.assertIn(('deleted', 'sub', 'old.txt', False), events)
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), "inotify is only available on Linux")
+    def test_journal_replaces_full_rescan(self):
+        service = WatcherService(self.project_path)
+        try:
+            folders = {1: self.root}
+            service.watch(folders, True)
+            logic.build_folder_structure_db(self.conn, 1, self.root, watcher=service)
+            self.assertTrue(service.is_live(1, self.root, True))
+            self.assertEqual(self._names(), ["keep.txt", "old.txt"])
+
+            self._write("new.txt", "new")
+            os.remove(os.path.join(self.root, "sub", "old.txt"))
+            os.makedirs(os.path.join(self.root, "added"))
+            self._write("added/inside.txt", "inside")
+
+            # The sync catches the watch up, so changes made just before it are seen
+            with patch('logic.sync_scan_results', wraps=logic.sync_scan_results) as mock_sync:
+                logic.build_folder_structure_db(self.conn, 1, self.root, watcher=service)
+            self.assertIsNotNone(mock_sync.call_args.kwargs.get('scope'))
+            self.assertEqual(self._names(), ["inside.txt", "keep.txt", "new.txt"])
+            self.assertEqual(database.get_journal(self.conn, 1), [])
+        finally:
+            service.stop()
+
+    def test_polling_watch_catches_up_before_sync(self):
+        settings = {'watcher.backend': 'polling', 'watcher.poll_interval': 3600}
+        patcher = patch('watcher.config.get', side_effect=lambda key, default=None: settings.get(key, default))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        service = WatcherService(self.project_path)
+        try:
+            service.watch({1: self.root}, True)
+            self.assertIsInstance(service._watches[1].backend, PollingBackend)
+            logic.build_folder_structure_db(self.conn, 1, self.root, watcher=service)
+            self.assertTrue(service.is_live(1, self.root, True))
+
+            # Long before the next poll
+            self._write("new.txt", "new")
+            with patch('logic.sync_scan_results', wraps=logic.sync_scan_results) as mock_sync:
+                logic.build_folder_structure_db(self.conn, 1, self.root, watcher=service)
+            self.assertIsNotNone(mock_sync.call_args.kwargs.get('scope'))
+            self.assertEqual(self._names(), ["keep.txt", "new.txt", "old.txt"])
+        finally:
+            service.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()